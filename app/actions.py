@@ -24,8 +24,6 @@ except NameError:
 
 import bisect
 import curses.ascii
-import difflib
-import binascii
 import io
 import os
 import re
@@ -35,14 +33,24 @@ import traceback
 import warnings
 
 import app.bookmark
+import app.bracket_index
+import app.buffer_file
 import app.config
 import app.curses_util
+import app.grep
 import app.history
+import app.hex_view
+import app.large_file
 import app.log
+import app.match_index
 import app.mutator
 import app.parser
+import app.replace_all
 import app.selectable
 
+# A `path:row:column` link at the start of a row (e.g. a grep result).
+kRePathRowColumn = re.compile(u"([^:\\s]+:\\d+:\\d+)(?::|$)")
+
 
 class Actions(app.mutator.Mutator):
     """This base class to TextBuffer handles the text manipulation (without
@@ -58,6 +66,10 @@ class Actions(app.mutator.Mutator):
         self.fileHistory = {}
         self.lastChecksum = None
         self.lastFileSize = 0
+        # The ReplaceAll in progress (or None), see findReplace().
+        self.replaceAll = None
+        # The ProjectGrep writing to this buffer (or None), see grep().
+        self.projectGrep = None
         self.fileFilter(u'')
 
     def getMatchingBracketRowCol(self):
@@ -67,6 +79,9 @@ class Actions(app.mutator.Mutator):
         Args:
           None.
 
+        The parser's bracket index is used where it can tell (see
+        app.bracket_index), otherwise the rows are searched.
+
         Returns:
           None if matching bracket isn't found.
           Position (int row, int col) of the matching bracket otherwise.
@@ -118,6 +133,18 @@ class Actions(app.mutator.Mutator):
                             line[:match.start()])
                         return row, textCol
 
+        if ch in app.bracket_index.kBrackets and not (self.isLargeFile or
+                                                      self.isBinary):
+            parser = self.parser
+            offset = parser.rowColOffset(self.penRow, self.penCol)
+            match = parser.bracketIndex.matchingBracket(
+                offset, parser.dataLength())
+            if match == app.bracket_index.kNoMatch:
+                return None
+            if match is not None:
+                return parser.offsetRowCol(match)
+            # The index can't tell (yet), search the text instead.
+
         matcher = {
             u'(': (u')', searchForward),
             u'[': (u']', searchForward),
@@ -325,12 +352,12 @@ class Actions(app.mutator.Mutator):
             if self.penRow > 0:
                 self.cursorLeft()
                 self.joinLines()
-        else:
+        elif not self.editRefused(u'b'):
             offset = self.parser.dataOffset(self.penRow, self.penCol)
             if offset is None:
-                change = (u'b', self.parser.data[-1])
+                change = (u'b', self.parser.store()[-1])
             else:
-                change = (u'b', self.parser.data[offset - 1])
+                change = (u'b', self.parser.store()[offset - 1])
             self.redoAddChange(change)
             self.redo()
 
@@ -896,32 +923,29 @@ class Actions(app.mutator.Mutator):
         inputFile = None
         self.isReadOnly = (os.path.isfile(self.fullPath) and
                            not os.access(self.fullPath, os.W_OK))
+        if self.isLargeFile or self.isBinary:
+            self.parser.close()
+            self.parser = app.parser.Parser(self.program.prefs)
+            self.isLargeFile = False
+            self.isBinary = False
         if not os.path.exists(self.fullPath):
             data = u''
             self.setMessage(u'Creating new file')
+        elif 0 < os.path.getsize(self.fullPath) >= self.program.prefs.editor[
+                u'largeFileMinBytes']:
+            self.fileLoadLarge()
+            return
         else:
             try:
                 inputFile = io.open(self.fullPath)
                 data = unicode(inputFile.read())
                 self.fileEncoding = inputFile.encoding
                 self.setMessage(u'Opened existing file')
-                self.isBinary = False
             except Exception as e:
                 #app.log.info(unicode(e))
                 try:
-                    inputFile = io.open(self.fullPath, 'rb')
-                    if 1:
-                        binary_data = inputFile.read()
-                        long_hex = binascii.hexlify(binary_data).decode('utf-8')
-                        hex_list = []
-                        i = 0
-                        width = 32
-                        while i < len(long_hex):
-                            hex_list.append(long_hex[i:i + width] + u'\n')
-                            i += width
-                        data = u''.join(hex_list)
-                    else:
-                        data = inputFile.read()
+                    self.parser = app.hex_view.HexParser(
+                        self.program.prefs, self.fullPath)
                     self.isBinary = True
                     self.fileEncoding = None
                     app.log.info(u'Opened file as a binary file')
@@ -936,11 +960,34 @@ class Actions(app.mutator.Mutator):
         app.log.info(u'fullPath', self.fullPath)
         app.log.info(u'cwd', os.getcwd())
         app.log.info(u'relativePath', self.relativePath)
-        self.fileFilter(data)
+        if self.isBinary:
+            # The hex rows are generated by the parser as they are needed.
+            self.savedAtRedoIndex = self.redoIndex
+        else:
+            self.fileFilter(data)
         if inputFile:
             inputFile.close()
         self.determineFileType()
 
+    def fileLoadLarge(self):
+        """Open the file for viewing without reading it into memory."""
+        try:
+            self.parser = app.large_file.LargeFileParser(
+                self.program.prefs, self.fullPath)
+        except Exception as e:
+            app.log.exception(e)
+            self.setMessage(u'error opening file', self.fullPath)
+            return
+        self.isLargeFile = True
+        self.isReadOnly = True
+        self.isBinary = False
+        self.fileEncoding = None
+        self.fileStat = os.stat(self.fullPath)
+        self.relativePath = os.path.relpath(self.fullPath, os.getcwd())
+        self.savedAtRedoIndex = self.redoIndex
+        self.setMessage(u'Opened large file (read only)')
+        self.determineFileType()
+
     def _determineRootGrammar(self, name, extension):
         if extension == u"" and self.parser.rowCount() > 0:
             line = self.parser.rowText(0)
@@ -962,6 +1009,8 @@ class Actions(app.mutator.Mutator):
     def determineFileType(self):
         self.rootGrammar = self._determineRootGrammar(
             *os.path.splitext(self.fullPath))
+        self.loadParseCache()
+        self.startParallelParse()
         self.parseGrammars()
 
         # Restore all user history.
@@ -983,8 +1032,18 @@ class Actions(app.mutator.Mutator):
           None.
         """
         # Restore the file history.
-        self.fileHistory = self.program.history.getFileHistory(
-            self.fullPath, self.parser.data)
+        if self.isLargeFile:
+            # The history is keyed by a checksum of the whole file, which would
+            # take too long to compute.
+            self.fileHistory = {}
+        elif self.isBinary:
+            # The checksum is computed from the file rather than the hex text.
+            self.fileHistory = self.program.history.getFileHistory(
+                self.fullPath)
+        else:
+            # The checksum may have been found for the parse cache.
+            self.fileHistory = self.program.history.getFileHistory(
+                self.fullPath, self.parser.data, self.parseCacheChecksum)
 
         # Restore all positions and values of variables.
         self.penRow, self.penCol = self.fileHistory.setdefault(u'pen', (0, 0))
@@ -1017,8 +1076,12 @@ class Actions(app.mutator.Mutator):
         self.bookmarks = self.fileHistory.setdefault(u'bookmarks', [])
 
         # Store the file's info.
-        self.lastChecksum, self.lastFileSize = app.history.getFileInfo(
-            self.fullPath)
+        if self.isLargeFile:
+            self.lastChecksum = None
+            self.lastFileSize = self.fileStat.st_size
+        else:
+            self.lastChecksum, self.lastFileSize = app.history.getFileInfo(
+                self.fullPath)
 
     def updateBasicScrollPosition(self):
         """Sets scrollRow, scrollCol to the closest values that the view's
@@ -1119,6 +1182,9 @@ class Actions(app.mutator.Mutator):
         self.redo()
 
     def fileWrite(self):
+        if self.isLargeFile:
+            self.setMessage(u'Large files are read only')
+            return
         # Preload the message with an error that should be overwritten.
         self.setMessage(u'Error saving file')
         self.isReadOnly = not os.access(self.fullPath, os.W_OK)
@@ -1138,15 +1204,14 @@ class Actions(app.mutator.Mutator):
                 self.fileHistory[u'selectionMode'] = self.selectionMode
                 self.fileHistory[u'bookmarks'] = self.bookmarks
                 if self.isBinary:
-                    removeWhitespace = {
-                        ord(u' '): None,
-                        ord(u'\n'): None,
-                        ord(u'\r'): None,
-                        ord(u'\t'): None,
-                    }
-                    outputData = binascii.unhexlify(
-                        self.parser.data.translate(removeWhitespace))
-                    outputFile = io.open(self.fullPath, u'wb+')
+                    # Bytes are edited in place, so only the modified pages
+                    # are written.
+                    with io.open(self.fullPath, u'r+b') as outputFile:
+                        for offset, page in self.parser.modifiedPages():
+                            outputFile.seek(offset)
+                            outputFile.write(page)
+                    self.parser.markSaved()
+                    outputFile = None
                 elif self.fileEncoding is None:
                     outputData = self.parser.data
                     outputFile = io.open(
@@ -1155,10 +1220,11 @@ class Actions(app.mutator.Mutator):
                     outputData = self.parser.data
                     outputFile = io.open(
                         self.fullPath, 'w+', encoding=self.fileEncoding)
-                outputFile.seek(0)
-                outputFile.truncate()
-                outputFile.write(outputData)
-                outputFile.close()
+                if outputFile is not None:
+                    outputFile.seek(0)
+                    outputFile.truncate()
+                    outputFile.write(outputData)
+                    outputFile.close()
                 # Save user data that applies to writable files.
                 self.savedAtRedoIndex = self.redoIndex
                 if self.program.prefs.editor[u'saveUndo']:
@@ -1211,6 +1277,23 @@ class Actions(app.mutator.Mutator):
         if not inView:
             self.scrollToOptimalScrollPosition()
 
+    def selectRange(self, beginRow, beginCol, endRow, endCol, mode):
+        """Select from the begin to the end, leaving the pen at the begin. The
+        range may span rows."""
+        if app.config.strict_debug:
+            assert isinstance(beginRow, int)
+            assert isinstance(beginCol, int)
+            assert isinstance(endRow, int)
+            assert isinstance(endCol, int)
+            assert isinstance(mode, int)
+        inView = self.isInView(beginRow, beginCol, endRow, endCol)
+        self.doSelectionMode(app.selectable.kSelectionNone)
+        self.cursorMove(endRow - self.penRow, endCol - self.penCol)
+        self.doSelectionMode(mode)
+        self.cursorMove(beginRow - self.penRow, beginCol - self.penCol)
+        if not inView:
+            self.scrollToOptimalScrollPosition()
+
     def find(self, searchFor, direction=0):
         """direction is -1 for findPrior, 0 for at pen, 1 for findNext."""
         if app.config.strict_debug:
@@ -1222,9 +1305,9 @@ class Actions(app.mutator.Mutator):
             self.doSelectionMode(app.selectable.kSelectionNone)
             return
         editorPrefs = self.program.prefs.editor
-        flags = 0
+        # The document is searched as a whole, so ^ and $ match at each row.
+        flags = re.MULTILINE
         flags |= (editorPrefs.get(u'findIgnoreCase') and re.IGNORECASE or 0)
-        flags |= (editorPrefs.get(u'findMultiLine') and re.MULTILINE or 0)
         flags |= (editorPrefs.get(u'findLocale') and re.LOCALE or 0)
         flags |= (editorPrefs.get(u'findDotAll') and re.DOTALL or 0)
         flags |= (editorPrefs.get(u'findVerbose') and re.VERBOSE or 0)
@@ -1262,7 +1345,7 @@ class Actions(app.mutator.Mutator):
 
     def findPlainText(self, text):
         searchFor = re.escape(text)
-        self.findRe = re.compile(u'()^' + searchFor)
+        self.findRe = re.compile(u'()^' + searchFor, re.MULTILINE)
         self.findCurrentPattern(0)
 
     def findReplaceFlags(self, tokens):
@@ -1292,7 +1375,8 @@ class Actions(app.mutator.Mutator):
         return flags
 
     def findReplace(self, cmd):
-        """Replace (substitute) text using regex in entire document.
+        """Replace (substitute) text using regex within the selection (or the
+        entire document if nothing is selected).
 
         In a command such as `substitute/a/b/flags`, the `substitute` should
         already be removed. The remaining |cmd| of `/a/b/flags` implies a
@@ -1311,41 +1395,165 @@ class Actions(app.mutator.Mutator):
                             u' separators')
             return
         _, find, replace, flags = splitCmd
-        data = self.findReplaceText(find, replace, flags, self.parser.data)
-        self.applyDocumentUpdate(data)
-
-    def findReplaceText(self, find, replace, flags, text):
-        flags = self.findReplaceFlags(flags)
-        return re.sub(find, replace, text, flags=flags)
-
-    def applyDocumentUpdate(self, data):
-        lines = self.doDataToLines(self.parser.data)
-        diff = difflib.ndiff(lines, self.doDataToLines(data))
-        ndiff = []
-        counter = 0
-        for i in diff:
-            if i[0] != u' ':
-                if counter:
-                    ndiff.append(counter)
-                    counter = 0
-                if i[0] in [u'+', u'-']:
-                    ndiff.append(i)
-            else:
-                counter += 1
-        if counter:
-            ndiff.append(counter)
-        if len(ndiff) == 1 and type(ndiff[0]) is type(0):
-            # Nothing was changed. The only entry is a 'skip these lines'
-            self.setMessage(u'No matches found')
+        if self.editRefused(u'sr'):
             return
-        ndiff = tuple(ndiff)
-        if 0:
-            for i in ndiff:
-                app.log.info(i)
-        self.redoAddChange((u'ld', ndiff))
+        try:
+            regex = re.compile(find, self.findReplaceFlags(flags))
+        except re.error as e:
+            self.setMessage(u'Invalid pattern: ' + unicode(e))
+            return
+        begin = 0
+        end = None
+        if self.selectionMode != app.selectable.kSelectionNone:
+            if self.selectionMode == app.selectable.kSelectionBlock:
+                self.setMessage(u'Replace within a block selection is not'
+                                u' supported')
+                return
+            upperRow, upperCol, lowerRow, lowerCol = self.startAndEnd()
+            begin = self.parser.rowColOffset(upperRow, upperCol)
+            end = self.parser.rowColOffset(lowerRow, lowerCol)
+        self.replaceAll = app.replace_all.ReplaceAll(regex, replace,
+                                                     self.parser.data, begin,
+                                                     end)
+        if self.program.prefs.editor['useBgThread']:
+            # Search in time slices (see app.background.Scheduler).
+            self.program.scheduler.addAndRun(u'replaceAll',
+                                             self.replaceAllSlice,
+                                             self.program.bg)
+        else:
+            self.replaceAllSlice()
+
+    def grep(self, regex, root):
+        """Search the files under |root| for |regex|, writing the results to
+        this buffer (see app.grep)."""
+        program = self.program
+        self.projectGrep = app.grep.ProjectGrep(
+            regex, root, self, program.getParseExecutor(),
+            2 * program.parseProcessCount())
+        if program.prefs.editor['useBgThread']:
+            # Write results as they are found (see app.background.Scheduler).
+            program.scheduler.addAndRun(u'grep', self.grepSlice, program.bg)
+        else:
+            self.grepSlice()
+
+    def grepSlice(self):
+        """Continue the search begun by grep().
+
+        Returns:
+          Whether it is finished, or app.background.kTaskWaiting (see
+          app.background.Scheduler).
+        """
+        job = self.projectGrep
+        if job is None:
+            return True
+        finished = job.step(self.program.bg)
+        message = u'{:,} matches in {:,} files'.format(job.matchCount,
+                                                       job.fileCount)
+        if finished is not True:
+            self.setMessage(u'Searching... ' + message)
+            return finished
+        self.projectGrep = None
+        self.setMessage(u'Found ' + message)
+        return True
+
+    def replaceAllSlice(self):
+        """Continue the replace all begun by findReplace().
+
+        Returns:
+          Whether it is finished (see app.background.Scheduler).
+        """
+        job = self.replaceAll
+        if job is None:
+            return True
+        if not self.parser.store().isText(job.data):
+            # The substitutions found are for the prior data.
+            self.replaceAll = None
+            self.setMessage(u'Replace stopped, the document was changed')
+            return True
+        if not job.step(self.program.bg):
+            self.setMessage(u'Replacing... %d%%' % (job.progress() * 100,))
+            return False
+        self.replaceAll = None
+        if not len(job.offsets):
+            self.setMessage(u'No matches found')
+            return True
+        # Move the pen to the start of the document, which remains valid as
+        # the text changes.
+        self.doSelectionMode(app.selectable.kSelectionNone)
+        self.cursorMove(-self.penRow, -self.penCol)
+        self.redoAddChange(job.change())
         self.redo()
+        self.cursorMoveTo(*self.parser.offsetRowCol(job.offsets[0]))
+        self.compoundChangePush()
+        self.setMessage(u'Replaced %d matches' % (len(job.offsets),))
+        return True
 
     def findCurrentPattern(self, direction):
+        if self.isLargeFile or self.isBinary:
+            # These parsers don't hold the data as a whole, search by row.
+            self.findCurrentPatternByRow(direction)
+            return
+        if self.findRe is None:
+            app.log.info(u'findRe is None')
+            return
+        parser = self.parser
+        offset = parser.rowColOffset(self.penRow, self.penCol)
+        if direction > 0:
+            offset += 1
+        index = self.findMatchIndex()
+        index.refresh(parser.store())
+        if index.isComplete(parser.dataLength()):
+            if direction < 0:
+                found = index.priorMatch(offset)
+            else:
+                found = index.nextMatch(offset)
+        else:
+            found = parser.find(self.findRe, offset, direction)
+        if found is None:
+            app.log.info(u'find not found')
+            self.doSelectionMode(app.selectable.kSelectionNone)
+            return
+        begin, end, wrapped = found
+        if wrapped:
+            self.setMessage(u'Find wrapped around.')
+        beginRow, beginCol = parser.offsetRowCol(begin)
+        endRow, endCol = parser.offsetRowCol(end)
+        self.selectRange(beginRow, beginCol, endRow, endCol,
+                         app.selectable.kSelectionCharacter)
+
+    def findMatchIndex(self):
+        """Get the MatchIndex of |findRe| within this document; or None if
+        there is no find pattern (or the document is a large or hex file).
+        """
+        if self.findRe is None or self.isLargeFile or self.isBinary:
+            return None
+        index = self.parser.matchIndex
+        if index is None or index.regex is not self.findRe:
+            index = app.match_index.MatchIndex(self.findRe)
+            self.parser.matchIndex = index
+        return index
+
+    def findMatchCountText(self):
+        """Describe the matches of the find pattern, e.g. u"3 of 12"."""
+        index = self.findMatchIndex()
+        if index is None:
+            return u""
+        parser = self.parser
+        index.refresh(parser.store())
+        total = u"{:,}".format(index.count())
+        if not index.isComplete(parser.dataLength()):
+            total += u"+"
+        number = None
+        if self.selectionMode == app.selectable.kSelectionCharacter:
+            upperRow, upperCol, lowerRow, lowerCol = self.startAndEnd()
+            number = index.matchNumber(
+                parser.rowColOffset(upperRow, upperCol),
+                parser.rowColOffset(lowerRow, lowerCol))
+        if number is None:
+            return u"%s found" % (total,)
+        return u"{:,} of {}".format(number, total)
+
+    def findCurrentPatternByRow(self, direction):
         localRe = self.findRe
         offset = self.penCol + direction
         if direction < 0:
@@ -1467,11 +1675,55 @@ class Actions(app.mutator.Mutator):
     def insert(self, text):
         if app.config.strict_debug:
             assert isinstance(text, unicode)
+        if self.isBinary:
+            self.insertBinary(text)
+            return
         self.performDelete()
         self.redoAddChange((u'i', text))
         self.redo()
         self.updateBasicScrollPosition()
 
+    def insertBinary(self, text):
+        """Overwrite bytes of a binary file (see app.hex_view) with |text|,
+        which is hex digits in the hex column or characters in the ASCII
+        column."""
+        for ch in text:
+            found = self.parser.byteAtRowCol(self.penRow, self.penCol)
+            if found is None:
+                self.setMessage(u'Move the cursor to a byte to edit it')
+                return
+            offset, nibble = found
+            old = self.parser.byteRange(offset, offset + 1)
+            value = bytearray(old)[0]
+            if nibble is None:
+                if not (u' ' <= ch <= u'~'):
+                    self.setMessage(u'Only ASCII characters can be typed here')
+                    return
+                value = ord(ch)
+                offset += 1
+            else:
+                try:
+                    digit = int(ch, 16)
+                except ValueError:
+                    self.setMessage(u'Type hex digits to edit a binary file')
+                    return
+                if nibble == 0:
+                    value = (digit << 4) | (value & 0x0f)
+                else:
+                    value = (value & 0xf0) | digit
+                    offset += 1
+                nibble = 1 - nibble
+            if offset < self.parser.byteCount():
+                row, col = self.parser.byteRowCol(offset, nibble)
+            else:
+                row, col = self.penRow, self.penCol + 1
+            new = bytes(bytearray([value]))
+            self.redoAddChange(
+                (u'x', (found[0], old, new),
+                 self.getCursorMove(row - self.penRow, col - self.penCol)))
+            self.redo()
+        self.updateBasicScrollPosition()
+
     def insertPrintable(self, ch, meta):
         #app.log.info(ch, meta)
         if ch is app.curses_util.BRACKETED_PASTE:
@@ -1670,13 +1922,27 @@ class Actions(app.mutator.Mutator):
         Opens the file under cursor.
         """
 
-        def openFile(path):
+        def openFile(path, row=None, col=None):
             textBuffer = self.view.program.bufferManager.loadTextBuffer(path)
+            if textBuffer is None:
+                self.setMessage(u"Unable to open {}".format(path))
+                return
+            if row is not None:
+                textBuffer.penRow = max(0, row)
+            if col is not None:
+                textBuffer.penCol = max(0, col)
+                textBuffer.goalCol = textBuffer.penCol
             inputWindow = self.view.controller.currentInputWindow()
             inputWindow.setTextBuffer(textBuffer)
-            self.changeTo(inputWindow)
-            self.setMessage('Opened file {}'.format(path))
-
+            textBuffer.setMessage(u"Opened file {}".format(path))
+
+        match = kRePathRowColumn.match(self.parser.rowText(self.penRow))
+        if match is not None:
+            # E.g. a result of the grep command.
+            path, row, col = app.buffer_file.pathRowColumn(
+                match.group(1), self.program.prefs.editor[u"baseDirEnv"])
+            if os.access(path, os.R_OK):
+                return openFile(path, row, col)
         text, linkType = self.parser.grammarTextAt(self.penRow, self.penCol)
         if linkType is None:
             self.setMessage(u"Text is not a recognized file.")
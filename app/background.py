@@ -17,12 +17,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import fcntl
 import os
 try:
     import Queue as queue
 except ImportError:
     import queue
-import signal
 import sys
 import threading
 import time
@@ -31,86 +31,302 @@ import traceback
 import app.profile
 import app.render
 
+# Background tasks run in slices of about this many seconds, so that user input
+# is handled promptly.
+kSliceSeconds = 0.005
+# While background tasks run, a frame is drawn about this often (e.g. to show
+# their progress).
+kTaskFrameSeconds = 0.1
+# Task priorities, lower values run first.
+kParsePriority = 10
+kDefaultPriority = 20
+# Returned by a task that can't continue until something else is done (e.g. a
+# result from another process). It isn't called again until it is woken, see
+# BackgroundThread.wake().
+kTaskWaiting = u'waiting'
+
+
+def setNonBlocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
 
 class BackgroundThread(threading.Thread):
 
     def __init__(self, *args, **keywords):
         threading.Thread.__init__(self, *args, **keywords)
         self.toBackground = None
-        self.fromBackground = None
+        # The latest message from the background thread (a frame or an
+        # exception), or None. Only the most recent frame will be shown, so a
+        # newer frame replaces one that hasn't been taken yet.
+        self._mailbox = None
+        self._mailboxLock = threading.Lock()
+        # Incremented for each message sent, see send().
+        self.generation = 0
+        # The number of frames replaced before being taken.
+        self.droppedFrames = 0
+        # A byte is written to the wake pipe each time a message is sent. The
+        # main thread waits on |wakeFd| (along with the keyboard input) rather
+        # than polling the mailbox.
+        self.wakeFd = None
+        self._wakeWriteFd = None
+        # The number of messages put on (and taken from) |toBackground|. Each
+        # count is only changed by one thread, so comparing them is a cheap
+        # check for a pending user event.
+        self._putCount = 0
+        self._takeCount = 0
+        # The end of the current time slice (see Scheduler.runSlice()), or
+        # None.
+        self.deadline = None
+
+    def openWakePipe(self):
+        self.wakeFd, self._wakeWriteFd = os.pipe()
+        setNonBlocking(self.wakeFd)
+        setNonBlocking(self._wakeWriteFd)
+
+    def close(self):
+        """Release the wake pipe (once the thread has finished)."""
+        os.close(self.wakeFd)
+        os.close(self._wakeWriteFd)
+        self.wakeFd = self._wakeWriteFd = None
+
+    def drainWakes(self):
+        """Clear the wake pipe, prior to calling get()."""
+        try:
+            while os.read(self.wakeFd, 4096):
+                pass
+        except OSError:
+            pass  # The pipe is empty.
 
     def get(self):
-        return self.fromBackground.get()
+        """Take the latest message from the background thread (or None)."""
+        with self._mailboxLock:
+            message = self._mailbox
+            self._mailbox = None
+        return message
 
     def hasMessage(self):
-        # This thread yield (time.sleep(0)) dramatically improves Python3
-        # performance. Without this line empty() will be called far too often.
-        time.sleep(0)
-        return not self.fromBackground.empty()
+        return self._mailbox is not None
 
     def hasUserEvent(self):
-        time.sleep(0)  # See note in hasMessage().
-        return not self.toBackground.empty()
+        return self._putCount != self._takeCount
+
+    def shouldYield(self):
+        """Whether long running work should pause (to be resumed later),
+        because there is a user event or the time slice has run out."""
+        if self._putCount != self._takeCount:
+            return True
+        return self.deadline is not None and time.time() >= self.deadline
 
     def put(self, data):
+        self._putCount += 1
         self.toBackground.put(data)
 
+    def wake(self):
+        """Have the background thread run its waiting tasks (see
+        kTaskWaiting). Unlike put(), this may be called from any thread and is
+        not a user event."""
+        self.toBackground.put((None, 'wake'))
+
+    def run(self):
+        background(self)
+
+    def send(self, data):
+        """Put |data| in the mailbox and wake the main thread."""
+        with self._mailboxLock:
+            if self._mailbox is not None:
+                if self._mailbox[0] == 'exception':
+                    return  # Keep the exception for the main thread.
+                self.droppedFrames += 1
+            self._mailbox = data
+            self.generation += 1
+        try:
+            os.write(self._wakeWriteFd, b"\0")
+        except OSError:
+            pass  # The pipe is full, so a wake is already pending.
+
+    def take(self, block):
+        """Get a message from the main thread (called by the background
+        thread)."""
+        message = self.toBackground.get(block)
+        if message != (None, 'wake'):
+            self._takeCount += 1
+        return message
+
+
+class Scheduler:
+    """Run background tasks a time slice at a time.
+
+    A task is a function that does some work and returns whether the task is
+    finished (as Window.longTimeSlice() does). An unfinished task is called
+    again, in this slice or a later one; unless it returned kTaskWaiting, then
+    it waits for wakeTasks(). Tasks run in order of priority (and then the
+    order they were added).
+    """
+
+    def __init__(self):
+        # {name: (priority, order, function)}.
+        self._tasks = {}
+        # The tasks that returned kTaskWaiting, {name: (priority, order,
+        # function)}.
+        self._waiting = {}
+        self._order = 0
+
+    def add(self, name, function, priority=kDefaultPriority):
+        """Schedule |function|, replacing any task with the same |name|."""
+        self._order += 1
+        self._waiting.pop(name, None)
+        self._tasks[name] = (priority, self._order, function)
+
+    def addAndRun(self, name, function, bg, priority=kDefaultPriority):
+        """Run |function| for one slice now (so that brief work is done at
+        once) and schedule it if it isn't finished.
+
+        Returns:
+          Whether it is finished.
+        """
+        if bg is not None:
+            bg.deadline = time.time() + kSliceSeconds
+        try:
+            finished = function()
+        finally:
+            if bg is not None:
+                bg.deadline = None
+        if finished is not True:
+            self.add(name, function, priority)
+            if finished == kTaskWaiting:
+                self._waiting[name] = self._tasks.pop(name)
+        return finished is True
+
+    def hasTask(self, name):
+        return name in self._tasks or name in self._waiting
+
+    def hasTasks(self):
+        return bool(self._tasks or self._waiting)
+
+    def hasReadyTasks(self):
+        """Whether there are tasks to run (that are not waiting)."""
+        return bool(self._tasks)
+
+    def remove(self, name):
+        self._tasks.pop(name, None)
+        self._waiting.pop(name, None)
+
+    def wakeTasks(self):
+        """Run the waiting tasks again (in the next slice)."""
+        self._tasks.update(self._waiting)
+        self._waiting = {}
+
+    def runSlice(self, bg, sliceSeconds=kSliceSeconds):
+        """Run tasks until they are finished, |sliceSeconds| have passed, or
+        there is a user event.
+
+        Args:
+          bg (BackgroundThread): Tasks are paused when it has a user event. May
+              be None.
+          sliceSeconds (float): The time budget.
+
+        Returns:
+          Whether there are no tasks left to run (each is finished or
+          waiting).
+        """
+        deadline = time.time() + sliceSeconds
+        if bg is not None:
+            bg.deadline = deadline
+        try:
+            for name, task in sorted(self._tasks.items(),
+                                     key=lambda i: i[1][:2]):
+                while True:
+                    if time.time() >= deadline or (bg is not None and
+                                                   bg.hasUserEvent()):
+                        return False
+                    start = time.time()
+                    finished = task[2]()
+                    app.profile.taskDelta(name, start)
+                    if finished == kTaskWaiting:
+                        if self._tasks.get(name) is task:
+                            self._waiting[name] = self._tasks.pop(name)
+                        break
+                    if finished:
+                        if self._tasks.get(name) is task:
+                            del self._tasks[name]
+                        break
+        finally:
+            if bg is not None:
+                bg.deadline = None
+        return not self._tasks
 
-def background(inputQueue, outputQueue):
+
+def background(bg):
     cmdCount = 0
     block = True
-    pid = os.getpid()
-    signalNumber = signal.SIGUSR1
+    scheduler = None
+    nextFrame = 0
     while True:
         try:
             try:
-                program, message = inputQueue.get(block)
+                window, message = bg.take(block)
+            except queue.Empty:
+                window = message = None
+            if message == 'quit':
+                app.log.info('bg received quit message')
+                return
+            if message == 'wake':
+                # Waiting tasks may continue, see BackgroundThread.wake().
+                if scheduler is not None:
+                    scheduler.wakeTasks()
+            elif window is not None:
+                program = window
                 #profile = app.profile.beginPythonProfile()
-                if message == 'quit':
-                    app.log.info('bg received quit message')
-                    return
+                start = time.time()
                 program.executeCommandList(message)
-                block = program.shortTimeSlice()
+                cmdCount += len(message)
+                latency = program.program.latency
+                latency.executed(cmdCount, start, time.time())
+                scheduler = program.program.scheduler
+                if not program.shortTimeSlice():
+                    scheduler.add(u"parse", program.longTimeSlice,
+                                  kParsePriority)
+                block = not scheduler.hasReadyTasks()
+                if bg.hasUserEvent():
+                    # Skip drawing a frame that would be replaced by the frame
+                    # of the newer input.
+                    continue
                 program.render()
+                latency.rendered(cmdCount, time.time())
                 # debugging only: program.showWindowHierarchy()
-                cmdCount += len(message)
                 program.program.backgroundFrame.setCmdCount(cmdCount)
-                outputQueue.put(program.program.backgroundFrame.grabFrame())
-                os.kill(pid, signalNumber)
+                bg.send(program.program.backgroundFrame.grabFrame())
+                nextFrame = time.time() + kTaskFrameSeconds
                 #app.profile.endPythonProfile(profile)
-                time.sleep(0)  # See note in hasMessage().
-                if block or not inputQueue.empty():
+                if block:
                     continue
-            except queue.Empty:
-                pass
-            block = program.longTimeSlice()
-            if block:
+            if scheduler is None:
+                continue
+            block = scheduler.runSlice(bg)
+            if block or time.time() >= nextFrame:
                 program.render()
                 program.program.backgroundFrame.setCmdCount(cmdCount)
-                outputQueue.put(program.program.backgroundFrame.grabFrame())
-                os.kill(pid, signalNumber)
+                bg.send(program.program.backgroundFrame.grabFrame())
+                nextFrame = time.time() + kTaskFrameSeconds
         except Exception as e:
             app.log.exception(e)
             app.log.error('bg thread exception', e)
             errorType, value, tracebackInfo = sys.exc_info()
             out = traceback.format_exception(errorType, value, tracebackInfo)
-            outputQueue.put(('exception', out))
-            os.kill(pid, signalNumber)
+            bg.send(('exception', out))
             while True:
-                program, message = inputQueue.get()
+                program, message = bg.take(True)
                 if message == 'quit':
                     app.log.info('bg received quit message')
                     return
 
 
 def startupBackground():
-    toBackground = queue.Queue()
-    fromBackground = queue.Queue()
-    bg = BackgroundThread(
-        target=background, args=(toBackground, fromBackground))
+    bg = BackgroundThread()
+    bg.toBackground = queue.Queue()
+    bg.openWakePipe()
     bg.setName('ci_edit_bg')
     bg.setDaemon(True)
     bg.start()
-    bg.toBackground = toBackground
-    bg.fromBackground = fromBackground
     return bg
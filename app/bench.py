@@ -0,0 +1,458 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  A headless benchmark, run with:
+    python -m app.bench [--sizes 1KB,100KB,500MB] [--scenarios typing,find]
+        [--keys 100] [--corpusDir dir] [--output results.json]
+        [--singleThread] [--inProcess]
+  or, to time the input recorded with ci.py --recordInput (see replayLog()):
+    python -m app.bench --replay ~/.ci_edit/input_<time>.log
+        [--corpusDir dir] [--output results.json]
+
+  Scripted key sequences (see kScenarios) are replayed against generated
+  documents using the fake curses from the tests (test_fake/curses), so no
+  terminal is needed. Each case (a document size and scenario) is run in a
+  new process, so that the peak memory use is per case.
+
+  The results are written as JSON, e.g.
+    {"platform": "linux", "python": "3.7.3", "singleThread": false,
+     "results": [{"corpus": "1KB", "bytes": 1024, "scenario": "typing",
+       "keys": 100, "startupSeconds": 0.05, "scenarioSeconds": 0.4,
+       "latencyMs": {"total": {"count": 100, "p50": 2.1, "p95": 3.0,
+         "p99": 3.3, "max": 3.5}, "queue": ...},
+       "peakRssBytes": 31000000, "error": null}, ...]}
+  The latency stages are those of app.latency.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+try:
+    unicode
+except NameError:
+    unicode = str
+    unichr = chr
+
+import os
+import sys
+
+# Use the fake curses (this must precede importing curses).
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'test_fake'))
+
+import curses
+import io
+import json
+import multiprocessing
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+import app.ci_program
+import app.curses_util
+import app.input_log
+import app.latency
+
+kDefaultSizes = u"1KB,100KB,1MB"
+kDefaultKeys = 100
+kSizeUnits = {u"KB": 1024, u"MB": 1024 * 1024, u"GB": 1024 * 1024 * 1024}
+# The generated documents repeat a chunk of about this many bytes.
+kCorpusChunkBytes = 1024 * 1024
+
+
+def typingKeys(count):
+    # Some of the fake curses key codes are those of printable characters
+    # (e.g. KEY_F5 is u")"), so only lowercase letters, u"_", and newlines are
+    # typed.
+    text = u"value_compute_alpha_beta\n"
+    return [text[i % len(text)] for i in range(count)]
+
+
+def pagingKeys(count):
+    down = count // 2
+    return [curses.KEY_NPAGE] * down + [curses.KEY_PPAGE] * (count - down)
+
+
+def findKeys(count):
+    return ([app.curses_util.CTRL_F] + list(u"def") +
+            [app.curses_util.CTRL_G] * count + [app.curses_util.CTRL_J])
+
+
+def replaceKeys(count):
+    return ([app.curses_util.CTRL_F] + list(u"def") +
+            [app.curses_util.CTRL_I] + list(u"fn") +
+            [app.curses_util.CTRL_G] * count + [app.curses_util.CTRL_J])
+
+
+def undoKeys(count):
+    third = count // 3
+    return (typingKeys(count - 2 * third) + [app.curses_util.CTRL_Z] * third +
+            [app.curses_util.CTRL_Y] * third)
+
+
+# {name: function(count) returning a list of fake inputs}.
+kScenarios = {
+    u"typing": typingKeys,
+    u"paging": pagingKeys,
+    u"find": findKeys,
+    u"replace": replaceKeys,
+    u"undo": undoKeys,
+}
+kScenarioOrder = (u"typing", u"paging", u"find", u"replace", u"undo")
+
+
+def parseSize(text):
+    """Convert a size such as u"100KB" to a count of bytes."""
+    text = text.strip().upper()
+    for unit, scale in kSizeUnits.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * scale)
+    return int(text)
+
+
+def corpusChunk():
+    """Python-like source text, roughly kCorpusChunkBytes long."""
+    lines = []
+    size = 0
+    i = 0
+    while size < kCorpusChunkBytes:
+        block = (u"def function_%d(alpha, beta):\n"
+                 u"    \"\"\"Return a value (%d).\"\"\"\n"
+                 u"    # Note: the [brackets] and {braces} are balanced.\n"
+                 u"    value = alpha * %d + beta\n"
+                 u"    return {'value': value, 'name': \"n%d\"}\n\n") % (
+                     i, i, i % 97, i)
+        lines.append(block)
+        size += len(block)
+        i += 1
+    return u"".join(lines).encode(u"utf-8")
+
+
+def makeCorpus(directory, sizeText):
+    """Write (or reuse) a generated document of |sizeText| bytes.
+
+    Returns:
+        The path to the document.
+    """
+    size = parseSize(sizeText)
+    path = os.path.join(directory, u"corpus_%d.py" % (size,))
+    if os.path.isfile(path) and os.path.getsize(path) == size:
+        return path
+    chunk = corpusChunk()
+    with io.open(path, u"wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(chunk[:remaining])
+            remaining -= len(chunk)
+    return path
+
+
+def peakRssBytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == u"darwin":
+        return peak
+    # Linux reports kilobytes.
+    return peak * 1024
+
+
+def histogramMs(histogram):
+    """The count and percentiles (in milliseconds) of an
+    app.latency.Histogram."""
+    result = {u"count": histogram.count}
+    if histogram.count:
+        for name, fraction in ((u"p50", 0.5), (u"p95", 0.95), (u"p99", 0.99)):
+            result[name] = round(histogram.percentile(fraction) * 1000, 3)
+        result[u"max"] = round(histogram.peak * 1000, 3)
+    return result
+
+
+def latencyMs(tracker):
+    """The percentiles of each stage of |tracker| (a LatencyTracker)."""
+    return dict((stage, histogramMs(tracker.histograms[stage]))
+                for stage in app.latency.kStages)
+
+
+class TerminalStdin:
+    """Stands in for sys.stdin, since the editor reads a document from stdin
+    when it isn't a terminal (and the benchmark may be run without one)."""
+
+    def isatty(self):
+        return True
+
+
+def beginHeadless(argv):
+    """Set up sys for running the editor with the fake curses.
+
+    Returns:
+        The prior state, for endHeadless().
+    """
+    saved = (sys.argv, sys.stdin, sys.stdout)
+    sys.argv = argv
+    sys.stdin = TerminalStdin()
+    # Discard the terminal escape codes (so that the JSON may go to stdout).
+    sys.stdout = open(os.devnull, 'w')
+    return saved
+
+
+def endHeadless(saved):
+    sys.stdout.close()
+    sys.argv, sys.stdin, sys.stdout = saved
+
+
+def runCase(path, scenario, keyCount, singleThread=False):
+    """Open |path| in the editor and replay the keys of |scenario|.
+
+    Returns:
+        A dict of the case results (see the module docstring).
+    """
+    keys = kScenarios[scenario](keyCount)
+    times = []
+
+    def mark(display, cmdIndex):
+        times.append(time.time())
+        return None
+
+    argv = [u"ci_bench", path]
+    if singleThread:
+        argv.append(u"--singleThread")
+    saved = beginHeadless(argv)
+    try:
+        cursesScreen = curses.StandardScreen()
+        program = app.ci_program.CiProgram()
+        program.setUpCurses(cursesScreen)
+        program.clipboard.setOsHandlers(None, None)
+        # The |mark| calls are made once the prior input has been drawn.
+        cursesScreen.setFakeInputs([mark] + keys +
+                                   [mark, app.curses_util.CTRL_Q, u"n"])
+        start = time.time()
+        program.run()
+    finally:
+        endHeadless(saved)
+    error = app.ci_program.userConsoleMessage
+    app.ci_program.userConsoleMessage = None
+    if len(times) != 2 and error is None:
+        error = u"the scenario did not finish"
+    return {
+        u"bytes": os.path.getsize(path),
+        u"scenario": scenario,
+        u"keys": len(keys),
+        u"startupSeconds": round(times[0] - start, 6) if times else None,
+        u"scenarioSeconds": (round(times[1] - times[0], 6)
+                             if len(times) == 2 else None),
+        u"latencyMs": latencyMs(program.latency),
+        u"peakRssBytes": peakRssBytes(),
+        u"error": error,
+    }
+
+
+def runIsolated(args):
+    """Call runCase() with a tuple of |args| (for a process pool)."""
+    return runCase(*args)
+
+
+def runBenchmark(sizes, scenarios, keyCount, corpusDir, singleThread=False,
+                 isolate=True):
+    """Run each of |scenarios| against a document of each of |sizes|.
+
+    Args:
+      sizes (list of unicode): e.g. [u"1KB", u"500MB"].
+      scenarios (list of unicode): Keys of kScenarios.
+      keyCount (int): The (approximate) number of keys per scenario.
+      corpusDir (unicode): Where to write the generated documents.
+      singleThread (bool): Run without the background thread.
+      isolate (bool): Run each case in a new process.
+
+    Returns:
+        A dict of the results (see the module docstring).
+    """
+    results = []
+    for sizeText in sizes:
+        path = makeCorpus(corpusDir, sizeText)
+        for scenario in scenarios:
+            args = (path, scenario, keyCount, singleThread)
+            if isolate:
+                pool = multiprocessing.Pool(1)
+                try:
+                    result = pool.apply(runIsolated, (args,))
+                finally:
+                    pool.terminate()
+                    pool.join()
+            else:
+                result = runCase(*args)
+            result[u"corpus"] = sizeText
+            results.append(result)
+    return {
+        u"platform": sys.platform,
+        u"python": platform.python_version(),
+        u"singleThread": singleThread,
+        u"results": results,
+    }
+
+
+def replayArgs(cwd, args, workDir):
+    """Get the command line for replaying a log recorded with |args|.
+
+    The files are copied to |workDir|, so that the replay (of a save, say)
+    doesn't modify the originals.
+    """
+    argv = [u"ci_replay", u"--singleThread"]
+    takeAll = False
+    for arg in args:
+        if not takeAll and arg[:1] in (u"-", u"+"):
+            takeAll = arg == u"--"
+            argv.append(arg)
+            continue
+        path = os.path.join(cwd, arg)
+        if os.path.isfile(path):
+            directory = os.path.join(workDir, unicode(len(argv)))
+            os.makedirs(directory)
+            arg = os.path.join(directory, os.path.basename(path))
+            shutil.copyfile(path, arg)
+        argv.append(arg)
+    return argv
+
+
+def replayLog(logPath, workDir):
+    """Run the input recorded by --recordInput (see app.input_log) and time
+    each batch.
+
+    Unlike runCase(), each batch is passed to executeCommandList() as
+    recorded. The background thread isn't used, each batch is drawn before
+    the next is run.
+
+    Returns:
+        A dict of the results, e.g.
+          {"log": path, "batches": [{"at": 1.5, "commands": 1,
+            "executeMs": 0.3, "renderMs": 1.2, "refreshMs": 0.4,
+            "totalMs": 1.9}, ...], "totalMs": {"count": ..., "p50": ...},
+            "slowest": [indexes of the slowest batches], "error": null}
+        Where "at" is the recorded time of the batch, in seconds from the
+        start of the recording.
+    """
+    (cwd, args, rows, cols), batches = app.input_log.readLog(logPath)
+    saved = beginHeadless(replayArgs(cwd, args, workDir))
+    results = []
+    histogram = app.latency.Histogram()
+    try:
+        cursesScreen = curses.StandardScreen()
+        cursesScreen.fakeDisplay.setScreenSize(rows, cols)
+        program = app.ci_program.CiProgram()
+        program.setUpCurses(cursesScreen)
+        program.clipboard.setOsHandlers(None, None)
+        program.setUpSession()
+        programWindow = program.programWindow
+        cmdCount = 0
+        for seconds, cmdList in [(0.0, [])] + batches:
+            if program.exiting:
+                break
+            cmdCount += len(cmdList)
+            start = time.time()
+            programWindow.executeCommandList(cmdList)
+            executed = time.time()
+            programWindow.shortTimeSlice()
+            programWindow.render()
+            program.backgroundFrame.setCmdCount(cmdCount)
+            rendered = time.time()
+            program.refresh(*program.backgroundFrame.grabFrame())
+            painted = time.time()
+            if not cmdList:
+                continue  # The first frame.
+            histogram.add(painted - start)
+            results.append({
+                u"at": round(seconds, 6),
+                u"commands": len(cmdList),
+                u"executeMs": round((executed - start) * 1000, 3),
+                u"renderMs": round((rendered - executed) * 1000, 3),
+                u"refreshMs": round((painted - rendered) * 1000, 3),
+                u"totalMs": round((painted - start) * 1000, 3),
+            })
+    finally:
+        endHeadless(saved)
+    error = app.ci_program.userConsoleMessage
+    app.ci_program.userConsoleMessage = None
+    slowest = sorted(range(len(results)),
+                     key=lambda i: results[i][u"totalMs"],
+                     reverse=True)[:10]
+    return {
+        u"log": logPath,
+        u"batches": results,
+        u"totalMs": histogramMs(histogram),
+        u"slowest": slowest,
+        u"peakRssBytes": peakRssBytes(),
+        u"error": error,
+    }
+
+
+def main(argv):
+    sizes = kDefaultSizes.split(u",")
+    scenarios = list(kScenarioOrder)
+    keyCount = kDefaultKeys
+    corpusDir = None
+    outputPath = None
+    singleThread = False
+    isolate = True
+    replayPath = None
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg == u"--sizes":
+            sizes = args.pop(0).split(u",")
+        elif arg == u"--scenarios":
+            scenarios = args.pop(0).split(u",")
+        elif arg == u"--keys":
+            keyCount = int(args.pop(0))
+        elif arg == u"--corpusDir":
+            corpusDir = args.pop(0)
+        elif arg == u"--output":
+            outputPath = args.pop(0)
+        elif arg == u"--singleThread":
+            singleThread = True
+        elif arg == u"--inProcess":
+            isolate = False
+        elif arg == u"--replay":
+            replayPath = args.pop(0)
+        else:
+            print(__doc__)
+            return 1
+    for scenario in scenarios:
+        if scenario not in kScenarios:
+            print(u"unknown scenario", scenario)
+            return 1
+    removeCorpusDir = corpusDir is None
+    if removeCorpusDir:
+        corpusDir = tempfile.mkdtemp(prefix=u"ci_bench_")
+    elif not os.path.isdir(corpusDir):
+        os.makedirs(corpusDir)
+    try:
+        if replayPath is not None:
+            report = replayLog(replayPath, corpusDir)
+        else:
+            report = runBenchmark(sizes, scenarios, keyCount, corpusDir,
+                                  singleThread, isolate)
+    finally:
+        if removeCorpusDir:
+            shutil.rmtree(corpusDir)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if outputPath is None:
+        print(output)
+    else:
+        with io.open(outputPath, u"w", encoding=u"utf-8") as f:
+            f.write(unicode(output) + u"\n")
+    return 0
+
+
+if __name__ == u"__main__":
+    sys.exit(main(sys.argv[1:]))
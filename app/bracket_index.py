@@ -0,0 +1,199 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  An index of the brackets of a document, for finding the bracket that
+  matches another.
+
+  The index is built by the Parser as it parses (see Parser._indexBrackets()),
+  from the start of the document up to the parsed rows. Brackets within
+  grammars that don't match brackets (comments and strings, see the 'brackets'
+  grammar pref) are left out. An edit drops the brackets from the edited row
+  on, which are then found again as the parse catches up.
+
+  Each kind of bracket (e.g. parentheses) is counted separately. A bracket's
+  level is the depth inside an open bracket, or outside a close bracket; a
+  pair of matching brackets has the same level, and all the brackets between
+  them are deeper. So the match is the next (or prior) bracket of the same
+  level, found with a bisect of the brackets of that level.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import array
+import bisect
+import re
+
+import app.config
+
+kBracketRe = re.compile(u"[()[\\]{}]")
+# The kind (an index into the lists of a BracketIndex) and whether it's an
+# open bracket, for each bracket.
+kBrackets = {
+    u'(': (0, True),
+    u')': (0, False),
+    u'[': (1, True),
+    u']': (1, False),
+    u'{': (2, True),
+    u'}': (2, False),
+}
+kKinds = 3
+# The brackets between checks of BackgroundThread.shouldYield().
+kYieldBrackets = 256
+# The document is read this many characters at a time (rather than joining all
+# of it, see app.piece_table).
+kScanChars = 1 << 16
+# Returned by BracketIndex.matchingBracket() for a bracket without a match.
+kNoMatch = -1
+
+
+class BracketIndex:
+    """The data offsets and levels of the brackets of a document."""
+
+    def __init__(self):
+        # For each kind, in document order: the data offset of each bracket,
+        # its level, and whether it's an open bracket.
+        self.offsets = [array.array('q') for _ in range(kKinds)]
+        self.levels = [array.array('q') for _ in range(kKinds)]
+        self.opens = [array.array('b') for _ in range(kKinds)]
+        # For each kind, {level: array of indexes into |offsets|}.
+        self.byLevel = [{} for _ in range(kKinds)]
+        # The depth after the last bracket, for each kind.
+        self.depths = [0] * kKinds
+        # The brackets prior to this offset have been found.
+        self.scannedTo = 0
+
+    def truncate(self, offset):
+        """Drop the brackets at or after |offset|."""
+        if offset >= self.scannedTo:
+            return
+        self.scannedTo = offset
+        for kind in range(kKinds):
+            offsets = self.offsets[kind]
+            levels = self.levels[kind]
+            opens = self.opens[kind]
+            first = bisect.bisect_left(offsets, offset)
+            if first == len(offsets):
+                continue
+            byLevel = self.byLevel[kind]
+            for level in set(levels[first:]):
+                indexes = byLevel[level]
+                del indexes[bisect.bisect_left(indexes, first):]
+                if not indexes:
+                    del byLevel[level]
+            del offsets[first:]
+            del levels[first:]
+            del opens[first:]
+            if first == 0:
+                self.depths[kind] = 0
+            else:
+                self.depths[kind] = levels[-1] - (0 if opens[-1] else 1)
+
+    def build(self, store, parserNodes, end, bgThread=None):
+        """Find the brackets from |scannedTo| to |end|.
+
+        Args:
+          store (PieceTable): The document.
+          parserNodes (ParserNodes): The parse of (at least) store[:end], which
+              determines the grammar of each bracket.
+          end (int): The data offset to stop at.
+          bgThread (BackgroundThread): Stop early when it should yield (see
+              BackgroundThread.shouldYield()). If None, continue to |end|.
+        """
+        if app.config.strict_debug:
+            assert end <= len(store)
+        nodeIndex = -1
+        nodeBegin = nodeEnd = 0
+        matches = True
+        nodeCount = len(parserNodes)
+        depths = self.depths
+        count = 0
+        while self.scannedTo < end:
+            textBegin = self.scannedTo
+            text = store[textBegin:min(textBegin + kScanChars, end)]
+            for match in kBracketRe.finditer(text):
+                offset = textBegin + match.start()
+                count += 1
+                if count % kYieldBrackets == 0 and (bgThread is not None and
+                                                    bgThread.shouldYield()):
+                    self.scannedTo = offset
+                    return
+                if not nodeBegin <= offset < nodeEnd:
+                    nodeIndex = parserNodes.indexAtOffset(offset)
+                    nodeBegin = parserNodes.begin(nodeIndex)
+                    nodeEnd = (parserNodes.begin(nodeIndex + 1)
+                               if nodeIndex + 1 < nodeCount else len(store))
+                    matches = parserNodes.grammar(nodeIndex).get(
+                        u'brackets', True)
+                if not matches:
+                    continue
+                kind, isOpen = kBrackets[match.group()]
+                if isOpen:
+                    depths[kind] += 1
+                    level = depths[kind]
+                else:
+                    level = depths[kind]
+                    depths[kind] -= 1
+                indexes = self.byLevel[kind].get(level)
+                if indexes is None:
+                    indexes = self.byLevel[kind][level] = array.array('q')
+                indexes.append(len(self.offsets[kind]))
+                self.offsets[kind].append(offset)
+                self.levels[kind].append(level)
+                self.opens[kind].append(isOpen)
+            self.scannedTo = textBegin + len(text)
+
+    def depthAt(self, offset):
+        """Get the nesting depth (of all kinds of brackets) at |offset|, which
+        must be prior to |scannedTo|. E.g. the depth at the start of a row."""
+        if app.config.strict_debug:
+            assert offset <= self.scannedTo
+        depth = 0
+        for kind in range(kKinds):
+            i = bisect.bisect_left(self.offsets[kind], offset) - 1
+            if i >= 0:
+                depth += self.levels[kind][i] - (0 if self.opens[kind][i] else
+                                                 1)
+        return depth
+
+    def matchingBracket(self, offset, length):
+        """Find the bracket that matches the one at |offset|.
+
+        Args:
+          offset (int): The data offset of a bracket.
+          length (int): The length of the data (to tell whether all of it has
+              been indexed).
+
+        Returns:
+          The data offset of the match; kNoMatch if there is none; or None if
+          the bracket at |offset| isn't in the index (e.g. it's in a comment)
+          or the match may be beyond the brackets indexed so far.
+        """
+        for kind in range(kKinds):
+            offsets = self.offsets[kind]
+            i = bisect.bisect_left(offsets, offset)
+            if i < len(offsets) and offsets[i] == offset:
+                break
+        else:
+            return None
+        indexes = self.byLevel[kind][self.levels[kind][i]]
+        position = bisect.bisect_left(indexes, i)
+        if self.opens[kind][i]:
+            if position + 1 < len(indexes):
+                return offsets[indexes[position + 1]]
+            return kNoMatch if self.scannedTo >= length else None
+        if position > 0:
+            return offsets[indexes[position - 1]]
+        return kNoMatch
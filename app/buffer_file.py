@@ -25,6 +25,10 @@ import os
 
 import app.config
 
+# Files with these extensions are left out of file suggestions and searches.
+# TODO(dschuyler): rework this ignore list.
+kIgnoreExt = set(('.pyc', '.pyo', '.o', '.obj', '.tgz', '.zip', '.tar'))
+
 
 def pathRowColumn(path, projectDir):
     """Guess whether unrecognized file path refers to another file or has line
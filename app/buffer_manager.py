@@ -53,6 +53,8 @@ class BufferManager:
             assert issubclass(self.__class__, BufferManager), self
             assert issubclass(textBuffer.__class__, app.text_buffer.TextBuffer)
         self.untrackBuffer_(textBuffer)
+        # Stop parsing the document (in other processes).
+        textBuffer.parser.cancelParallelParse()
 
     def getUnsavedBuffer(self):
         for fileBuffer in self.buffers:
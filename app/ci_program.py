@@ -33,8 +33,12 @@ except NameError:
 
 assert bytes_to_unicode((226, 143, 176)) == u'⏰'
 
-import cProfile
-import pstats
+try:
+    import concurrent.futures
+except ImportError:
+    # Python2 (without the futures backport).
+    concurrent = None
+import multiprocessing
 try:
     import cPickle as pickle
 except ImportError:
@@ -43,6 +47,7 @@ import curses
 import locale
 import io
 import os
+import select
 import struct
 import sys
 import time
@@ -56,13 +61,23 @@ import app.color
 import app.curses_util
 import app.help
 import app.history
+import app.input_log
+import app.latency
 import app.log
+import app.parse_cache
 import app.prefs
+import app.profile
 import app.program_window
 import app.render
 import app.spelling
 import app.window
 
+# When waiting on input with select(), wake at least this often. Curses
+# handles a terminal resize at the next getch().
+kIdleWaitSeconds = 0.25
+# The bytes of an escape sequence or utf-8 character may arrive separately.
+kSequenceTimeoutMs = 10
+
 userConsoleMessage = None
 
 
@@ -93,14 +108,32 @@ class CiProgram:
         # frame (similar to, but not exactly like double buffering video).
         self.backgroundFrame = app.render.Frame()
         self.frontFrame = None
+        # Only the changes from the prior frame are drawn (see refresh()).
+        self.damageTracker = app.render.DamageTracker()
+        self.screenSize = None
         self.history = app.history.History(
             self.prefs.userData.get('historyPath'))
+        self.parseCache = app.parse_cache.ParseCache(
+            self.prefs.userData.get('parseCachePath'),
+            self.prefs.editor['parseCacheMaxBytes'])
+        # See getParseExecutor().
+        self.parseExecutor = None
         self.bufferManager = app.buffer_manager.BufferManager(self, self.prefs)
         self.cursesScreen = None
         self.debugMouseEvent = (0, 0, 0, 0, 0)
         self.exiting = False
         self.ch = 0
         self.bg = None
+        # Work done between user events, by the background thread.
+        self.scheduler = app.background.Scheduler()
+        # The time from reading input until it's shown.
+        self.latency = app.latency.LatencyTracker()
+        # The terminal input, see setInputFd().
+        self.inputFd = None
+        # A running app.profile.SamplingProfiler (see toggleSampling()).
+        self.sampler = None
+        # An app.input_log.InputRecorder, see --recordInput.
+        self.inputRecorder = None
 
     def setUpCurses(self, cursesScreen):
         self.cursesScreen = cursesScreen
@@ -148,6 +181,30 @@ class CiProgram:
             cursesWindow.keypad(1)
             app.window.mainCursesWindow = cursesWindow
 
+    def setInputFd(self, inputFd):
+        """Wait on |inputFd| (the terminal input) with select(), rather than
+        polling getch()."""
+        self.inputFd = inputFd
+        self.cursesScreen.timeout(0)
+
+    def setSequenceTimeout(self, waiting):
+        """Allow time for the rest of a multi-byte input to arrive."""
+        if self.inputFd is not None:
+            self.cursesScreen.timeout(kSequenceTimeoutMs if waiting else 0)
+
+    def waitForInput(self):
+        """Block until there is terminal input or a message from the
+        background thread."""
+        readers = [self.inputFd]
+        if self.bg is not None:
+            readers.append(self.bg.wakeFd)
+        try:
+            ready = select.select(readers, [], [], kIdleWaitSeconds)[0]
+        except select.error:
+            return  # Interrupted by a signal.
+        if self.bg is not None and self.bg.wakeFd in ready:
+            self.processBackgroundMessages()
+
     def commandLoop(self):
         # Cache the thread setting.
         useBgThread = self.prefs.editor['useBgThread']
@@ -174,15 +231,9 @@ class CiProgram:
         # application is closing down.
         while not self.exiting:
             if 0:
-                profile = cProfile.Profile()
-                profile.enable()
+                profile = app.profile.beginPythonProfile()
                 self.refresh(drawList, cursor, cmdCount)
-                profile.disable()
-                output = io.StringIO.StringIO()
-                stats = pstats.Stats(
-                    profile, stream=output).sort_stats('cumulative')
-                stats.print_stats()
-                app.log.info(output.getvalue())
+                app.profile.endPythonProfile(profile)
             self.mainLoopTime = time.time() - start
             if self.mainLoopTime > self.mainLoopTimePeak:
                 self.mainLoopTimePeak = self.mainLoopTime
@@ -195,9 +246,11 @@ class CiProgram:
                      frameCmdCount) = self.backgroundFrame.grabFrame()
                     if frameCmdCount is not None:
                         self.frontFrame = (drawList, cursor, frameCmdCount)
+                        self.latency.handedOff(frameCmdCount, time.time())
                 if self.frontFrame is not None:
                     drawList, cursor, frameCmdCount = self.frontFrame
                     self.refresh(drawList, cursor, frameCmdCount)
+                    self.latency.painted(frameCmdCount, time.time())
                     self.frontFrame = None
                 for _ in range(5):
                     eventInfo = None
@@ -212,6 +265,7 @@ class CiProgram:
                         # callback functions) the sequence is converted into
                         # tuple.
                         keySequence = []
+                        self.setSequenceTimeout(True)
                         n = self.getCh()
                         while n != curses.ERR:
                             keySequence.append(n)
@@ -236,6 +290,7 @@ class CiProgram:
                                 *keySequence).decode(u"utf-8")
                         else:
                             ch = tuple(keySequence)
+                        self.setSequenceTimeout(False)
                         if not ch:
                             # The sequence was empty, so it looks like this
                             # Escape wasn't really the start of a sequence and
@@ -245,6 +300,7 @@ class CiProgram:
                     elif type(ch) is int and 160 <= ch < 257:
                         # Start of utf-8 character.
                         u = None
+                        self.setSequenceTimeout(True)
                         if (ch & 0xe0) == 0xc0:
                             # Two byte utf-8.
                             b = self.getCh()
@@ -260,6 +316,7 @@ class CiProgram:
                             c = self.getCh()
                             d = self.getCh()
                             u = bytes_to_unicode((ch, b, c, d))
+                        self.setSequenceTimeout(False)
                         assert u is not None
                         eventInfo = u
                         ch = app.curses_util.UNICODE_INPUT
@@ -273,36 +330,48 @@ class CiProgram:
                             # the eventInfo list instead of calling getmouse.
                             self.debugMouseEvent = curses.getmouse()
                             eventInfo = (self.debugMouseEvent, time.time())
+                        if not cmdList:
+                            inputTime = time.time()
                         cmdList.append((ch, eventInfo))
+                if not cmdList and self.inputFd is not None:
+                    # Curses has no more input, wait for some (or a frame).
+                    self.waitForInput()
             start = time.time()
             if len(cmdList):
+                cmdCount += len(cmdList)
+                self.latency.inputRead(cmdCount, inputTime)
+                if self.inputRecorder is not None:
+                    self.inputRecorder.record(inputTime, cmdList)
                 if useBgThread:
                     self.bg.put((self.programWindow, cmdList))
                 else:
                     self.programWindow.executeCommandList(cmdList)
+                    self.latency.executed(cmdCount, start, time.time())
                     self.programWindow.shortTimeSlice()
                     self.programWindow.render()
-                    cmdCount += len(cmdList)
+                    self.latency.rendered(cmdCount, time.time())
                     self.backgroundFrame.setCmdCount(cmdCount)
 
     def processBackgroundMessages(self):
-        while self.bg.hasMessage():
-            frame = self.bg.get()
-            if frame[0] == 'exception':
-                for line in frame[1]:
-                    userMessage(line[:-1])
-                self.quitNow()
-                return
-            # It's unlikely that more than one frame would be present in the
-            # queue. If/when it happens, only the las/most recent frame matters.
-            self.frontFrame = frame
+        self.bg.drainWakes()
+        frame = self.bg.get()
+        if frame is None:
+            return
+        if frame[0] == 'exception':
+            for line in frame[1]:
+                userMessage(line[:-1])
+            self.quitNow()
+            return
+        self.frontFrame = frame
+        self.latency.handedOff(frame[2], time.time())
 
     def getCh(self):
         """Get an input character (or event) from curses."""
         if self.exiting:
             return -1
         ch = self.cursesWindowGetCh()
-        # The background thread can send a notice at any getch call.
+        # Without setInputFd(), the fake curses used in testing sends a 0 to
+        # have background messages processed.
         while ch == 0:
             if self.bg is not None:
                 # Hmm, will ch ever equal 0 when self.bg is None?
@@ -328,6 +397,8 @@ class CiProgram:
         """Interpret the command line arguments."""
         app.log.startup('isatty', sys.stdin.isatty())
         debugRedo = False
+        latencyReport = False
+        recordInput = False
         showLogWindow = False
         cliFiles = []
         openToLine = None
@@ -347,6 +418,10 @@ class CiProgram:
                     debugRedo = True
                 elif i == '--profile':
                     profile = True
+                elif i == '--latencyReport':
+                    latencyReport = True
+                elif i == '--recordInput':
+                    recordInput = True
                 elif i == '--log':
                     showLogWindow = True
                 elif i == '--d':
@@ -377,6 +452,7 @@ class CiProgram:
                     self.quitNow()
                 elif i == '--clearHistory':
                     self.history.clearUserHistory()
+                    self.parseCache.clear()
                     self.quitNow()
                 elif i == '--eightColors':
                     numColors = 8
@@ -405,11 +481,13 @@ class CiProgram:
             cliFiles = decodedPaths
         self.prefs.startup = {
             'debugRedo': debugRedo,
+            'latencyReport': latencyReport,
             'showLogWindow': showLogWindow,
             'cliFiles': cliFiles,
             'openToLine': openToLine,
             'profile': profile,
             'readStdin': readStdin,
+            'recordInput': recordInput,
             'timeStartup': timeStartup,
             'numColors': numColors,
         }
@@ -424,6 +502,12 @@ class CiProgram:
     def refresh(self, drawList, cursor, cmdCount):
         """Paint the drawList to the screen in the main thread."""
         cursesWindow = app.window.mainCursesWindow
+        screenSize = cursesWindow.getmaxyx()
+        if screenSize != self.screenSize:
+            # The screen contents are not known after a resize.
+            self.screenSize = screenSize
+            self.damageTracker.reset()
+        drawList = self.damageTracker.diff(drawList)
         # Ask curses to hold the back buffer until curses refresh().
         cursesWindow.noutrefresh()
         curses.curs_set(0)  # Hide cursor.
@@ -463,6 +547,37 @@ class CiProgram:
             app.log.exception(e)
 
     def run(self):
+        self.setUpSession()
+        if self.prefs.startup.get('recordInput'):
+            self.startRecordingInput(self.prefs.userData.get('homePath'))
+        if self.prefs.startup.get('profile'):
+            profile = app.profile.beginPythonProfile()
+            self.commandLoop()
+            app.profile.endPythonProfile(profile)
+        else:
+            self.commandLoop()
+        if self.prefs.editor['useBgThread']:
+            self.bg.put((self.programWindow, 'quit'))
+            self.bg.join()
+            self.bg.close()
+        self.stopSampling()
+        if self.inputRecorder is not None:
+            self.inputRecorder.close()
+            userMessage(u"input recorded to", self.inputRecorder.path)
+            self.inputRecorder = None
+        if self.prefs.startup.get('latencyReport'):
+            userMessage(self.latency.report())
+        if self.parseExecutor is not None:
+            # Don't wait on parsing a document that is no longer needed.
+            for textBuffer in self.bufferManager.buffers:
+                textBuffer.parser.cancelParallelParse()
+            if sys.version_info >= (3, 9):
+                self.parseExecutor.shutdown(wait=False, cancel_futures=True)
+            else:
+                self.parseExecutor.shutdown(wait=False)
+
+    def setUpSession(self):
+        """Everything prior to the command loop (see run())."""
         self.parseArgs()
         self.setUpPalette()
         homePath = self.prefs.userData.get('homePath')
@@ -472,21 +587,78 @@ class CiProgram:
         if self.prefs.editor['useBgThread']:
             self.bg = app.background.startupBackground()
         self.startup()
-        if self.prefs.startup.get('profile'):
-            profile = cProfile.Profile()
-            profile.enable()
-            self.commandLoop()
-            profile.disable()
-            output = io.StringIO.StringIO()
-            stats = pstats.Stats(
-                profile, stream=output).sort_stats('cumulative')
-            stats.print_stats()
-            app.log.info(output.getvalue())
-        else:
-            self.commandLoop()
-        if self.prefs.editor['useBgThread']:
-            self.bg.put((self.programWindow, 'quit'))
-            self.bg.join()
+
+    def startRecordingInput(self, homePath):
+        """Write the input batches to a log in |homePath| (for
+        app.bench.replayLog())."""
+        path = os.path.join(
+            homePath,
+            u"input_%s.log" % (time.strftime(u"%Y%m%d_%H%M%S"),))
+        args = [unicode(i) for i in sys.argv[1:] if i != '--recordInput']
+        try:
+            self.inputRecorder = app.input_log.InputRecorder(
+                path, unicode(os.getcwd()), args,
+                app.window.mainCursesWindow.getmaxyx())
+        except (IOError, OSError) as e:
+            app.log.exception(e)
+
+    def toggleSampling(self):
+        """Start or stop sampling the stacks of the main and background
+        threads.
+
+        Returns:
+            A message for the user.
+        """
+        if self.sampler is None:
+            self.sampler = app.profile.SamplingProfiler()
+            self.sampler.start()
+            return u"Sampling profiler started"
+        path = self.stopSampling()
+        if path is None:
+            return u"Failed to write the profile (see the log)"
+        return u"Profile written to %s" % (path,)
+
+    def stopSampling(self):
+        """Stop the sampling profiler (if it's running) and write the
+        collapsed stacks under the homePath.
+
+        Returns:
+            The path written; or None.
+        """
+        if self.sampler is None:
+            return None
+        sampler = self.sampler
+        self.sampler = None
+        sampler.stop()
+        path = os.path.join(
+            self.prefs.userData.get('homePath'),
+            u"profile_%s.collapsed" % (time.strftime(u"%Y%m%d_%H%M%S"),))
+        try:
+            sampler.write(path)
+        except (IOError, OSError) as e:
+            app.log.exception(e)
+            return None
+        return path
+
+    def getParseExecutor(self):
+        """Get a process pool for parsing large documents in parallel (also
+        used by the grep command, see app.grep).
+
+        Returns:
+            A concurrent.futures.Executor; or None if parallel parsing is not
+            available.
+        """
+        if self.parseExecutor is None and concurrent is not None:
+            self.parseExecutor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.parseProcessCount())
+        return self.parseExecutor
+
+    def parseProcessCount(self):
+        """The number of processes to use for a parallel parse."""
+        count = self.prefs.editor['parallelParseProcesses']
+        if not count:
+            count = multiprocessing.cpu_count()
+        return count
 
     def setUpPalette(self):
 
@@ -508,7 +680,7 @@ class CiProgram:
                 except curses.error:
                     app.log.startup(u"No color scheme applied")
 
-        self.color.colors = self.prefs.startup['numColors']
+        self.color.setColors(self.prefs.startup['numColors'])
         if self.prefs.startup['numColors'] == 0:
             app.log.startup('using no colors')
         elif self.prefs.startup['numColors'] == 8:
@@ -546,6 +718,7 @@ def wrapped_ci(cursesScreen):
     try:
         prg = CiProgram()
         prg.setUpCurses(cursesScreen)
+        prg.setInputFd(sys.stdin.fileno())
         prg.run()
     except Exception:
         userMessage('---------------------------------------')
@@ -25,6 +25,15 @@ class Colors():
         self.__colorPrefs = colorPrefs
         self.colors = 256
         self.__cache = {}
+        # Incremented when the colors change, so that anything drawn with the
+        # prior colors can be redrawn. See Parser.generation.
+        self.generation = 0
+
+    def setColors(self, colors):
+        """Set the number of colors in the palette."""
+        self.colors = colors
+        self.__cache = {}
+        self.generation += 1
 
     def get(self, colorType, delta=0):
         if type(colorType) == type(0):
@@ -547,8 +547,3 @@ def hackCursesFixes():
             curses.ungetch(curses.KEY_RESIZE)
 
         signal.signal(signal.SIGWINCH, windowChangedHandler)
-
-    def wakeGetch(signum, frame):
-        curses.ungetch(0)
-
-    signal.signal(signal.SIGUSR1, wakeGetch)
@@ -67,6 +67,7 @@ class DebugWindow(app.window.ActiveWindow):
             u"scr rows %d cols %d mlt %f/%f pt %f" %
             (screenRows, screenCols, program.mainLoopTime,
              program.mainLoopTimePeak, textBuffer.parserTime), color)
+        self.writeLine(u"latency %s" % (program.latency.summary(),), color)
         self.writeLine(
             u"ch %3s %s" % (program.ch, app.curses_util.cursesKeyName(
                 program.ch) or u'UNKNOWN'), color)
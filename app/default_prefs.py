@@ -375,7 +375,6 @@ prefs = {
         "findDotAll": False,
         "findIgnoreCase": True,
         "findLocale": False,
-        "findMultiLine": False,
         "findUnicode": True,
         "findUseRegex": True,
         "findVerbose": False,
@@ -383,6 +382,9 @@ prefs = {
         # An example indentation. If the grammar has its own indent that can
         # override this value.
         "indentation": "  ",
+        # Files at least this large are opened read only, without reading the
+        # whole file into memory.
+        "largeFileMinBytes": 256 * 1024 * 1024,
         "lineLimitIndicator": 80,
         # When the mouse wheel is moved, which way should the window scroll.
         "naturalScrollDirection": True,
@@ -395,6 +397,16 @@ prefs = {
         "palette8": "default8",
         "palette16": "default16",
         "palette256": "default256",
+        # Documents at least this large are parsed in sections by several
+        # processes (see parallelParseProcesses).
+        "parallelParseMinBytes": 8 * 1024 * 1024,
+        # The number of processes for a parallel parse; zero for one per cpu.
+        "parallelParseProcesses": 0,
+        # Store the parse of documents at least this large (see userData
+        # parseCachePath).
+        "parseCacheMinBytes": 100 * 1024,
+        # Remove the least recently used stored parses beyond this size.
+        "parseCacheMaxBytes": 64 * 1024 * 1024,
         "predictionShowOpenFiles": True,
         "predictionShowAlternateFiles": True,
         "predictionShowRecentFiles": True,
@@ -542,6 +554,9 @@ prefs = {
         # A grammar is
         # "grammar_name": {
         #   "begin": None or regex,
+        #   "brackets": Boolean, Whether brackets within the grammar are
+        #       matched with others (see app.bracket_index). default: False
+        #       for comment and string grammars (by name), True otherwise.
         #   "continuation": None or string,
         #       Prefixed used when continuing to another line,
         #   "end": None or regex; a value of None means that the "begin" regex
@@ -1309,6 +1324,8 @@ prefs = {
         os.path.expanduser("~/.ci_edit"),
         "historyPath":
         os.path.join(os.path.expanduser("~/.ci_edit"), "history.dat"),
+        "parseCachePath":
+        os.path.join(os.path.expanduser("~/.ci_edit"), "parse_cache"),
     },
 }
 
@@ -25,6 +25,7 @@ except NameError:
 import os
 import re
 
+import app.buffer_file
 import app.config
 import app.controller
 import app.text_buffer
@@ -107,16 +108,7 @@ class InteractivePrediction(app.controller.Controller):
                     (i, '<new file> %s' % (i.parser.rowText(0)[:20]), dirty))
         dirPath, fileName = os.path.split(currentFile)
         fileName, ext = os.path.splitext(fileName)
-        # TODO(dschuyler): rework this ignore list.
-        ignoreExt = set((
-            '.pyc',
-            '.pyo',
-            '.o',
-            '.obj',
-            '.tgz',
-            '.zip',
-            '.tar',
-        ))
+        ignoreExt = app.buffer_file.kIgnoreExt
         try:
             contents = os.listdir(
                 os.path.expandvars(os.path.expanduser(dirPath)) or '.')
@@ -63,8 +63,8 @@ class DirectoryListController(app.controller.Controller):
         fileName = ''
         if len(pathInput) > 0 and pathInput[-1] != os.sep:
             dirPath, fileName = os.path.split(fullPath)
-            self.view.textBuffer.findRe = re.compile('()^' +
-                                                     re.escape(fileName))
+            self.view.textBuffer.findRe = re.compile(
+                '()^' + re.escape(fileName), re.MULTILINE)
         else:
             self.view.textBuffer.findRe = None
         dirPath = dirPath or '.'
@@ -0,0 +1,282 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  Search the files of a project tree for a pattern (see the `grep` command of
+  the InteractivePrompt).
+
+  The tree is walked a time slice at a time, skipping the files ignored by
+  .gitignore files or by extension (see app.buffer_file.kIgnoreExt). Batches
+  of files are searched in other processes and each result is written to a
+  text buffer, as a `path:row:column: line` link (see
+  app.buffer_file.pathRowColumn()), in the order the files were found.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+try:
+    unicode
+except NameError:
+    unicode = str
+    unichr = chr
+
+import fnmatch
+import io
+import os
+import re
+
+import app.background
+import app.buffer_file
+import app.config
+import app.log
+
+# The number of files searched by a single task in another process.
+kBatchFiles = 16
+# Files larger than this are not searched.
+kMaxFileBytes = 1 << 24
+# A file with a NUL in its first this many bytes is taken to be binary (and is
+# not searched).
+kBinaryCheckBytes = 1 << 13
+
+
+def readGitIgnore(dirPath):
+    """Get the rules of the .gitignore file in |dirPath|.
+
+    Returns:
+      A list of (pattern, negated, dirOnly, anchored) tuples; empty if there is
+      no .gitignore file.
+    """
+    rules = []
+    try:
+        with io.open(os.path.join(dirPath, u".gitignore"),
+                     encoding=u"utf-8",
+                     errors=u"replace") as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError):
+        return rules
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith(u"#"):
+            continue
+        negated = line.startswith(u"!")
+        if negated:
+            line = line[1:]
+        dirOnly = line.endswith(u"/")
+        line = line.rstrip(u"/")
+        # A pattern with a slash (other than at the end) is relative to the
+        # directory of the .gitignore.
+        anchored = u"/" in line
+        line = line.lstrip(u"/")
+        if line:
+            rules.append((line, negated, dirOnly, anchored))
+    return rules
+
+
+def isIgnored(ignores, relPath, isDir):
+    """Whether |relPath| is ignored by the .gitignore rules that apply to it.
+
+    Args:
+      ignores (list): (dirRelPath, rules) for each directory from the root of
+          the walk to the one holding |relPath|, see readGitIgnore().
+      relPath (unicode): The path relative to the root of the walk, with '/'
+          separators.
+      isDir (bool): Whether |relPath| is a directory.
+    """
+    ignored = False
+    name = relPath.rsplit(u"/", 1)[-1]
+    for dirRelPath, rules in ignores:
+        if dirRelPath:
+            localPath = relPath[len(dirRelPath) + 1:]
+        else:
+            localPath = relPath
+        for pattern, negated, dirOnly, anchored in rules:
+            if dirOnly and not isDir:
+                continue
+            if fnmatch.fnmatchcase(localPath if anchored else name, pattern):
+                ignored = not negated
+    return ignored
+
+
+def projectFiles(root):
+    """Yield the paths of the files in the tree at |root| that aren't ignored,
+    in sorted order."""
+    if app.config.strict_debug:
+        assert isinstance(root, unicode)
+    ignoreExt = app.buffer_file.kIgnoreExt
+    # Each entry is (dirPath, dirRelPath, ignores).
+    pending = [(root, u"", [(u"", readGitIgnore(root))])]
+    while pending:
+        dirPath, dirRelPath, ignores = pending.pop()
+        try:
+            names = sorted(os.listdir(dirPath))
+        except OSError as e:
+            app.log.info(u"unable to list", dirPath, e)
+            continue
+        subdirs = []
+        for name in names:
+            if name == u".git":
+                continue
+            path = os.path.join(dirPath, name)
+            relPath = dirRelPath + u"/" + name if dirRelPath else name
+            isDir = os.path.isdir(path)
+            if isDir and os.path.islink(path):
+                # Avoid walking a tree more than once (or forever).
+                continue
+            if isIgnored(ignores, relPath, isDir):
+                continue
+            if isDir:
+                rules = readGitIgnore(path)
+                subdirs.append(
+                    (path, relPath,
+                     ignores + [(relPath, rules)] if rules else ignores))
+            elif os.path.splitext(name)[1] not in ignoreExt:
+                yield path
+        # Walk the subdirectories in order, after the files of this one.
+        pending.extend(reversed(subdirs))
+
+
+def grepFiles(paths, pattern, flags):
+    """Search the files in |paths| for |pattern|.
+
+    This is called in another process, so the arguments and result are simple
+    (picklable) values.
+
+    Returns:
+      A list of (path, row, column, line) for the first match in each line,
+      where row and column are zero based.
+    """
+    regex = re.compile(pattern, flags)
+    results = []
+    for path in paths:
+        try:
+            if os.path.getsize(path) > kMaxFileBytes:
+                continue
+            with io.open(path, u"rb") as f:
+                data = f.read()
+        except (IOError, OSError):
+            continue
+        if b"\0" in data[:kBinaryCheckBytes]:
+            continue
+        data = data.decode(u"utf-8", u"replace")
+        row = 0
+        counted = 0
+        lineEnd = -1
+        for match in regex.finditer(data):
+            begin = match.start()
+            if begin <= lineEnd:
+                # Only the first match in a line is reported.
+                continue
+            row += data.count(u"\n", counted, begin)
+            counted = begin
+            lineBegin = data.rfind(u"\n", 0, begin) + 1
+            lineEnd = data.find(u"\n", begin)
+            if lineEnd < 0:
+                lineEnd = len(data)
+            results.append((path, row, begin - lineBegin,
+                            data[lineBegin:lineEnd].rstrip(u"\r")))
+    return results
+
+
+class ProjectGrep:
+    """Search the files under |root| for |regex|, writing the results to
+    |textBuffer|."""
+
+    def __init__(self, regex, root, textBuffer, executor, maxPending):
+        """
+        Args:
+          regex (compiled regex): The pattern to find.
+          root (unicode): The directory to search.
+          textBuffer (TextBuffer): The results are appended to this buffer.
+          executor (concurrent.futures.Executor): Runs grepFiles(); or None to
+              search in this process.
+          maxPending (int): The most batches to have waiting on |executor|.
+        """
+        self.regex = regex
+        self.textBuffer = textBuffer
+        self.executor = executor
+        self.maxPending = maxPending
+        self._files = projectFiles(root)
+        self._batch = []
+        self._walked = False
+        # The futures of the batches given to |executor|, in walk order.
+        self._pending = []
+        self.fileCount = 0
+        self.matchCount = 0
+
+    def step(self, bgThread=None):
+        """Walk and search more of the tree.
+
+        Args:
+          bgThread (BackgroundThread): Stop early when it should yield (see
+              BackgroundThread.shouldYield()). If None, search all of it.
+
+        Returns:
+          Whether the search is finished; or app.background.kTaskWaiting when
+          waiting on a result, |bgThread| is woken once it is ready.
+        """
+        while True:
+            self._writeDone()
+            if self._walked and not self._batch and not self._pending:
+                return True
+            if bgThread is not None and bgThread.shouldYield():
+                return False
+            if len(self._pending) >= self.maxPending or (self._walked and
+                                                        not self._batch):
+                # Wait for a result.
+                if bgThread is not None:
+                    self._pending[0].add_done_callback(
+                        lambda future: bgThread.wake())
+                    return app.background.kTaskWaiting
+                self._pending[0].result()
+                continue
+            if not self._walked:
+                path = next(self._files, None)
+                if path is None:
+                    self._walked = True
+                else:
+                    self.fileCount += 1
+                    self._batch.append(path)
+                    if len(self._batch) < kBatchFiles:
+                        continue
+            if self._batch:
+                self._submit(self._batch)
+                self._batch = []
+
+    def _submit(self, paths):
+        pattern, flags = self.regex.pattern, self.regex.flags
+        if self.executor is None:
+            self._write(grepFiles(paths, pattern, flags))
+            return
+        self._pending.append(
+            self.executor.submit(grepFiles, paths, pattern, flags))
+
+    def _writeDone(self):
+        """Write the results of the completed batches (in order)."""
+        pending = self._pending
+        while pending and pending[0].done():
+            future = pending.pop(0)
+            try:
+                self._write(future.result())
+            except Exception as e:
+                app.log.exception(e)
+
+    def _write(self, results):
+        if not results:
+            return
+        self.matchCount += len(results)
+        text = u"".join(u"%s:%d:%d: %s\n" % (path, row + 1, col + 1, line)
+                        for path, row, col, line in results)
+        parser = self.textBuffer.parser
+        # The data is empty or ends with a new line, so the last row is empty.
+        parser.insert(parser.rowCount() - 1, 0, text)
@@ -30,9 +30,12 @@ Command line help
   -               Read from standard in.
   --              Treat remaining arguments as file names.
   --clearHistory  Cleanup the file (and undo) into in ~/.ci_edit/.
-  --log           Display logging and debug info.
   --help          Print this help message then exit.
   --keys          Print key bindings then exit.
+  --latencyReport Print the input to screen latency on exit.
+  --log           Display logging and debug info.
+  --recordInput   Record the input to ~/.ci_edit/input_<time>.log (see
+                  python -m app.bench --replay).
   --singleThread  Do not use a background thread for parsing.
   --test          Run unit tests and exit.
   --version       Print version and license information then exit.\
@@ -0,0 +1,204 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  View and edit binary files as hex.
+
+  Each row shows the offset of its first byte, the bytes in hex, and the bytes
+  as ASCII, e.g.
+  00000010  6c 1b 00 5a 08 00 64 00  00 64 01 00 6c 1c 00 5a  |l..Z..d..d..l..Z|
+  The rows are generated as they are drawn, from a memory map of the file.
+  Bytes are edited in place (the file size doesn't change), the modified pages
+  are kept separately and only those pages are written when saving.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+try:
+    unicode
+except NameError:
+    unicode = str
+    unichr = chr
+
+import io
+import mmap
+import os
+
+import app.config
+import app.large_file
+import app.parser
+
+kBytesPerRow = 16
+# The row text column of the first hex digit.
+kHexCol = 10
+# The row text column of the first ASCII character.
+kAsciiCol = kHexCol + 3 * kBytesPerRow + 3
+# Modified bytes are tracked (and written) in pages of this size.
+kPageBytes = 4096
+
+
+def hexColumn(index):
+    """The row text column of the byte at |index| within the row."""
+    return kHexCol + 3 * index + (index >= kBytesPerRow // 2)
+
+
+class HexParser(app.large_file.LargeFileParser):
+    """A stand-in for app.parser.Parser that presents bytes as hex rows.
+
+    See app.large_file.LargeFileParser for the methods that are provided.
+    """
+
+    def __init__(self, appPrefs, path):
+        self.appPrefs = appPrefs
+        self._defaultGrammar = appPrefs.grammars['none']
+        self.emptyNode = app.parser.ParserNode(self._defaultGrammar, None, None,
+                                               0)
+        self._size = os.path.getsize(path)
+        if self._size:
+            with io.open(path, 'rb') as inputFile:
+                self._map = mmap.mmap(inputFile.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+        else:
+            # An empty file can't be mapped.
+            self._map = b""
+        # Modified pages; {page index: bytearray}.
+        self._pages = {}
+        self.resumeAtRow = self.rowCount()
+        self.pauseAtRow = 0
+        self._rowCache = {}
+        # See Parser.generation.
+        self.generation = 0
+
+    @property
+    def data(self):
+        """The text of all the rows (slow for a large file, prefer
+        rowText())."""
+        return u"\n".join(
+            [self.rowTextAndWidth(i)[0] for i in range(self.rowCount())])
+
+    def close(self):
+        if self._size:
+            self._map.close()
+
+    def byteCount(self):
+        return self._size
+
+    def byteRange(self, begin, end):
+        """Get the bytes from |begin| to |end|, including modifications."""
+        if app.config.strict_debug:
+            assert 0 <= begin <= end
+        end = min(end, self._size)
+        if not self._pages:
+            return self._map[begin:end]
+        out = bytearray()
+        while begin < end:
+            page, pageOffset = divmod(begin, kPageBytes)
+            stop = min(end, (page + 1) * kPageBytes)
+            modified = self._pages.get(page)
+            if modified is None:
+                out += self._map[begin:stop]
+            else:
+                out += modified[pageOffset:pageOffset + stop - begin]
+            begin = stop
+        return bytes(out)
+
+    def setBytes(self, offset, data):
+        """Replace the bytes at |offset| with |data|."""
+        if app.config.strict_debug:
+            assert isinstance(data, bytes)
+            assert 0 <= offset and offset + len(data) <= self._size
+        for i, value in enumerate(bytearray(data)):
+            page, pageOffset = divmod(offset + i, kPageBytes)
+            modified = self._pages.get(page)
+            if modified is None:
+                modified = bytearray(self._map[page * kPageBytes:(page + 1) *
+                                               kPageBytes])
+                self._pages[page] = modified
+            modified[pageOffset] = value
+        for row in range(offset // kBytesPerRow,
+                         (offset + len(data) - 1) // kBytesPerRow + 1):
+            self._rowCache.pop(row, None)
+        self.generation += 1
+
+    def modifiedPages(self):
+        """Get the (offset, bytes) of each modified page, in order."""
+        return [(page * kPageBytes, bytes(self._pages[page]))
+                for page in sorted(self._pages)]
+
+    def markSaved(self):
+        """Drop the modified pages, once they have been written to the (mapped)
+        file."""
+        self._pages = {}
+
+    def byteAtRowCol(self, row, col):
+        """Find the byte displayed at |row|, |col|.
+
+        Returns:
+          (offset, nibble) where |nibble| is 0 or 1 for the high or low hex
+          digit and None for the ASCII column. None if there is no byte there.
+        """
+        index = None
+        nibble = None
+        if kHexCol <= col < kAsciiCol:
+            relative = col - kHexCol
+            half = 3 * (kBytesPerRow // 2)
+            if relative >= half:
+                relative -= 1
+                if relative < half:
+                    return None  # The gap between the groups.
+            index, nibble = divmod(relative, 3)
+            if nibble == 2:
+                return None  # The space between bytes.
+        elif kAsciiCol <= col < kAsciiCol + kBytesPerRow:
+            index = col - kAsciiCol
+        if index is None or index >= kBytesPerRow:
+            return None
+        offset = row * kBytesPerRow + index
+        if offset >= self._size:
+            return None
+        return offset, nibble
+
+    def byteRowCol(self, offset, nibble):
+        """The inverse of byteAtRowCol()."""
+        row, index = divmod(offset, kBytesPerRow)
+        if nibble is None:
+            return row, kAsciiCol + index
+        return row, hexColumn(index) + nibble
+
+    def indexRows(self, bgThread, endRow, leash=None):
+        # The rows are a fixed number of bytes, there's nothing to find.
+        self.resumeAtRow = self.rowCount()
+
+    def rowCount(self):
+        return max(1, (self._size + kBytesPerRow - 1) // kBytesPerRow)
+
+    def rowTextAndWidth(self, row):
+        if app.config.strict_debug:
+            assert isinstance(row, int)
+        cached = self._rowCache.get(row)
+        if cached is not None:
+            return cached
+        offset = row * kBytesPerRow
+        values = bytearray(self.byteRange(offset, offset + kBytesPerRow))
+        cells = [u"%02x" % i for i in values]
+        cells += [u"  "] * (kBytesPerRow - len(cells))
+        half = kBytesPerRow // 2
+        text = u"%08x  %s  %s  |%s|" % (
+            offset, u" ".join(cells[:half]), u" ".join(cells[half:]),
+            u"".join([unichr(i) if 0x20 <= i < 0x7f else u"." for i in values]))
+        cached = (text, len(text))
+        if len(self._rowCache) >= app.large_file.kRowCacheSize:
+            self._rowCache.clear()
+        self._rowCache[row] = cached
+        return cached
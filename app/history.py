@@ -90,7 +90,7 @@ def calculateFileSize(filePath):
     return 0
 
 
-def getFileInfo(filePath, data=None):
+def getFileInfo(filePath, data=None, checksum=None):
     """
     Returns the hash value and size of the specified file.
     The second argument can be passed in if a file's data has
@@ -100,11 +100,14 @@ def getFileInfo(filePath, data=None):
       filePath (str): The absolute path to the file.
       data (str): Defaults to None. This is the data
         returned by calling read() on a file object.
+      checksum (str): Defaults to None. The calculateChecksum() of the
+        file's data, if it is already known.
 
     Returns:
       A tuple containing the checksum and size of the file.
     """
-    checksum = calculateChecksum(filePath, data)
+    if checksum is None:
+        checksum = calculateChecksum(filePath, data)
     fileSize = calculateFileSize(filePath)
     return (checksum, fileSize)
 
@@ -156,7 +159,7 @@ class History():
         except Exception as e:
             app.log.exception(e)
 
-    def getFileHistory(self, filePath, data=None):
+    def getFileHistory(self, filePath, data=None, checksum=None):
         """
         Takes in an file path and an optimal data
         argument and checks for the current file's history.
@@ -169,11 +172,13 @@ class History():
           filePath (str): The absolute path to the file.
           data (str): Defaults to None. This is the data
             returned by calling read() on a file object.
+          checksum (str): Defaults to None. The calculateChecksum() of the
+            file's data, if it is already known.
 
         Returns:
           The file history (dict) of the desired file if it exists.
         """
-        checksum, fileSize = getFileInfo(filePath, data)
+        checksum, fileSize = getFileInfo(filePath, data, checksum)
         if checksum is None:
             fileHistory = {}
         else:
@@ -0,0 +1,230 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  Record the input of a session, so that it may be replayed (see
+  app.bench.replayLog()).
+
+  The log is the batches of (ch, eventInfo) commands that
+  CiProgram.commandLoop() hands to ProgramWindow.executeCommandList(), with
+  the time each batch was read. The file is:
+    kMagic
+    the header: the (working directory, command line arguments, screen rows,
+        screen columns) as a value
+    for each batch:
+      the microseconds since the prior batch (or the header), as a varint
+      the cmdList, as a value
+
+  A varint is an unsigned integer, seven bits per byte (low bits first), with
+  the high bit set on all but the last byte. A value is a type byte followed
+  by:
+    kNone: nothing.
+    kInt: the zigzag encoded (see zigzag()) integer, as a varint.
+    kFloat: a little endian double.
+    kBytes, kUnicode: the length (in bytes), as a varint, then the (utf-8)
+        bytes.
+    kTuple: the count of items, as a varint, then each value.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+try:
+    unicode
+except NameError:
+    unicode = str
+    unichr = chr
+
+import io
+import struct
+import time
+
+import app.config
+import app.log
+
+kMagic = b"ciInput1"
+kNone = 0
+kInt = 1
+kFloat = 2
+kBytes = 3
+kUnicode = 4
+kTuple = 5
+kDouble = struct.Struct('<d')
+
+
+def zigzag(value):
+    """Map a signed integer to an unsigned one (0, -1, 1, -2... to 0, 1, 2,
+    3...) so that small negative numbers have short varints."""
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value // 2 if not value & 1 else -(value + 1) // 2
+
+
+def encodeVarint(value, out):
+    """Append |value| (a non-negative int) to |out| (a bytearray)."""
+    if app.config.strict_debug:
+        assert value >= 0, value
+    while value > 0x7f:
+        out.append(0x80 | (value & 0x7f))
+        value >>= 7
+    out.append(value)
+
+
+def encodeValue(value, out):
+    """Append |value| to |out| (a bytearray). See the module docstring."""
+    if value is None:
+        out.append(kNone)
+    elif isinstance(value, bool):
+        raise TypeError(u"unexpected input value %r" % (value,))
+    elif isinstance(value, int):
+        out.append(kInt)
+        encodeVarint(zigzag(value), out)
+    elif isinstance(value, float):
+        out.append(kFloat)
+        out += kDouble.pack(value)
+    elif isinstance(value, bytes):
+        out.append(kBytes)
+        encodeVarint(len(value), out)
+        out += value
+    elif isinstance(value, unicode):
+        data = value.encode(u"utf-8")
+        out.append(kUnicode)
+        encodeVarint(len(data), out)
+        out += data
+    elif isinstance(value, (tuple, list)):
+        out.append(kTuple)
+        encodeVarint(len(value), out)
+        for i in value:
+            encodeValue(i, out)
+    else:
+        raise TypeError(u"unexpected input value %r" % (value,))
+
+
+class Decoder:
+    """Read the values encoded in |data| (bytes)."""
+
+    def __init__(self, data):
+        self.data = bytearray(data)
+        self.offset = 0
+
+    def atEnd(self):
+        return self.offset >= len(self.data)
+
+    def varint(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.data[self.offset]
+            self.offset += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def take(self, length):
+        """Get the next |length| bytes."""
+        offset = self.offset
+        self.offset += length
+        if self.offset > len(self.data):
+            raise IndexError(u"input log data ends early")
+        return bytes(self.data[offset:self.offset])
+
+    def value(self):
+        kind = self.data[self.offset]
+        self.offset += 1
+        if kind == kNone:
+            return None
+        if kind == kInt:
+            return unzigzag(self.varint())
+        if kind == kFloat:
+            return kDouble.unpack(self.take(kDouble.size))[0]
+        if kind in (kBytes, kUnicode):
+            data = self.take(self.varint())
+            return data if kind == kBytes else data.decode(u"utf-8")
+        if kind == kTuple:
+            return tuple([self.value() for _ in range(self.varint())])
+        raise ValueError(u"unknown value type %d at offset %d" %
+                         (kind, self.offset - 1))
+
+
+class InputRecorder:
+    """Write the batches of input to a log file."""
+
+    def __init__(self, path, cwd, args, screenSize):
+        """
+        Args:
+          path (unicode): The log file to create.
+          cwd (unicode): The working directory (for relative paths in
+              |args|).
+          args (list of unicode): The command line arguments.
+          screenSize (tuple of int): The (rows, columns) of the screen.
+        """
+        self.path = path
+        self.batchCount = 0
+        self._file = io.open(path, u"wb")
+        self._priorTime = time.time()
+        out = bytearray(kMagic)
+        encodeValue((cwd, tuple(args)) + tuple(screenSize), out)
+        self._file.write(bytes(out))
+        self._file.flush()
+
+    def record(self, when, cmdList):
+        """Append a batch.
+
+        The file is flushed, so that the log is complete even if the
+        editor doesn't exit normally.
+
+        Args:
+          when (float): The time the first command was read.
+          cmdList (list): The (ch, eventInfo) commands.
+        """
+        out = bytearray()
+        encodeVarint(max(0, int((when - self._priorTime) * 1000000)), out)
+        self._priorTime = max(when, self._priorTime)
+        encodeValue(cmdList, out)
+        self._file.write(bytes(out))
+        self._file.flush()
+        self.batchCount += 1
+
+    def close(self):
+        self._file.close()
+
+
+def readLog(path):
+    """Read a log written by InputRecorder.
+
+    Returns:
+      ((cwd, args, rows, cols), batches) where each batch is a (seconds
+      since the header, cmdList) tuple. The cmdList is a list of (ch,
+      eventInfo) tuples.
+    """
+    with io.open(path, u"rb") as f:
+        data = f.read()
+    if data[:len(kMagic)] != kMagic:
+        raise ValueError(u"%s is not an input log" % (path,))
+    decoder = Decoder(data[len(kMagic):])
+    header = decoder.value()
+    batches = []
+    seconds = 0.0
+    while not decoder.atEnd():
+        try:
+            seconds += decoder.varint() / 1000000.0
+            cmdList = decoder.value()
+        except IndexError:
+            # The last batch was cut short (e.g. the editor was killed).
+            app.log.info(u"truncated input log", path)
+            break
+        batches.append((seconds, list(cmdList)))
+    return header, batches
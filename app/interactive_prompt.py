@@ -105,18 +105,20 @@ class InteractivePrompt(app.controller.Controller):
             u'build': self.buildCommand,
             u'cua': self.changeToCuaMode,
             u'emacs': self.changeToEmacsMode,
+            u'grep': self.grepCommand,
             u'make': self.makeCommand,
             u'open': self.openCommand,
+            u'profile': self.profileCommand,
+            u's': self.substituteText,
             #u'split': self.splitCommand,  # Experimental wip.
+            u'sub': self.substituteText,
             u'vim': self.changeToVimNormalMode,
         }
         self.filters = {
             u'format': self.formatCommand,
             u'lower': self.lowerSelectedLines,
             u'numEnum': self.assignIndexToSelectedLines,
-            u's': self.substituteText,
             u'sort': self.sortSelectedLines,
-            u'sub': self.substituteText,
             u'upper': self.upperSelectedLines,
             u'wrap': self.wrapSelectedLines,
         }
@@ -170,6 +172,28 @@ class InteractivePrompt(app.controller.Controller):
 
         return lines, u'Changed %d lines' % (len(lines),)
 
+    def grepCommand(self, cmdLine, view):
+        """Search the files under a directory (the current directory by
+        default) for a pattern. E.g. `grep "a b" app`.
+
+        The results are written to a new buffer, as `path:row:column:` links
+        (see the `open` command).
+        """
+        args = [kReUnquote.sub(u'\\2', i) for i in kReArgChain.findall(cmdLine)]
+        if len(args) not in (2, 3):
+            return {}, u'Usage: grep <pattern> [<directory>]'
+        root = args[2] if len(args) == 3 else u'.'
+        if not os.path.isdir(root):
+            return {}, u'Not a directory: ' + root
+        try:
+            regex = re.compile(args[1], re.MULTILINE)
+        except re.error as e:
+            return {}, u'Invalid pattern: ' + unicode(e)
+        textBuffer = view.program.bufferManager.newTextBuffer()
+        view.setTextBuffer(textBuffer)
+        textBuffer.grep(regex, root)
+        return {}, textBuffer.message[0]
+
     def makeCommand(self, cmdLine, view):
         return {}, u'making stuff'
 
@@ -193,6 +217,10 @@ class InteractivePrompt(app.controller.Controller):
             return self.openFile(path, view)
         return {}, u"Unable to open " + args[1]
 
+    def profileCommand(self, cmdLine, view):
+        """Start (or stop and write) the sampling profiler."""
+        return {}, view.program.toggleSampling()
+
     def openFile(self, path, view):
         textBuffer = view.program.bufferManager.loadTextBuffer(path)
         inputWindow = self.currentInputWindow()
@@ -237,7 +265,8 @@ class InteractivePrompt(app.controller.Controller):
                 else:
                     command = self.commands.get(cmd, self.unknownCommand)
                     message = command(cmdLine, self.view.host)[1]
-                    tb.setMessage(message)
+                    # The command may have changed the host's buffer.
+                    self.view.host.textBuffer.setMessage(message)
         except Exception as e:
             app.log.exception(e)
             tb.setMessage(u'Execution threw an error.')
@@ -311,27 +340,21 @@ class InteractivePrompt(app.controller.Controller):
         lines.sort()
         return lines, u'Changed %d lines' % (len(lines),)
 
-    def substituteText(self, cmdLine, lines):
+    def substituteText(self, cmdLine, view):
+        """Replace a pattern within the selection (or the whole document if
+        nothing is selected). E.g. `s/foo/bar/`.
+
+        The replacement is made by a ReplaceAll, see Actions.findReplace().
+        """
         if len(cmdLine) < 2:
-            return (lines, u'''tip: %s/foo/bar/ to replace 'foo' with 'bar'.'''
-                    % (cmdLine,))
-        if not lines:
-            return lines, u'No text was selected.'
-        sre = re.match('\w+(\W)', cmdLine)
+            return {}, (u'''tip: %s/foo/bar/ to replace 'foo' with 'bar'.'''
+                        % (cmdLine,))
+        sre = re.match(u'\w+(\W)', cmdLine)
         if not sre:
-            return (lines, u'''Separator punctuation missing, example:'''
-                    u''' %s/foo/bar/''' % (cmdLine,))
-        separator = sre.groups()[0]
-        try:
-            _, find, replace, flags = cmdLine.split(separator, 3)
-        except ValueError:
-            return (lines, u'''Separator punctuation missing, there should be'''
-                    u''' three '%s'.''' % (separator,))
-        data = self.view.host.textBuffer.parser.data
-        output = self.view.host.textBuffer.findReplaceText(
-            find, replace, flags, data)
-        lines = output.split(u"\n")
-        return lines, u'Changed %d lines' % (len(lines),)
+            return {}, (u'''Separator punctuation missing, example:'''
+                        u''' %s/foo/bar/''' % (cmdLine,))
+        view.textBuffer.findReplace(cmdLine[sre.start(1):])
+        return {}, view.textBuffer.message[0]
 
     def upperSelectedLines(self, cmdLine, lines):
         lines = [line.upper() for line in lines]
@@ -0,0 +1,220 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  View files that are too large to load into memory.
+
+  The file is memory-mapped rather than read and decoded as a whole. The
+  offsets of the rows are found as they are needed, and only the rows that are
+  displayed (or searched) are decoded.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+try:
+    unicode
+except NameError:
+    unicode = str
+    unichr = chr
+
+import array
+import io
+import mmap
+import re
+
+import app.config
+import app.curses_util
+import app.parser
+
+# Rows are indexed in batches of this many bytes.
+kIndexBatchBytes = 16 * 1024 * 1024
+# A parse() call indexes at most this many batches (so that other work, such
+# as drawing, isn't held up).
+kIndexBatchesPerParse = 4
+# The number of decoded rows to keep.
+kRowCacheSize = 1000
+kNewLineRe = re.compile(b"\n")
+
+
+class LargeFileParser:
+    """A read-only stand-in for app.parser.Parser.
+
+    Only the methods needed to view (and search) the document are provided.
+    The rows are not parsed, each row is entirely the root grammar.
+    """
+
+    def __init__(self, appPrefs, path):
+        self.appPrefs = appPrefs
+        self._defaultGrammar = appPrefs.grammars['none']
+        self.emptyNode = app.parser.ParserNode(self._defaultGrammar, None, None,
+                                               0)
+        with io.open(path, 'rb') as inputFile:
+            # The map remains valid after the file is closed.
+            self._map = mmap.mmap(inputFile.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        # The byte offset of the start of each row found so far.
+        self._rowStarts = array.array('q', [0])
+        # The rows are known up to this byte offset.
+        self._indexedTo = 0
+        # As with Parser, rows prior to |resumeAtRow| are complete.
+        self.resumeAtRow = 0
+        self.pauseAtRow = 0
+        # Decoded rows; {row: (text, width)}.
+        self._rowCache = {}
+        # See Parser.generation. The rows of a large file don't change.
+        self.generation = 0
+
+    @property
+    def data(self):
+        """The whole document.
+
+        This decodes the entire file, which is what this class is meant to
+        avoid. Prefer rowText().
+        """
+        return self._map[:].decode(u"utf-8", u"replace")
+
+    def close(self):
+        self._map.close()
+
+    def defaultGrammar(self):
+        return self._defaultGrammar
+
+    def indexRows(self, bgThread, endRow, leash=None):
+        """Find the rows through |endRow|.
+
+        Args:
+          bgThread (BackgroundThread): If not None, stop early when it should
+              yield (see BackgroundThread.shouldYield()).
+          endRow (int): The last row needed.
+          leash (int): If not None, stop after indexing this many batches.
+        """
+        rowStarts = self._rowStarts
+        limit = len(self._map)
+        while self._indexedTo < limit and len(rowStarts) <= endRow + 1:
+            if bgThread is not None and bgThread.shouldYield():
+                break
+            if leash is not None:
+                if leash <= 0:
+                    break
+                leash -= 1
+            end = min(self._indexedTo + kIndexBatchBytes, limit)
+            found = kNewLineRe.finditer(self._map, self._indexedTo, end)
+            rowStarts.extend([i.end() for i in found])
+            self._indexedTo = end
+        if self._indexedTo < limit:
+            # The end of the last row found is not yet known.
+            self.resumeAtRow = len(rowStarts) - 1
+        else:
+            self.resumeAtRow = len(rowStarts)
+
+    def parse(self, bgThread, data, grammar, beginRow, endRow):
+        """Similar to Parser.parse(), except that |data| is ignored (the file
+        is read as needed) and no grammars are applied."""
+        if grammar is not self._defaultGrammar:
+            self.generation += 1
+        self._defaultGrammar = grammar
+        self.emptyNode = app.parser.ParserNode(grammar, None, None, 0)
+        self.indexRows(bgThread, endRow, kIndexBatchesPerParse)
+
+    def rowCount(self):
+        """The number of rows found so far.
+
+        The count increases as more of the file is indexed, see indexRows().
+        """
+        return len(self._rowStarts)
+
+    def rowTextAndWidth(self, row):
+        if app.config.strict_debug:
+            assert isinstance(row, int)
+        cached = self._rowCache.get(row)
+        if cached is not None:
+            return cached
+        self.indexRows(None, row)
+        begin = self._rowStarts[row]
+        if row + 1 < len(self._rowStarts):
+            end = self._rowStarts[row + 1] - 1
+        else:
+            end = len(self._map)
+        if end > begin and self._map[end - 1:end] == b"\r":
+            end -= 1
+        text = self._map[begin:end].decode(u"utf-8", u"replace")
+        cached = (text, app.curses_util.columnWidth(text))
+        if len(self._rowCache) >= kRowCacheSize:
+            self._rowCache.clear()
+        self._rowCache[row] = cached
+        return cached
+
+    def rowText(self, row, beginCol=None, endCol=None):
+        """See Parser.rowText()."""
+        text, width = self.rowTextAndWidth(row)
+        if beginCol is endCol is None:
+            return text
+        if beginCol < 0:
+            beginCol = max(width + beginCol, 0)
+        if endCol is None:
+            endCol = width
+        elif endCol < 0:
+            endCol = width + endCol
+        return app.curses_util.renderedSubStr(text, beginCol, endCol)
+
+    def rowWidth(self, row):
+        if row < 0:
+            row = self.rowCount() + row
+        return self.rowTextAndWidth(row)[1]
+
+    def charAt(self, row, col):
+        self.indexRows(None, row)
+        if row >= self.rowCount():
+            return None
+        text, width = self.rowTextAndWidth(row)
+        if col > width:
+            return None
+        return app.curses_util.charAtColumn(col, text)
+
+    def inDocument(self, row, col):
+        self.indexRows(None, row)
+        return row < self.rowCount() and col <= self.rowWidth(row)
+
+    def grammarAt(self, row, col):
+        return self._defaultGrammar
+
+    def grammarIndexFromRowCol(self, row, col):
+        # Each row is a single grammar.
+        return 0
+
+    def grammarAtIndex(self, row, col, index):
+        """See Parser.grammarAtIndex()."""
+        width = self.rowWidth(row)
+        if index > 0 or col >= width:
+            return self.emptyNode, 0, 0, True
+        return (app.parser.ParserNode(self._defaultGrammar, None, None, 0), col,
+                width - col, False)
+
+    def grammarTextAt(self, row, col):
+        return self.rowText(row), None
+
+    def nextCharRowCol(self, row, col):
+        """See Parser.nextCharRowCol()."""
+        ch = self.charAt(row, col)
+        if ch is None:
+            return (1, -col) if self.inDocument(row + 1, 0) else None
+        return 0, app.curses_util.charWidth(ch, col)
+
+    def priorCharRowCol(self, row, col):
+        """See Parser.priorCharRowCol()."""
+        if col == 0:
+            if row == 0:
+                return None
+            return (-1, self.rowWidth(row - 1))
+        return 0, app.curses_util.priorCharCol(col, self.rowText(row)) - col
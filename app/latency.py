@@ -0,0 +1,164 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  Measure the time from reading input to painting the result on screen.
+
+  Each batch of input passes through these stages:
+    queue: from reading the first key of the batch (getCh) until the commands
+        begin to execute (in the background thread).
+    execute: executeCommandList().
+    render: until the frame showing the batch is drawn (a frame may show
+        several batches).
+    handoff: until the main thread takes the frame.
+    refresh: painting the frame to the screen.
+  The total is the sum of these.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+import threading
+
+kStages = (u"queue", u"execute", u"render", u"handoff", u"refresh", u"total")
+# The histogram buckets grow by this factor, i.e. the percentiles are within
+# about 5%.
+kBucketGrowth = 1.05
+# The upper bound of the first bucket, in seconds.
+kSmallestBucket = 0.00001
+
+
+class Histogram:
+    """Durations counted in exponentially sized buckets, so that percentiles
+    are found without keeping each sample."""
+
+    def __init__(self):
+        # {bucket index: count}.
+        self.buckets = {}
+        self.count = 0
+        self.peak = 0.0
+
+    def add(self, seconds):
+        if seconds <= kSmallestBucket:
+            bucket = 0
+        else:
+            bucket = int(
+                math.ceil(math.log(seconds / kSmallestBucket, kBucketGrowth)))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        if seconds > self.peak:
+            self.peak = seconds
+
+    def percentile(self, fraction):
+        """Get the duration (in seconds) that |fraction| of the samples are
+        at or below; or None if there are no samples."""
+        if not self.count:
+            return None
+        needed = max(1, int(math.ceil(self.count * fraction)))
+        for bucket in sorted(self.buckets):
+            needed -= self.buckets[bucket]
+            if needed <= 0:
+                return min(kSmallestBucket * kBucketGrowth**bucket, self.peak)
+        return self.peak
+
+
+class LatencyTracker:
+    """Collect the stage times of each batch of input.
+
+    Batches are identified by the total number of commands processed,
+    including the batch (the same count is given to the frame that shows
+    it). The methods are called from both the main and background threads.
+    """
+
+    def __init__(self):
+        self.histograms = dict((stage, Histogram()) for stage in kStages)
+        self._lock = threading.Lock()
+        # {cmdCount: [input time, execute start, execute end]}.
+        self._batches = {}
+        # {cmdCount: [render end, handoff]} for frames not yet painted.
+        self._frames = {}
+
+    def inputRead(self, cmdCount, when):
+        with self._lock:
+            self._batches[cmdCount] = [when, None, None]
+
+    def executed(self, cmdCount, start, end):
+        with self._lock:
+            batch = self._batches.get(cmdCount)
+            if batch is not None:
+                batch[1] = start
+                batch[2] = end
+
+    def rendered(self, cmdCount, when):
+        with self._lock:
+            self._frames[cmdCount] = [when, None]
+
+    def handedOff(self, cmdCount, when):
+        with self._lock:
+            frame = self._frames.get(cmdCount)
+            if frame is not None:
+                frame[1] = when
+
+    def painted(self, cmdCount, when):
+        """Record the stages of each batch shown by the frame for
+        |cmdCount|."""
+        with self._lock:
+            frame = self._frames.pop(cmdCount, None)
+            if frame is None or frame[1] is None:
+                return
+            renderEnd, handoff = frame
+            for count in sorted(self._batches):
+                if count > cmdCount:
+                    break
+                inputTime, start, end = self._batches.pop(count)
+                if start is None:
+                    continue
+                histograms = self.histograms
+                histograms[u"queue"].add(start - inputTime)
+                histograms[u"execute"].add(end - start)
+                histograms[u"render"].add(renderEnd - end)
+                histograms[u"handoff"].add(handoff - renderEnd)
+                histograms[u"refresh"].add(when - handoff)
+                histograms[u"total"].add(when - inputTime)
+            for count in [i for i in self._frames if i < cmdCount]:
+                # These frames were replaced before being painted.
+                del self._frames[count]
+
+    def summary(self, stage=u"total"):
+        """A one line summary of |stage|, in milliseconds."""
+        histogram = self.histograms[stage]
+        if not histogram.count:
+            return u"%s n 0" % (stage,)
+        return u"%s n %d p50 %.1f p95 %.1f p99 %.1f ms" % (
+            stage, histogram.count, histogram.percentile(0.5) * 1000,
+            histogram.percentile(0.95) * 1000,
+            histogram.percentile(0.99) * 1000)
+
+    def report(self):
+        """A table of the percentiles of each stage, in milliseconds."""
+        lines = [
+            u"%-8s %7s %8s %8s %8s %8s" % (u"latency", u"count", u"p50",
+                                           u"p95", u"p99", u"max")
+        ]
+        for stage in kStages:
+            histogram = self.histograms[stage]
+            if not histogram.count:
+                lines.append(u"%-8s %7d" % (stage, 0))
+                continue
+            lines.append(u"%-8s %7d %8.2f %8.2f %8.2f %8.2f" % (
+                stage, histogram.count, histogram.percentile(0.5) * 1000,
+                histogram.percentile(0.95) * 1000,
+                histogram.percentile(0.99) * 1000, histogram.peak * 1000))
+        return u"\n".join(lines)
@@ -26,6 +26,7 @@ import sys
 import time
 
 import app.config
+import app.history
 import app.log
 import app.parser
 
@@ -34,8 +35,16 @@ class LineBuffer:
     def __init__(self, program):
         self.program = program
         self.isBinary = False
+        # Large files are viewed read-only (see app.large_file).
+        self.isLargeFile = False
         self.parser = app.parser.Parser(program.prefs)
         self.parserTime = 0.0
+        # The data that will be stored in the parse cache once it is fully
+        # parsed (see loadParseCache()).
+        self.parseCacheData = None
+        # The checksum of the data as loaded (see
+        # app.history.calculateChecksum()), if it has been computed.
+        self.parseCacheChecksum = None
         self.message = (u"New buffer", None)
         self.setFileType("words")
 
@@ -75,13 +84,58 @@ class LineBuffer:
 
     def doParse(self, begin, end):
         start = time.time()
-        self.parser.parse(self.program.bg, self.parser.data,
-                          self.rootGrammar, begin, end)
+        # Parse the current data (or, for a mapped file, read it as needed).
+        self.parser.parse(self.program.bg, None, self.rootGrammar, begin, end)
         self.debugUpperChangedRow = self.parser.resumeAtRow
         self.parserTime = time.time() - start
+        if (self.parseCacheData is not None and
+                self.parser.resumeAtRow >= self.parser.rowCount()):
+            if self.parser.store().isText(self.parseCacheData):
+                # The data is unchanged since it was loaded.
+                self.program.parseCache.save(self.parser,
+                                             self.parseCacheChecksum,
+                                             self.rootGrammar)
+            self.parseCacheData = None
+
+    def startParallelParse(self):
+        """Parse a large document in sections, using several processes."""
+        if (self.isMapped() or self.parser.resumeAtRow > 0 or
+                self.parser.dataLength() <
+                self.program.prefs.editor['parallelParseMinBytes']):
+            return
+        executor = self.program.getParseExecutor()
+        if executor is None:
+            return
+        self.parser.startParallelParse(executor, self.rootGrammar,
+                                       self.program.parseProcessCount())
+
+    def loadParseCache(self):
+        """Restore a stored parse of the document, if there is one. Otherwise
+        the parse will be stored once the document is fully parsed."""
+        self.parseCacheData = None
+        self.parseCacheChecksum = None
+        if self.isMapped():
+            return
+        data = self.parser.data
+        if len(data) < self.program.prefs.editor['parseCacheMinBytes']:
+            return
+        checksum = app.history.calculateChecksum(None, data)
+        # The file history is found with the same checksum (see
+        # restoreUserHistory()).
+        self.parseCacheChecksum = checksum
+        if not self.program.parseCache.load(self.parser, checksum,
+                                            self.rootGrammar):
+            self.parseCacheData = data
 
     def isEmpty(self):
-        return len(self.parser.data) == 0
+        if self.isMapped():
+            return False
+        return self.parser.dataLength() == 0
+
+    def isMapped(self):
+        """Whether the parser reads the document from a memory map (see
+        app.large_file and app.hex_view) rather than holding its text."""
+        return self.isLargeFile or self.isBinary
 
     def parseDocument(self):
         self.doParse(self.parser.resumeAtRow, sys.maxsize)
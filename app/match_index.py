@@ -0,0 +1,260 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  An index of the matches of the find pattern within a document.
+
+  The index is built in the background (see MatchIndex.build()) and kept up to
+  date with edits: matches after an edit are moved, and the data around the
+  edit is searched again (see MatchIndex.refresh()).
+
+  Rather than adding the change in length to each match after an edit, the
+  matches from an index on are offset by a pending shift. The next edit only
+  adjusts the matches between its position and that of the pending shift, so
+  a series of nearby edits is cheap however many matches follow them.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import array
+import bisect
+
+import app.config
+import app.piece_table
+
+# After an edit, the data this many characters before and after the change is
+# searched again (see MatchIndex.refresh()).
+kRefreshChars = 1 << 12
+
+
+class MatchIndex:
+    """The sorted (begin, end) data offsets of the matches of |regex|."""
+
+    def __init__(self, regex):
+        self.regex = regex
+        # The match offsets, in document order. Matches don't overlap, so both
+        # are sorted. The entries from |_shiftAt| on are |_shiftDelta| less
+        # than the offset they stand for (see _value()).
+        self.begins = array.array('q')
+        self.ends = array.array('q')
+        self._shiftAt = 0
+        self._shiftDelta = 0
+        # The matches beginning prior to this offset have been found (the
+        # initial build continues from here).
+        self.scannedTo = 0
+        # The (begin, end) of data changed since the last refresh(), or None.
+        self._dirty = None
+
+    def _value(self, values, index):
+        """Get the offset of |values|[|index|] (|values| is |begins| or
+        |ends|)."""
+        if index < 0:
+            index += len(values)
+        if index >= self._shiftAt:
+            return values[index] + self._shiftDelta
+        return values[index]
+
+    def _bisect(self, search, values, offset, low=0):
+        """Find |offset| in |values| (|begins| or |ends|) with |search|
+        (bisect.bisect_left or bisect.bisect_right)."""
+        shiftAt = self._shiftAt
+        if low < shiftAt:
+            index = search(values, offset, low, shiftAt)
+            if index < shiftAt:
+                return index
+            low = shiftAt
+        return search(values, offset - self._shiftDelta, low)
+
+    def _moveShift(self, index):
+        """Move the pending shift to begin at |index| (adjusting the entries
+        between the prior position and |index|)."""
+        shiftAt = self._shiftAt
+        delta = self._shiftDelta
+        if delta and index != shiftAt:
+            low, high = min(index, shiftAt), max(index, shiftAt)
+            if index < shiftAt:
+                delta = -delta
+            for values in (self.begins, self.ends):
+                values[low:high] = array.array(
+                    'q', [i + delta for i in values[low:high]])
+        self._shiftAt = index
+
+    def noteEdit(self, begin, removedLength, insertedLength):
+        """Adjust the index for an edit to the data (see Parser._noteEdit())."""
+        removedEnd = begin + removedLength
+        delta = insertedLength - removedLength
+        begins = self.begins
+        ends = self.ends
+        # Drop the matches that touch the edit, move those after it.
+        first = self._bisect(bisect.bisect_left, ends, begin)
+        last = self._bisect(bisect.bisect_right, begins, removedEnd)
+        if last < first:
+            last = first
+        # The search for the matches in their place begins at the first of
+        # them.
+        dirtyBegin = (min(self._value(begins, first), begin)
+                      if last > first else begin)
+        self._moveShift(last)
+        del begins[first:last]
+        del ends[first:last]
+        self._shiftAt = first
+        self._shiftDelta += delta
+        if self.scannedTo >= removedEnd:
+            self.scannedTo += delta
+        elif self.scannedTo > begin:
+            self.scannedTo = begin
+        if self._dirty is None:
+            self._dirty = (dirtyBegin, begin + insertedLength)
+            return
+        priorBegin, priorEnd = self._dirty
+        if priorEnd > removedEnd:
+            priorEnd += delta
+        elif priorEnd > begin:
+            priorEnd = begin + insertedLength
+        if priorBegin > removedEnd:
+            priorBegin += delta
+        elif priorBegin > begin:
+            priorBegin = begin
+        self._dirty = (min(priorBegin, dirtyBegin),
+                       max(priorEnd, begin + insertedLength))
+
+    def refresh(self, store):
+        """Search again around the data changed since the prior refresh().
+
+        The search is from |kRefreshChars| before the change to that many
+        after it. Matches beginning after that are assumed unchanged (and a
+        new match longer than that may be missed).
+        """
+        if self._dirty is None:
+            return
+        dirtyBegin, dirtyEnd = self._dirty
+        self._dirty = None
+        begins = self.begins
+        ends = self.ends
+        low = max(0, dirtyBegin - kRefreshChars)
+        first = self._bisect(bisect.bisect_left, ends, low)
+        if first < len(begins):
+            # Begin at a match (or between matches) to find the same ones.
+            low = min(low, self._value(begins, first))
+        high = min(dirtyEnd + kRefreshChars, self.scannedTo)
+        endPos = min(high + kRefreshChars, len(store))
+        regex = self.regex
+        window = app.piece_table.TextWindow(store)
+        found = []
+        offset = low
+        while offset < high:
+            match = window.search(regex, offset, endPos)
+            if match is None or window.base + match.start() >= high:
+                break
+            begin = window.base + match.start()
+            end = window.base + match.end()
+            found.append((begin, end))
+            offset = end if end > begin else end + 1
+        if found:
+            high = max(high, found[-1][1])
+        last = self._bisect(bisect.bisect_left, begins, high, first)
+        self._moveShift(last)
+        begins[first:last] = array.array('q', [i[0] for i in found])
+        ends[first:last] = array.array('q', [i[1] for i in found])
+        self._shiftAt = first + len(found)
+
+    def build(self, store, bgThread=None):
+        """Find more of the matches, continuing from |scannedTo|.
+
+        Args:
+          store (PieceTable): The document.
+          bgThread (BackgroundThread): Stop early when it should yield (see
+              BackgroundThread.shouldYield()). If None, find all the matches.
+
+        Returns:
+          Whether the index is complete.
+        """
+        self.refresh(store)
+        regex = self.regex
+        window = app.piece_table.TextWindow(store)
+        begins = self.begins
+        ends = self.ends
+        # The new matches are after the pending shift.
+        delta = self._shiftDelta
+        offset = self.scannedTo
+        length = len(store)
+        # An empty match may be at the end of the data.
+        while offset <= length:
+            if bgThread is not None and bgThread.shouldYield():
+                break
+            match = window.search(regex, offset)
+            if match is None:
+                offset = length
+                break
+            begin = window.base + match.start()
+            end = window.base + match.end()
+            begins.append(begin - delta)
+            ends.append(end - delta)
+            offset = end if end > begin else end + 1
+        self.scannedTo = max(offset, self.scannedTo)
+        return self.scannedTo >= length
+
+    def isComplete(self, length):
+        """Whether all the matches in data of |length| are in the index."""
+        return self._dirty is None and self.scannedTo >= length
+
+    def count(self):
+        return len(self.begins)
+
+    def spans(self, begin, end):
+        """Get the (begin, end) of the matches that overlap data[begin:end]."""
+        begins = self.begins
+        ends = self.ends
+        result = []
+        i = self._bisect(bisect.bisect_right, ends, begin)
+        while i < len(begins) and self._value(begins, i) < end:
+            result.append((self._value(begins, i), self._value(ends, i)))
+            i += 1
+        return result
+
+    def matchNumber(self, begin, end):
+        """Get the (one based) number of the match at |begin|, |end|; or None
+        if that is not a match."""
+        i = self._bisect(bisect.bisect_left, self.begins, begin)
+        if (i < len(self.begins) and self._value(self.begins, i) == begin and
+                self._value(self.ends, i) == end):
+            return i + 1
+        return None
+
+    def nextMatch(self, offset):
+        """Get the (begin, end, wrapped) of the first match beginning at or
+        after |offset|, wrapping to the first match; or None if there are no
+        matches."""
+        if app.config.strict_debug:
+            assert offset >= 0
+        if not self.begins:
+            return None
+        i = self._bisect(bisect.bisect_left, self.begins, offset)
+        if i < len(self.begins):
+            return self._value(self.begins, i), self._value(self.ends, i), False
+        return self._value(self.begins, 0), self._value(self.ends, 0), True
+
+    def priorMatch(self, offset):
+        """Get the (begin, end, wrapped) of the last match ending at or before
+        |offset|, wrapping to the last match; or None if there are no
+        matches."""
+        if app.config.strict_debug:
+            assert offset >= 0
+        if not self.begins:
+            return None
+        i = self._bisect(bisect.bisect_right, self.ends, offset) - 1
+        if i >= 0:
+            return self._value(self.begins, i), self._value(self.ends, i), False
+        return self._value(self.begins, -1), self._value(self.ends, -1), True
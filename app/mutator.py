@@ -35,6 +35,17 @@ def addVectors(a, b):
     return tuple([a[i] + b[i] for i in range(len(a))])
 
 
+def substitutedOffsets(offsets, olds, news):
+    """Get the offsets of the |news| after an 'sr' change (see
+    Parser.substitute()), given their |offsets| prior to it."""
+    result = []
+    delta = 0
+    for offset, old, new in zip(offsets, olds, news):
+        result.append(offset + delta)
+        delta += len(new) - len(old)
+    return result
+
+
 class Mutator(app.selectable.Selectable):
     """Track and enact changes to a body of text."""
 
@@ -272,22 +283,6 @@ class Mutator(app.selectable.Selectable):
             self.goalCol = self.penCol
         elif change[0] == 'j':  # Redo join lines (delete \n).
             self.parser.deleteChar(self.penRow, self.penCol)
-        elif change[0] == 'ld':  # Redo line diff.
-            assert False  # Not used.
-            lines = []
-            index = 0
-            for ii in change[1]:
-                if type(ii) is type(0):
-                    for line in self.parser.textLines(index, index + ii):
-                        lines.append(line)
-                    index += ii
-                elif ii[0] == '+':
-                    lines.append(ii[2:])
-                elif ii[0] == '-':
-                    index += 1
-            self.parser.data = lines.join(u"\n")
-            firstChangedRow = change[1][0] if type(
-                change[1][0]) is type(0) else 0
         elif change[0] == 'm':  # Redo move
             self.__redoMove(change)
         elif change[0] == 'ml':  # Redo move lines
@@ -296,6 +291,9 @@ class Mutator(app.selectable.Selectable):
         elif change[0] == 'n':  # Redo split lines (insert \n).
             self.parser.insert(self.penRow, self.penCol, u"\n")
             self.__redoMove(change[2])
+        elif change[0] == 'sr':  # Redo substitute (replace all).
+            offsets, olds, news = change[1]
+            self.parser.substitute(offsets, olds, news)
         elif change[0] == 'v':  # Redo paste.
             self.insertLines(change[1])
         elif change[0] == 'vb':  # Redo vertical backspace.
@@ -308,10 +306,30 @@ class Mutator(app.selectable.Selectable):
             self.__doVerticalDelete(change)
         elif change[0] == 'vi':  # Redo vertical insert.
             self.__doVerticalInsert(change)
+        elif change[0] == 'x':  # Redo overwrite bytes (see app.hex_view).
+            offset, old, new = change[1]
+            self.parser.setBytes(offset, new)
+            self.__redoMove(change[2])
         else:
             app.log.info('ERROR: unknown redo.')
         return False
 
+    def editRefused(self, changeType):
+        """Whether a change of |changeType| can't be made to this document.
+
+        A message is set if the change is refused.
+        """
+        if self.isLargeFile and changeType not in ('f', 'm'):
+            # Large files are viewed, not edited (see app.large_file).
+            self.setMessage(u'Large files are read only')
+            return True
+        if self.isBinary and changeType not in ('f', 'm', 'x'):
+            # Binary files are edited in place, by overwriting bytes (see
+            # app.hex_view).
+            self.setMessage(u'Type hex digits to edit a binary file')
+            return True
+        return False
+
     def redoAddChange(self, change):
         """
         Push a change onto the end of the redoChain. Call redo() to enact the
@@ -321,6 +339,8 @@ class Mutator(app.selectable.Selectable):
             assert isinstance(change, tuple), change
         if self.debugRedo:
             app.log.info('redoAddChange', change)
+        if self.editRefused(change[0]):
+            return
         # Handle new trivial actions, which are defined as standalone cursor
         # moves.
         if change[0] == 'm' and not self.__compoundChange:
@@ -433,22 +453,6 @@ class Mutator(app.selectable.Selectable):
             self.goalCol = self.penCol
         elif change[0] == 'j':  # Undo join lines.
             self.parser.insert(self.penRow, self.penCol, u"\n")
-        elif change[0] == 'ld':  # Undo line diff.
-            assert False  # Not used.
-            lines = []
-            index = 0
-            for ii in change[1]:
-                if type(ii) is type(0):
-                    for line in self.parser.textLines(index, index + ii):
-                        lines.append(line)
-                    index += ii
-                elif ii[0] == '+':
-                    index += 1
-                elif ii[0] == '-':
-                    lines.append(ii[2:])
-            self.parser.data = lines.join(u"\n")
-            firstChangedRow = change[1][0] if type(
-                change[1][0]) is type(0) else 0
         elif change[0] == 'm':
             self.__undoMove(change)
         elif change[0] == 'ml':
@@ -463,6 +467,10 @@ class Mutator(app.selectable.Selectable):
             # Undo split lines.
             self.__undoMove(change[2])
             self.parser.backspace(self.penRow + 1, 0)
+        elif change[0] == 'sr':  # Undo substitute.
+            offsets, olds, news = change[1]
+            self.parser.substitute(substitutedOffsets(offsets, olds, news),
+                                   news, olds)
         elif change[0] == 'v':  # undo paste
             clip = change[1]
             if len(clip) == 1:
@@ -479,6 +487,10 @@ class Mutator(app.selectable.Selectable):
             self.__doVerticalInsert(change)
         elif change[0] == 'vi':  # Undo vertical insert
             self.__doVerticalDelete(change)
+        elif change[0] == 'x':  # Undo overwrite bytes.
+            self.__undoMove(change[2])
+            offset, old, new = change[1]
+            self.parser.setBytes(offset, old)
         else:
             app.log.info('ERROR: unknown undo.')
 
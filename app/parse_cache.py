@@ -0,0 +1,150 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  Store completed parses on disk so that reopening an unchanged document
+  doesn't need to parse it again.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import hashlib
+import os
+
+import app.log
+
+# Increment this if the format of the cached data changes.
+kCacheVersion = 2
+
+
+class ParseCache:
+    """A directory of parse results.
+
+    Each entry is keyed by the checksum of the document (see
+    app.history.calculateChecksum()), the name of the root grammar, and the
+    checksum of the grammar definitions (see Prefs.grammarsChecksum). The least
+    recently used entries are removed when the total size exceeds |maxBytes|.
+    """
+
+    def __init__(self, cacheDirectory, maxBytes):
+        self.cacheDirectory = cacheDirectory
+        self.maxBytes = maxBytes
+
+    def _entryPath(self, checksum, grammar, grammarsChecksum):
+        hasher = hashlib.sha1()
+        hasher.update(u"{}:{}:{}".format(checksum, grammar['name'],
+                                         grammarsChecksum).encode(u"utf-8"))
+        return os.path.join(self.cacheDirectory, hasher.hexdigest() + '.parse')
+
+    def load(self, parser, checksum, grammar):
+        """Restore a prior parse of the |parser| data.
+
+        Args:
+          parser (Parser): The parse state is set if found in the cache.
+          checksum (str): The checksum of the parser data.
+          grammar (dict): The root grammar.
+
+        Returns:
+          True if the parse was found in the cache.
+        """
+        if self.cacheDirectory is None or checksum is None:
+            return False
+        path = self._entryPath(checksum, grammar,
+                               parser.appPrefs.grammarsChecksum)
+        if not os.path.isfile(path):
+            return False
+        try:
+            with open(path, 'rb') as cacheFile:
+                entry = pickle.load(cacheFile)
+            if entry.get('version') != kCacheVersion:
+                return False
+            parser.setParseState(grammar, entry['columns'], entry['rows'])
+            # Mark the entry as recently used.
+            os.utime(path, None)
+        except Exception as e:
+            app.log.info(u'failed to load parse cache', repr(path))
+            app.log.exception(e)
+            return False
+        app.log.info(u'parse cache hit', repr(path))
+        return True
+
+    def save(self, parser, checksum, grammar):
+        """Store the parse of the |parser| data (if it's complete).
+
+        Args:
+          parser (Parser): The parse state to store.
+          checksum (str): The checksum of the parser data.
+          grammar (dict): The root grammar.
+
+        Returns:
+          True if the parse was stored.
+        """
+        if self.cacheDirectory is None or checksum is None:
+            return False
+        state = parser.parseState()
+        if state is None:
+            return False
+        columns, rows = state
+        path = self._entryPath(checksum, grammar,
+                               parser.appPrefs.grammarsChecksum)
+        try:
+            if not os.path.isdir(self.cacheDirectory):
+                os.makedirs(self.cacheDirectory)
+            # Write to a temporary file so a partial entry is never read.
+            tempPath = path + '.tmp'
+            with open(tempPath, 'wb') as cacheFile:
+                pickle.dump({
+                    'version': kCacheVersion,
+                    'columns': columns,
+                    'rows': rows,
+                }, cacheFile, pickle.HIGHEST_PROTOCOL)
+            os.rename(tempPath, path)
+            self._evict()
+        except Exception as e:
+            app.log.info(u'failed to save parse cache', repr(path))
+            app.log.exception(e)
+            return False
+        return True
+
+    def _evict(self):
+        """Remove the least recently used entries to stay under |maxBytes|."""
+        entries = []
+        totalBytes = 0
+        for name in os.listdir(self.cacheDirectory):
+            if not name.endswith('.parse'):
+                continue
+            path = os.path.join(self.cacheDirectory, name)
+            fileStat = os.stat(path)
+            entries.append((fileStat.st_mtime, fileStat.st_size, path))
+            totalBytes += fileStat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if totalBytes <= self.maxBytes:
+                break
+            os.remove(path)
+            totalBytes -= size
+
+    def clear(self):
+        """Remove all entries."""
+        if self.cacheDirectory is None or not os.path.isdir(
+                self.cacheDirectory):
+            return
+        for name in os.listdir(self.cacheDirectory):
+            if name.endswith('.parse'):
+                os.remove(os.path.join(self.cacheDirectory, name))
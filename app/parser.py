@@ -23,6 +23,8 @@ except NameError:
     unicode = str
     unichr = chr
 
+import array
+import bisect
 import curses.ascii
 import os
 import re
@@ -33,8 +35,12 @@ import traceback
 
 import third_party.pyperclip as clipboard
 
+import app.bracket_index
 import app.config
 import app.log
+import app.parser_nodes
+import app.piece_table
+import app.prefs
 import app.selectable
 
 # Keys to tuples within |parserNodes|.
@@ -50,6 +56,31 @@ kPrior = 2
 # will start at kBegin = 3, kVisual = 2.
 kVisual = 3
 
+# The grammar stack is recorded every |kCheckpointRows| rows (see
+# _addCheckpoint()).
+kCheckpointRows = 500
+# Rows this far beyond the parse are read from a separate parse of the rows
+# around them (see _parseViewport()), rather than parsing everything prior.
+kViewportDistance = 500
+# Without a nearby checkpoint, the viewport parse begins this many rows before
+# the requested row (guessing that the root grammar is in effect there).
+kViewportLeadRows = 100
+# The viewport parse continues this many rows after the requested row.
+kViewportRows = 300
+# _fastLineParse() adds rows in batches of about this many characters.
+kFastParseBatch = 1 << 20
+kNewLineRe = re.compile(u"\n")
+# A backward find (see Parser.find()) searches a window of this many characters
+# prior to the pen first.
+kFindBackChars = 1 << 16
+# Characters that may not be one column wide, i.e. tabs and characters from the
+# first double width character onward (on a narrow build, astral characters
+# are surrogate pairs, which are within \u1100-\uffff).
+if sys.maxunicode > 0xffff:
+    kWideOrTabRe = re.compile(u"[\t\u1100-\U0010ffff]")
+else:
+    kWideOrTabRe = re.compile(u"[\t\u1100-\uffff]")
+
 
 class ParserNode:
     """A parser node represents a span of grammar. i.e. from this point to that
@@ -71,13 +102,86 @@ class ParserNode:
              self.visual, repr(data[self.begin:self.begin + 15])[1:-1]))
 
 
+class PriorParse:
+    """The parse of the document from before an edit.
+
+    After an edit the parser resumes at the edited row. Rather than reparse the
+    remainder of the document, the new parse is compared to the prior parse at
+    the start of each row. Once the grammar stacks match (past the edited text)
+    the rest of the prior parse is reused (shifted by the size of the edit).
+    """
+
+    def __init__(self, parserNodes, rows, beginRow, rowLimit, damage):
+        # The (complete) parserNodes and rows from before the edit.
+        self.parserNodes = parserNodes
+        self.rows = rows
+        # Rows at or after |rowLimit| were not thoroughly parsed (the last row
+        # begun, and those from _fastLineParse()) so they are not reused.
+        self.rowLimit = rowLimit
+        # An index into |rows|. The search for a matching row only moves
+        # forward, since the new parse only moves forward.
+        self.rowCursor = beginRow
+        # Text prior to |damageEnd| (an offset in the prior data) may have
+        # changed. Text after it is the same, though it has moved by |delta|.
+        self.damageEnd, self.delta = damage
+
+    def addDamage(self, damage):
+        """Include |damage| from a later edit (see Parser._noteEdit())."""
+        end, delta = damage
+        self.damageEnd = max(self.damageEnd, end - self.delta)
+        self.delta += delta
+
+
+class ParallelChunk:
+    """A section of the document being parsed by another process.
+
+    The chunk is parsed as if it were a separate document (i.e. beginning in
+    the root grammar). When the main parse reaches the chunk it's used like a
+    PriorParse; the main parse continues until its grammar stack agrees with
+    the chunk parse, then the remainder of the chunk parse is reused.
+    """
+
+    def __init__(self, grammar, begin, end, future):
+        self.grammar = grammar
+        # The offsets of the chunk within the document data.
+        self.begin = begin
+        self.end = end
+        # The result of parseChunk().
+        self.future = future
+
+
+def parseChunk(data, grammarName, grammarsChecksum):
+    """Parse |data| in full. This is run in a worker process.
+
+    Returns:
+        Parser.parseState() for |data|; or None if the grammars differ from
+        those of the calling process.
+    """
+    global _chunkPrefs
+    if _chunkPrefs is None:
+        _chunkPrefs = app.prefs.Prefs()
+    if _chunkPrefs.grammarsChecksum != grammarsChecksum:
+        return None
+    grammar = _chunkPrefs.grammars[grammarName]
+    parser = Parser(_chunkPrefs)
+    parser.parse(None, data, grammar, 0, sys.maxsize)
+    while parser.resumeAtRow < parser.rowCount():
+        parser.parse(None, data, grammar, parser.resumeAtRow, sys.maxsize)
+    return parser.parseState()
+
+
+# The Prefs used by parseChunk() (created once per worker process).
+_chunkPrefs = None
+
+
 class Parser:
     """A parser generates a set of grammar segments (ParserNode objects)."""
 
     def __init__(self, appPrefs):
         self.appPrefs = appPrefs
         self._defaultGrammar = appPrefs.grammars['none']
-        self.data = u""
+        # The document text. See the |data| property.
+        self._store = app.piece_table.PieceTable()
         self.emptyNode = ParserNode({}, None, None, 0)
         self.endNode = ({}, sys.maxsize, sys.maxsize, sys.maxsize)
         self.resumeAtRow = 0
@@ -86,25 +190,135 @@ class Parser:
         # ParserNode is returned from the parser it will be an instance of
         # ParserNode, but internally tuples are used in place of ParserNodes.
         # This makes for some ugly code, but the performance difference (~5%) is
-        # worth it.
-        self.parserNodes = [({}, 0, None, 0)]
+        # worth it. The tuples are stored in columns (see
+        # app.parser_nodes.ParserNodes) to save memory.
+        self.parserNodes = self._newParserNodes()
+        self.parserNodes.append(({}, 0, None, 0))
         # Each entry in |self.rows| is an index into the |self.parserNodes|
         # array to the parerNode that begins that row.
-        self.rows = [0]  # Row parserNodes index.
+        self.rows = app.parser_nodes.newRows()  # Row parserNodes index.
+        # The extent of edits to the data since the last call to
+        # _beginParsingAt(). This is the tuple (end, delta), where |end| is an
+        # offset in the data from before the edits and |delta| is the change in
+        # length; or None if the data was replaced. See _noteEdit().
+        self._editDamage = (0, 0)
+        # The lowest data offset edited since the last call to
+        # _beginParsingAt() (or None). The text before it is unchanged.
+        self._editBegin = None
+        # A PriorParse that may be reused by an incremental reparse (or None).
+        self._priorParse = None
+        # ParallelChunks, in document order. See startParallelParse().
+        self._parallelChunks = []
+        # Grammar stacks (tuples of grammars, root first) recorded at the start
+        # of some rows, keyed by the data offset of the row. The offsets are
+        # kept up to date with edits, though the stacks may be out of date
+        # until the parse catches up. See _addCheckpoint().
+        self._checkpointOffsets = []
+        self._checkpointStacks = []
+        # Checkpoints after this offset are replaced as the parse passes them.
+        self._checkpointFloor = -1
+        # A (firstRow, lastRow, parser) tuple for rows parsed ahead of the
+        # main parse (or None). See _parseViewport().
+        self._viewport = None
+        # The (resumeAtRow, row count, node count) where the parse stopped (or
+        # None). The rows and nodes after them are from _fastLineParse(), the
+        # parse continues from the last node before them.
+        self._stoppedAt = None
+        # The rows found by the last _fastLineParse() since the data changed;
+        # (begins, visuals, end shift) or None. See _reuseFastRows().
+        self._fastRows = None
+        # Incremented whenever the text or grammars of rows may have changed
+        # (e.g. so that cached drawing can be discarded).
+        self.generation = 0
+        # The MatchIndex of the find pattern, kept up to date with edits (or
+        # None). See Actions.findMatchIndex().
+        self.matchIndex = None
+        # The brackets of the parsed rows. See _indexBrackets().
+        self.bracketIndex = app.bracket_index.BracketIndex()
         app.log.parser('__init__')
 
+    @property
+    def data(self):
+        """The document as a single unicode string.
+
+        Edits are made to a piece table, so reading |data| after an edit will
+        join the pieces (once, until the next edit). Use store() to read part of
+        the document without joining (e.g. with a TextWindow).
+        """
+        return self._store.text()
+
+    @data.setter
+    def data(self, value):
+        self._store = app.piece_table.PieceTable(value)
+        # The whole document has changed, so the current parse can't be reused.
+        self._editDamage = None
+        self._editBegin = None
+        self._priorParse = None
+        self.cancelParallelParse()
+        self._checkpointOffsets = []
+        self._checkpointStacks = []
+        self._viewport = None
+        self._fastRows = None
+        self.matchIndex = None
+        self.bracketIndex.truncate(0)
+        self.generation += 1
+
+    def store(self):
+        """The PieceTable holding the document."""
+        return self._store
+
+    def dataLength(self):
+        """The length of the document (without joining the pieces)."""
+        return len(self._store)
+
+    def _newParserNodes(self):
+        return app.parser_nodes.ParserNodes(self.appPrefs.grammarList)
+
+    def _noteEdit(self, begin, removedLength, insertedLength):
+        """Record the extent of an edit to the data (for incremental parsing).
+        """
+        # Chunks parsed in parallel are of the prior data.
+        self.cancelParallelParse()
+        self._viewport = None
+        self._fastRows = None
+        self.generation += 1
+        if self.matchIndex is not None:
+            self.matchIndex.noteEdit(begin, removedLength, insertedLength)
+        # Move the checkpoints after the edit; drop those within it.
+        offsets = self._checkpointOffsets
+        first = bisect.bisect_right(offsets, begin)
+        last = bisect.bisect_right(offsets, begin + removedLength)
+        if first < len(offsets):
+            delta = insertedLength - removedLength
+            offsets[first:] = [i + delta for i in offsets[last:]]
+            del self._checkpointStacks[first:last]
+        if self._editBegin is None or begin < self._editBegin:
+            self._editBegin = begin
+        if self._editDamage is None:
+            return
+        end, delta = self._editDamage
+        self._editDamage = (max(end, begin + removedLength - delta),
+                            delta + insertedLength - removedLength)
+
+    def _storeDelete(self, begin, end):
+        self._noteEdit(begin, end - begin, 0)
+        self._store.delete(begin, end)
+
+    def _storeInsert(self, offset, text):
+        self._noteEdit(offset, 0, len(text))
+        self._store.insert(offset, text)
+
     def backspace(self, row, col):
         """Delete the character prior to |row, col|.
         Return the new (row, col) position."""
-        self._fullyParseTo(row)
         offset = self.dataOffset(row, col)
         if offset == 0:
             # Top of file, nothing to do.
             return row, col
         if offset is None:
             # Bottom of file (or past end of line, but assuming end of file).
-            offset = len(self.data)
-        ch = self.data[offset - 1]
+            offset = len(self._store)
+        ch = self._store[offset - 1]
         if ch == u"\n":
             row -= 1
             col = self.rowWidth(row)
@@ -114,10 +328,9 @@ class Parser:
             col -= 2
         else:
             col -= 1
-        self.data = self.data[:offset - 1] + self.data[offset:]
+        self._storeDelete(offset - 1, offset)
         self._beginParsingAt(row)
         if app.config.strict_debug:
-            assert isinstance(self.data, unicode)
             assert row >= 0
             assert col >= 0
         return row, col
@@ -133,7 +346,9 @@ class Parser:
         Returns: offset (int) into self.data buffer; or None if (row, col) is
             outside the document.
         """
-        self._fullyParseTo(row)
+        parser, row = self._parserForRow(row)
+        if parser is not self:
+            return parser.dataOffset(row, col)
         if row >= len(self.rows):
             return None
         rowIndex = self.rows[row]
@@ -156,11 +371,12 @@ class Parser:
         subnodeCol = subnode[kVisual] - node[kVisual]
         subnodeColDelta = col - subnodeCol
         offset = subnode[kBegin]
-        if self.data[offset] == u"\t":
+        ch = self._store[offset]
+        if ch == u"\t":
             tabWidth = 8
             flooredTabGrammarCol = subnodeCol // tabWidth * tabWidth
             offset += (col - flooredTabGrammarCol) // tabWidth
-        elif app.curses_util.isDoubleWidth(self.data[offset]):
+        elif app.curses_util.isDoubleWidth(ch):
             charWidth = 2
             offset += subnodeColDelta // charWidth
         else:
@@ -173,46 +389,129 @@ class Parser:
         if app.config.strict_debug:
             assert isinstance(offset, int)
             assert offset >= 0
-        # Binary search to find the row, then the col.
-        nodes = self.parserNodes
-        if offset >= nodes[-1][kBegin]:
+        if offset >= len(self._store):
             return None
-        # Determine the row.
+        return self.offsetRowCol(offset)
+
+    def offsetRowCol(self, offset):
+        """Get the (row, col) of data |offset|, which may be the end of the
+        data.
+
+        The row is found with a binary search of the row offsets (the rows are
+        found to the end of the document, see _fastLineParse(), without
+        waiting for the parse).
+        """
+        if app.config.strict_debug:
+            assert isinstance(offset, int)
+            assert 0 <= offset <= len(self._store)
+        self.rowCount()
+        row = self._rowAtOffset(offset)
+        begin = self.parserNodes.begin(self.rows[row])
+        return row, self._lineWidth(self._store, begin, offset)
+
+    def rowColOffset(self, row, col):
+        """Get the data offset of |row|, |col|.
+
+        Unlike dataOffset(), a |col| past the end of the row is the offset of
+        the end of the row (and a |row| past the end of the document is the
+        end of the data).
+        """
+        if app.config.strict_debug:
+            assert isinstance(row, int)
+            assert isinstance(col, int)
+            assert row >= 0
+        store = self._store
+        if row >= self.rowCount():
+            return len(store)
         rows = self.rows
-        low = 0
-        high = len(rows) - 1
-        while True:
-            row = (high + low) // 2
-            if offset >= nodes[rows[row + 1]][kBegin]:
-                low = row
-            elif offset < nodes[rows[row]][kBegin]:
-                high = row
-            else:
-                break
-        # Determine the col.
-        low = rows[row]
-        high = rows[row + 1]
+        begin = self.parserNodes.begin(rows[row])
+        if row + 1 < len(rows):
+            end = self.parserNodes.begin(rows[row + 1]) - 1
+        else:
+            end = len(store)
+        width = 0
+        for offset in range(begin, end):
+            width += app.curses_util.charWidth(store[offset], width)
+            if width > col:
+                return offset
+        return end
+
+    def find(self, regex, offset, direction):
+        """Search the whole document for |regex|, beginning at |offset|.
+
+        The regex is run over the data (rather than row by row), so a match
+        may span rows.
+
+        Args:
+          regex (compiled regex): The pattern to find.
+          offset (int): Search forward from this data offset, or backward for
+              a match that ends at or before it.
+          direction (int): Forward if >= 0, backward if < 0.
+
+        Returns:
+          (begin, end, wrapped) data offsets of the match, where |wrapped| is
+          whether the search wrapped around the end (or start) of the
+          document; or None if there is no match.
+        """
+        store = self._store
+        offset = max(0, min(offset, len(store)))
+        if direction >= 0:
+            found = self._findFirst(regex, offset)
+            if found is not None:
+                return found + (False,)
+            found = self._findFirst(regex, 0)
+        else:
+            found = self._findLast(regex, 0, offset)
+            if found is not None:
+                return found + (False,)
+            found = self._findLast(regex, offset, len(store))
+        if found is None:
+            return None
+        return found + (True,)
+
+    def _findFirst(self, regex, begin):
+        """Find the first match of |regex| at or after |begin|.
+
+        Returns:
+          The (begin, end) data offsets of the match; or None.
+        """
+        window = app.piece_table.TextWindow(self._store)
+        found = window.search(regex, begin)
+        if found is None:
+            return None
+        return window.base + found.start(), window.base + found.end()
+
+    def _findLast(self, regex, begin, end):
+        """Find the last match of |regex| within data[begin:end].
+
+        The search is made in increasingly large windows back from |end|, so
+        that a match near |end| is found without scanning from |begin|. Each
+        window begins at the start of a line, and the search is not cut off at
+        |end| (so that e.g. $ and lookaheads see the data after it), a match
+        must end at or before |end|.
+
+        Returns:
+          The (begin, end) data offsets of the match; or None.
+        """
+        store = self._store
+        size = kFindBackChars
         while True:
-            index = (high + low) // 2
-            if offset >= nodes[index + 1][kBegin]:
-                low = index
-            elif offset < nodes[index][kBegin]:
-                high = index
-            else:
-                break
-        col = nodes[index][kVisual] - nodes[rows[row]][kVisual]
-        remainingOffset = offset - nodes[index][kBegin]
-        if remainingOffset > 0:
-            ch = self.data[nodes[index][kBegin]]
-            if ch == u"\t":
-                tabWidth = self.appPrefs.editor.get(u"tabSize", 8)
-                # Add the (potentially) fractional tab.
-                col += app.curses_util.charWidth(ch, col, tabWidth)
-                # Add the remaining tabs.
-                col += tabWidth * (remainingOffset - 1)
-            else:
-                col += app.curses_util.charWidth(ch, col) * remainingOffset
-        return row, col
+            low = store.rfind(u"\n", begin, max(begin, end - size)) + 1
+            low = max(begin, low)
+            # The text from just before |low| (e.g. for a lookbehind) to past
+            # |end| (e.g. for a lookahead).
+            base = max(0, low - app.piece_table.kWindowLeadChars)
+            text = store[base:end + app.piece_table.kWindowChars]
+            last = None
+            for found in regex.finditer(text, low - base):
+                if base + found.end() > end:
+                    break
+                last = found
+            if last is not None:
+                return base + last.start(), base + last.end()
+            if low == begin:
+                return None
+            size *= 4
 
     def defaultGrammar(self):
         return self._defaultGrammar
@@ -223,19 +522,18 @@ class Parser:
             end = self.dataOffset(row, lowerCol)
             if end is None:
                 if begin is not None:
-                    self.data = self.data[:begin]
+                    self._storeDelete(begin, len(self._store))
             else:
-                self.data = self.data[:begin] + self.data[end:]
+                self._storeDelete(begin, end)
         self._beginParsingAt(upperRow)
 
     def deleteChar(self, row, col):
         """Delete the character after (or "at") |row, col|."""
-        self._fullyParseTo(row)
         offset = self.dataOffset(row, col)
         if offset is None:
             # Bottom of file, nothing to do.
             return
-        self.data = self.data[:offset] + self.data[offset + 1:]
+        self._storeDelete(offset, offset + 1)
         self._beginParsingAt(row)
 
     def deleteRange(self, upperRow, upperCol, lowerRow, lowerCol):
@@ -243,9 +541,9 @@ class Parser:
         end = self.dataOffset(lowerRow, lowerCol)
         if end is None:
             if begin is not None:
-                self.data = self.data[:begin]
+                self._storeDelete(begin, len(self._store))
         else:
-            self.data = self.data[:begin] + self.data[end:]
+            self._storeDelete(begin, end)
         self._beginParsingAt(upperRow)
 
     def textRange(self, upperRow, upperCol, lowerRow, lowerCol):
@@ -253,8 +551,35 @@ class Parser:
         end = self.dataOffset(lowerRow, lowerCol)
         if end is None:
             if begin is not None:
-                return self.data[begin:]
-        return self.data[begin:end]
+                return self._store[begin:]
+        return self._store[begin:end]
+
+    def substitute(self, offsets, olds, news):
+        """Replace the text olds[i] at data offset offsets[i] with news[i].
+
+        The offsets are of the data prior to the substitution, in document
+        order. The data from the first to the last substitution is replaced
+        as a single edit (rather than an edit per substitution).
+        """
+        if not len(offsets):
+            return
+        store = self._store
+        begin = offsets[0]
+        end = offsets[-1] + len(olds[-1])
+        pieces = []
+        prior = begin
+        for offset, old, new in zip(offsets, olds, news):
+            if app.config.strict_debug:
+                assert store[offset:offset + len(old)] == old
+            pieces.append(store[prior:offset])
+            pieces.append(new)
+            prior = offset + len(old)
+        text = u"".join(pieces)
+        row = self.offsetRowCol(begin)[0]
+        self._storeDelete(begin, end)
+        if text:
+            self._storeInsert(begin, text)
+        self._beginParsingAt(row)
 
     def grammarIndexFromRowCol(self, row, col):
         """
@@ -269,7 +594,9 @@ class Parser:
             assert isinstance(col, int)
             assert row >= 0
             assert col >= 0
-        self._fullyParseTo(row)
+        parser, row = self._parserForRow(row)
+        if parser is not self:
+            return parser.grammarIndexFromRowCol(row, col)
         if app.config.strict_debug:
             assert row < len(self.rows), (row, len(self.rows), repr(self.data))
         if row == len(self.rows) - 1:
@@ -300,7 +627,6 @@ class Parser:
         individually if grammars are requested contiguously. This function is
         just for one-off needs.
         """
-        self._fullyParseTo(row)
         grammarIndex = self.grammarIndexFromRowCol(row, col)
         node, _, _, _ = self.grammarAtIndex(row, col, grammarIndex)
         return node.grammar
@@ -317,7 +643,9 @@ class Parser:
             assert isinstance(col, int)
             assert isinstance(index, int)
             assert row < len(self.rows), row
-        self._fullyParseTo(row)
+        parser, row = self._parserForRow(row)
+        if parser is not self:
+            return parser.grammarAtIndex(row, col, index)
         eol = True
         finalResult = (self.emptyNode, 0, 0, eol)
         rowIndex = self.rows[row]
@@ -338,12 +666,14 @@ class Parser:
             assert isinstance(row, int)
             assert isinstance(col, int)
             assert row < len(self.rows), row
-        self._fullyParseTo(row)
+        parser, row = self._parserForRow(row)
+        if parser is not self:
+            return parser.grammarTextAt(row, col)
         rowIndex = self.rows[row]
         grammarIndex = self.grammarIndexFromRowCol(row, col)
         node = self.parserNodes[rowIndex + grammarIndex]
         nextNode = self.parserNodes[rowIndex + grammarIndex + 1]
-        return (self.data[node[kBegin]:nextNode[kBegin]],
+        return (self._store[node[kBegin]:nextNode[kBegin]],
                 node[kGrammar].get(u"link_type"))
 
     def inDocument(self, row, col):
@@ -352,7 +682,9 @@ class Parser:
             assert isinstance(col, int)
             assert row >= 0
             assert col >= 0
-        self._fullyParseTo(row)
+        parser, row = self._parserForRow(row)
+        if parser is not self:
+            return parser.inDocument(row, col)
         return (row < len(self.rows) and
             col < self.parserNodes[self.rows[row]][kVisual])
 
@@ -367,18 +699,16 @@ class Parser:
         offset = self.dataOffset(row, col)
         if offset is None:
             row = len(self.rows) - 1
-            self.data += text
-        else:
-            self.data = self.data[:offset] + text + self.data[offset:]
+            offset = len(self._store)
+        self._storeInsert(offset, text)
         self._beginParsingAt(row)
 
     def insertBlock(self, row, col, lines):
         for i in range(len(lines) - 1, -1, -1):
             offset = self.dataOffset(row + i, col)
             if offset is None:
-                self.data += lines[i]
-            else:
-                self.data = self.data[:offset] + lines[i] + self.data[offset:]
+                offset = len(self._store)
+            self._storeInsert(offset, lines[i])
         self._beginParsingAt(row)
 
     def insertLines(self, row, col, lines):
@@ -403,7 +733,6 @@ class Parser:
             assert row >= 0
             assert col >= 0
             assert len(self.rows) > 0
-        self._fullyParseTo(row)
         ch = self.charAt(row, col)
         if ch is None:
             return (1, -col) if self.inDocument(row + 1, 0) else None
@@ -420,7 +749,6 @@ class Parser:
             assert row >= 0
             assert col >= 0
             assert len(self.rows) > 0
-        self._fullyParseTo(row)
         if col == 0:
             if row == 0:
                 return None
@@ -430,7 +758,8 @@ class Parser:
     def parse(self, bgThread, data, grammar, beginRow, endRow):
         """
         Args:
-          data (string): The file contents. The document.
+          data (string): The file contents. The document; or None to parse
+              the current document (see |data|).
           grammar (object): The initial grammar (often determined by the file
               extension). If |beginRow| is not zero then grammar is ignored.
           beginRow (int): is the first row (which is line number - 1) in data
@@ -443,7 +772,7 @@ class Parser:
         """
         if app.config.strict_debug:
             assert bgThread is None or isinstance(bgThread, threading.Thread)
-            assert isinstance(data, unicode), type(data)
+            assert data is None or isinstance(data, unicode), type(data)
             assert isinstance(grammar, dict)
             assert isinstance(beginRow, int)
             assert isinstance(endRow, int)
@@ -452,13 +781,14 @@ class Parser:
             assert isinstance(self.appPrefs, app.prefs.Prefs)
         self._defaultGrammar = grammar
         self.emptyNode = ParserNode(grammar, None, None, 0)
-        self.data = data
+        if data is not None and not self._store.isText(data):
+            self.data = data
         self._beginParsingAt(beginRow)
         self._fullyParseTo(endRow, bgThread)
-        #self.debug_checkLines(app.log.parser, data)
+        #self.debug_checkLines(app.log.parser, self.data)
         #startTime = time.time()
         if app.log.enabledChannels.get('parser', False):
-            self.debugLog(app.log.parser, data)
+            self.debugLog(app.log.parser, self.data)
         #app.log.startup('parsing took', time.time() - startTime)
 
     def _beginParsingAt(self, beginRow):
@@ -467,57 +797,300 @@ class Parser:
             assert beginRow >= 0, beginRow
             assert isinstance(self.resumeAtRow, int)
             assert self.resumeAtRow >= 0, self.resumeAtRow
+        damage = self._editDamage
+        editBegin = self._editBegin
+        self._editDamage = (0, 0)
+        self._editBegin = None
+        if editBegin is not None:
+            # The row given may be past the edit (e.g. a backspace beyond the
+            # end of the document), begin at the row that was edited so that
+            # its damage is carried into the prior parse (or reparsed).
+            beginRow = min(beginRow, self._rowAtOffset(editBegin))
+        stoppedAt = self._stoppedAt
+        self._stoppedAt = None
+        if damage is None:
+            self._priorParse = None
+        elif beginRow < self.resumeAtRow:
+            # Hang on to the current parse, the rows after the edit may be
+            # reused. See _reusePriorParse().
+            self._priorParse = PriorParse(self.parserNodes, self.rows, beginRow,
+                                          self.resumeAtRow, damage)
+        elif self._priorParse is not None:
+            self._priorParse.addDamage(damage)
         if beginRow > self.resumeAtRow:
-            # Already beginning at an earlier row.
-            return
-        if beginRow > 0:
+            # Already beginning at an earlier row. The rows after that are from
+            # _fastLineParse() (or absent). They are discarded since an edit
+            # (e.g. one made using the viewport parse) may have moved them.
+            beginRow = self.resumeAtRow
+        if (stoppedAt is not None and stoppedAt[0] == beginRow and
+                damage is not None and
+                self.parserNodes.grammar(0) is self.defaultGrammar() and
+                (editBegin is None or
+                 editBegin > self.parserNodes.begin(stoppedAt[2] - 1))):
+            # Carry on from where the parse stopped (which may be within the
+            # row). The parse resumes from the last node, so edits after its
+            # beginning are seen. Drop the rows and nodes _fastLineParse()
+            # added since.
+            self.generation += 1
+            if self._priorParse is not None and (
+                    self._priorParse.parserNodes is self.parserNodes):
+                # Keep the prior parse intact.
+                self.parserNodes = self.parserNodes.copy(stoppedAt[2])
+                self.rows = self.rows.copy(stoppedAt[1])
+            else:
+                self.rows.truncate(stoppedAt[1])
+                self.parserNodes.truncate(stoppedAt[2])
+            self._stoppedAt = stoppedAt
+            self._checkpointFloor = self.parserNodes.begin(self.rows[-1])
+            self.bracketIndex.truncate(self._checkpointFloor)
+        elif beginRow > 0:
             # Trim partially parsed data.
             if beginRow < len(self.rows):
-                self.parserNodes = self.parserNodes[:self.rows[beginRow]]
-                self.rows = self.rows[:beginRow]
-            self.resumeAtRow = len(self.rows)
+                # The rows from |beginRow| on will be parsed again.
+                self.generation += 1
+                if self._priorParse is not None and (
+                        self._priorParse.parserNodes is self.parserNodes):
+                    # Keep the prior parse intact.
+                    self.parserNodes = self.parserNodes.copy(
+                        self.rows[beginRow])
+                    self.rows = self.rows.copy(beginRow)
+                else:
+                    self.parserNodes.truncate(self.rows[beginRow])
+                    self.rows.truncate(beginRow)
+                # The end of the last row kept isn't known until the next row
+                # begins, so it's not complete. The parse carries on from its
+                # last node.
+                self.resumeAtRow = beginRow - 1
+                self._stoppedAt = (self.resumeAtRow, len(self.rows),
+                                   len(self.parserNodes))
+            self._checkpointFloor = self.parserNodes.begin(self.rows[-1])
+            self.bracketIndex.truncate(self._checkpointFloor)
         else:
             # Parse the whole file.
-            self.parserNodes = [(self.defaultGrammar(), 0, None, 0)]
-            self.rows = [0]
+            self.parserNodes = self._newParserNodes()
+            self.parserNodes.append((self.defaultGrammar(), 0, None, 0))
+            self.rows = app.parser_nodes.newRows()
             self.resumeAtRow = 0
+            self._checkpointFloor = -1
+            self.bracketIndex.truncate(0)
+            # The root grammar may have changed.
+            self._viewport = None
+            self.generation += 1
+
+    def parseState(self):
+        """Get the parse of the whole document, for storage.
+
+        See setParseState().
+
+        Returns:
+            A tuple of (nodeColumns, rows); or None if the document is not
+            fully parsed.
+        """
+        if self.resumeAtRow < self.rowCount():
+            return None
+        columns = self.parserNodes.columns()
+        if columns is None:
+            return None
+        return columns, self.rows.values()
+
+    def setParseState(self, grammar, columns, rows):
+        """Restore a parse of the current data from parseState()."""
+        if app.config.strict_debug:
+            assert isinstance(grammar, dict)
+        self._defaultGrammar = grammar
+        self.emptyNode = ParserNode(grammar, None, None, 0)
+        parserNodes = self._newParserNodes()
+        parserNodes.setColumns(columns)
+        self.parserNodes = parserNodes
+        self.rows = app.parser_nodes.newRows(rows)
+        self._stoppedAt = None
+        self.resumeAtRow = len(self.rows)
+        self._editDamage = (0, 0)
+        self._editBegin = None
+        self._priorParse = None
+        self.cancelParallelParse()
+        self._viewport = None
+        self.bracketIndex.truncate(0)
+        self.generation += 1
+
+    def startParallelParse(self, executor, grammar, chunkCount):
+        """Begin parsing sections of the document in other processes.
+
+        The document is split (at line ends) into |chunkCount| chunks. The
+        first chunk is left to the usual parse, the others are submitted to
+        |executor|. As the usual parse reaches a chunk with a completed result,
+        the result is used to skip ahead (see _useParallelChunk()).
+
+        Args:
+          executor (concurrent.futures.Executor): e.g. a ProcessPoolExecutor.
+          grammar (object): The root grammar (see parse()).
+          chunkCount (int): The number of sections to split the document into.
+        """
+        if app.config.strict_debug:
+            assert isinstance(grammar, dict)
+            assert isinstance(chunkCount, int)
+        store = self._store
+        chunkSize = len(store) // max(chunkCount, 1)
+        boundaries = []
+        for i in range(1, chunkCount):
+            boundary = store.find(u"\n", i * chunkSize) + 1
+            if boundary == 0:
+                break
+            if not boundaries or boundary > boundaries[-1]:
+                boundaries.append(boundary)
+        boundaries.append(len(store))
+        self.cancelParallelParse()
+        for begin, end in zip(boundaries[:-1], boundaries[1:]):
+            future = executor.submit(parseChunk, store[begin:end],
+                                     grammar['name'],
+                                     self.appPrefs.grammarsChecksum)
+            self._parallelChunks.append(
+                ParallelChunk(grammar, begin, end, future))
+
+    def cancelParallelParse(self):
+        """Drop the chunks from startParallelParse(), cancelling those that
+        haven't started (e.g. when the document is edited or closed)."""
+        for chunk in self._parallelChunks:
+            chunk.future.cancel()
+        self._parallelChunks = []
+
+    def _useParallelChunk(self, begin):
+        """Set up a completed chunk as the prior parse.
+
+        Args:
+          begin (int): The offset of the row the parse has just started.
+        """
+        chunks = self._parallelChunks
+        while chunks and chunks[0].end <= begin:
+            # The parse has already passed this chunk.
+            chunks.pop(0)
+        if not chunks:
+            return
+        chunk = chunks[0]
+        if begin < chunk.begin or not chunk.future.done():
+            return
+        chunks.pop(0)
+        state = None
+        if chunk.grammar is self._defaultGrammar:
+            try:
+                state = chunk.future.result()
+            except Exception as e:
+                app.log.exception(e)
+        if state is None:
+            return
+        columns, rows = state
+        parserNodes = self._newParserNodes()
+        parserNodes.setColumns(columns)
+        self._priorParse = PriorParse(parserNodes,
+                                      app.parser_nodes.newRows(rows), 0,
+                                      len(rows), (0, chunk.begin))
 
     def _fastLineParse(self, grammar):
         """If there's not enough time to thoroughly parse the file, identify the
         lines so that the document can still be edited.
+
+        Newlines are found with a regex (rather than looking at each character
+        in Python). Only the lines containing tabs or wide characters are
+        examined further, to determine their width. The rows are added a batch
+        (of roughly kFastParseBatch characters) at a time.
         """
-        data = self.data
-        offset = self.parserNodes[self.rows[-1]][kBegin]
-        limit = len(data)
+        store = self._store
+        offset = self.parserNodes.begin(self.rows[-1])
+        limit = len(store)
         if offset == limit:
             # Already parsed to end of data.
             return
-        visual = self.parserNodes[self.rows[-1]][kVisual]
-        # Track the |visual| value for the start of the line. The difference
-        # between |visual| and |visualStartCol| is the column index of the line.
-        visualStartCol = 0
-        while True:
-            while offset < limit and data[offset] != '\n':
-                if data[offset] < u"ᄀ":
-                    # The char is less than the first double width character.
-                    # (An optimization to avoid calling charWidth().)
-                    visual += 1
-                else:
-                    # From here on, the width of the character is messy to
-                    # determine, ask an authority.
-                    visual += app.curses_util.charWidth(data[offset],
-                            visual - visualStartCol)
-                offset += 1
-            if offset >= limit:
-                if self.parserNodes[-1][kBegin] != limit:
-                    # Add a terminating (end) node.
-                    self.parserNodes.append((grammar, limit, None, visual))
-                break
-            visualStartCol = visual
-            offset += 1
-            visual += 1
-            self.rows.append(len(self.parserNodes))
-            self.parserNodes.append((grammar, offset, None, visual))
+        # The |visual| value of each narrow character is its offset plus
+        # |shift|.
+        shift = self.parserNodes[self.rows[-1]][kVisual] - offset
+        if self._reuseFastRows(grammar, offset, shift):
+            return
+        allBegins = array.array(app.parser_nodes.kIntType)
+        allVisuals = array.array(app.parser_nodes.kIntType)
+        while offset < limit:
+            batchEnd = store.find(u"\n", offset + kFastParseBatch) + 1
+            if batchEnd == 0:
+                batchEnd = limit
+            # The batch ends at a line end (or the end of the data).
+            batch = store[offset:batchEnd]
+            begins = [offset + m.end() for m in kNewLineRe.finditer(batch)]
+            visuals = []
+            row = 0
+            found = kWideOrTabRe.search(batch)
+            while found is not None:
+                # Find the line containing the character.
+                lineRow = bisect.bisect_right(begins, offset + found.start())
+                lineBegin = begins[lineRow - 1] - offset if lineRow else 0
+                lineEnd = batch.find(u"\n", found.start())
+                if lineEnd == -1:
+                    lineEnd = len(batch)
+                visuals.extend([i + shift for i in begins[row:lineRow]])
+                row = lineRow
+                shift += self._lineWidth(batch, lineBegin,
+                                         lineEnd) - (lineEnd - lineBegin)
+                found = kWideOrTabRe.search(batch, lineEnd)
+            visuals.extend([i + shift for i in begins[row:]])
+            nodeIndex = len(self.parserNodes)
+            self.rows.extend(range(nodeIndex, nodeIndex + len(begins)))
+            self.parserNodes.extendRows(grammar, begins, visuals)
+            allBegins.extend(begins)
+            allVisuals.extend(visuals)
+            offset = batchEnd
+        self._fastRows = (allBegins, allVisuals, shift)
+        if self.parserNodes.begin(-1) != limit:
+            # Add a terminating (end) node.
+            self.parserNodes.append((grammar, limit, None, limit + shift))
+
+    def _reuseFastRows(self, grammar, offset, shift):
+        """Add the rows after |offset| from the prior _fastLineParse() of the
+        current data, if there was one that included them.
+
+        A paused parse drops the fast parsed rows and adds them again once the
+        parse stops, finding the rows again would be slow for a long document.
+
+        Returns:
+          Whether the rows (and end node) were added.
+        """
+        if self._fastRows is None:
+            return False
+        begins, visuals, endShift = self._fastRows
+        index = bisect.bisect_left(begins, offset)
+        if index >= len(begins) or begins[index] != offset:
+            return False
+        # The visual values differ by |delta| if the rows parsed since differ
+        # in width from the fast parse.
+        delta = offset + shift - visuals[index]
+        begins = begins[index + 1:]
+        visuals = visuals[index + 1:]
+        if delta:
+            visuals = array.array(app.parser_nodes.kIntType,
+                                  [i + delta for i in visuals])
+        nodeIndex = len(self.parserNodes)
+        self.rows.extend(range(nodeIndex, nodeIndex + len(begins)))
+        self.parserNodes.extendRows(grammar, begins, visuals)
+        limit = len(self._store)
+        if self.parserNodes.begin(-1) != limit:
+            self.parserNodes.append(
+                (grammar, limit, None, limit + endShift + delta))
+        return True
+
+    def _lineWidth(self, data, begin, end):
+        """Get the display width of data[begin:end] (which is within a line).
+        """
+        col = 0
+        for ch in data[begin:end]:
+            if ch == u"\t":
+                # Advance to the next tab stop (as _buildGrammarList() does).
+                col += 8 - col % 8
+            elif ch < u"ᄀ":
+                # The char is less than the first double width character.
+                # (An optimization to avoid calling charWidth().)
+                col += 1
+            else:
+                # From here on, the width of the character is messy to
+                # determine, ask an authority.
+                col += app.curses_util.charWidth(ch, col)
+        return col
 
     def _fullyParseTo(self, endRow, bgThread=None):
         """Parse up to and including |endRow|."""
@@ -529,16 +1102,34 @@ class Parser:
         self.pauseAtRow = endRow + 1
         if self.pauseAtRow <= self.resumeAtRow:
             # Already parsed to that row.
+            self._indexBrackets(bgThread)
             return
         self._beginParsingAt(self.resumeAtRow)
         self._buildGrammarList(bgThread)
         self._fastLineParse(self.defaultGrammar())
+        self._indexBrackets(bgThread)
         if app.config.strict_debug:
             assert self.resumeAtRow >= 0
             assert self.resumeAtRow <= len(self.rows)
             if bgThread is not None and endRow <= len(self.rows):
                 assert self.resumeAtRow >= endRow + 1, (self.resumeAtRow, endRow)
 
+    def _indexBrackets(self, bgThread):
+        """Add the brackets of the parsed rows (up to |pauseAtRow|) to the
+        bracketIndex."""
+        row = min(self.pauseAtRow, self.resumeAtRow)
+        if row >= len(self.rows):
+            # The rows may end before the data (e.g. when they have been
+            # trimmed for a reparse), so stop at the end of the last row.
+            end = self._store.find(u"\n",
+                                   self.parserNodes.begin(self.rows[-1]))
+            end = len(self._store) if end == -1 else end + 1
+        else:
+            end = self.parserNodes.begin(self.rows[row])
+        if end > self.bracketIndex.scannedTo:
+            self.bracketIndex.build(self._store, self.parserNodes, end,
+                                    bgThread)
+
     def rowCount(self):
         self._fastLineParse(self.defaultGrammar())
         return len(self.rows)
@@ -559,16 +1150,18 @@ class Parser:
             assert beginCol is None or isinstance(beginCol, int)
             assert endCol is None or isinstance(endCol, int)
             assert row >= 0
-            assert isinstance(self.data, unicode)
-        self._fullyParseTo(row)
+            assert isinstance(self._store, app.piece_table.PieceTable)
+        parser, row = self._parserForRow(row)
+        if parser is not self:
+            return parser.rowText(row, beginCol, endCol)
         if beginCol is endCol is None:
             begin = self.parserNodes[self.rows[row]][kBegin]
             if row + 1 >= len(self.rows):
-                return self.data[begin:]
+                return self._store[begin:]
             end = self.parserNodes[self.rows[row + 1]][kBegin]
-            if len(self.data) and self.data[end - 1] == u"\n":
+            if len(self._store) and self._store[end - 1] == u"\n":
                 end -= 1
-            return self.data[begin:end]
+            return self._store[begin:end]
 
         if beginCol >= 0:
             begin = self.dataOffset(row, beginCol)
@@ -591,11 +1184,11 @@ class Parser:
             end = self.dataOffset(row, endCol)
 
         if end is None:
-            end = len(self.data)
-        if end > 0 and self.data[end - 1] == u"\n":
+            end = len(self._store)
+        if end > 0 and self._store[end - 1] == u"\n":
             end -= 1
 
-        return self.data[begin:end]
+        return self._store[begin:end]
 
     def charAt(self, row, col):
         """Get the character at |row|, |col|.
@@ -610,10 +1203,12 @@ class Parser:
         if app.config.strict_debug:
             assert isinstance(row, int)
             assert isinstance(col, int)
-            assert isinstance(self.data, unicode)
+            assert isinstance(self._store, app.piece_table.PieceTable)
             assert row >= 0
             assert col >= 0
-        self._fullyParseTo(row)
+        parser, row = self._parserForRow(row)
+        if parser is not self:
+            return parser.charAt(row, col)
         if row > len(self.rows):
             return None
         string, width = self.rowTextAndWidth(row)
@@ -637,13 +1232,15 @@ class Parser:
         """
         if app.config.strict_debug:
             assert isinstance(row, int)
-        self._fullyParseTo(row)
+        parser, row = self._parserForRow(row)
+        if parser is not self:
+            return parser.rowTextAndWidth(row)
         begin = self.parserNodes[self.rows[row]][kBegin]
         visual = self.parserNodes[self.rows[row]][kVisual]
         if row + 1 < len(self.rows):
             end = self.parserNodes[self.rows[row + 1]][kBegin]
             visualEnd = self.parserNodes[self.rows[row + 1]][kVisual]
-            if len(self.data) and self.data[end - 1] == '\n':
+            if len(self._store) and self._store[end - 1] == '\n':
                 end -= 1
                 visualEnd -= 1
         else:
@@ -652,7 +1249,7 @@ class Parser:
             lastNode = self.parserNodes[-1]
             end = lastNode[kBegin]
             visualEnd = lastNode[kVisual]
-        return self.data[begin:end], visualEnd - visual
+        return self._store[begin:end], visualEnd - visual
 
     def rowWidth(self, row):
         """Get the visual/display column width of a row.
@@ -671,12 +1268,14 @@ class Parser:
             assert isinstance(row, int)
         if row < 0:
             row = len(self.rows) + row
-        self._fullyParseTo(row)
+        parser, row = self._parserForRow(row)
+        if parser is not self:
+            return parser.rowWidth(row)
         visual = self.parserNodes[self.rows[row]][kVisual]
         if row + 1 < len(self.rows):
             end = self.parserNodes[self.rows[row + 1]][kBegin]
             visualEnd = self.parserNodes[self.rows[row + 1]][kVisual]
-            if len(self.data) and self.data[end - 1] == '\n':
+            if len(self._store) and self._store[end - 1] == '\n':
                 visualEnd -= 1
         else:
             # There is a sentinel node at the end that records the end of
@@ -692,6 +1291,12 @@ class Parser:
         again).
         """
         appPrefs = self.appPrefs
+        # Regexes are matched against a window of the document around the
+        # |cursor| position (rather than a slice of the document starting at
+        # |cursor|) to avoid copying the remainder of the document for each
+        # match. The match positions are relative to |window.base|.
+        window = app.piece_table.TextWindow(self._store)
+        length = len(self._store)
         # An arbitrary limit to avoid run-away looping.
         leash = 50000
         topNode = self.parserNodes[-1]
@@ -701,30 +1306,49 @@ class Parser:
         # grammar.
         if (len(self.parserNodes) == 1 or
                 topNode[kGrammar] is not self.parserNodes[-2][kGrammar]):
-            beginRegex = topNode[kGrammar].get('begin')
-            if beginRegex is not None:
-                sre = re.match(beginRegex, self.data[cursor:])
+            beginRe = topNode[kGrammar].get('beginRe')
+            if beginRe is not None:
+                sre = window.match(beginRe, cursor)
                 if sre is not None:
-                    cursor += sre.regs[0][1]
-                    visual += sre.regs[0][1]  # Assumes single-wide characters.
+                    # Assumes single-wide characters.
+                    visual += window.base + sre.end() - cursor
+                    cursor = window.base + sre.end()
+        startedRow = False
+        finished = False
         while len(self.rows) <= self.pauseAtRow:
+            if startedRow:
+                startedRow = False
+                if (len(self.rows) - 1) % kCheckpointRows == 0:
+                    self._addCheckpoint(cursor, len(self.parserNodes) - 1)
+                if self._parallelChunks and self._priorParse is None:
+                    self._useParallelChunk(cursor)
+                if self._priorParse is not None and self._reusePriorParse():
+                    if self.resumeAtRow < self.pauseAtRow:
+                        # The prior parse was not complete, carry on from
+                        # where it left off.
+                        self._beginParsingAt(self.resumeAtRow)
+                        self._buildGrammarList(bgThread)
+                    return
             if not leash:
                 #app.log.error('grammar likely caught in a loop')
                 break
             leash -= 1
-            if bgThread and bgThread.hasUserEvent():
+            if bgThread and bgThread.shouldYield():
                 break
-            subdata = self.data[cursor:]
-            found = self.parserNodes[-1][kGrammar].get('matchRe').search(
-                subdata)
+            found = window.search(
+                self.parserNodes[-1][kGrammar].get('matchRe'), cursor)
             if not found:
                 #app.log.info('parser exit, match not found')
                 # todo(dschuyler): mark parent grammars as unterminated (if they
                 # expect be terminated). e.g. unmatched string quote or xml tag.
-                if cursor != len(self.data):
-                    # The last bit of the last line.
+                if cursor != length:
+                    # The last bit of the last line, in the current grammar
+                    # (not that of |topNode|, which may be from before the
+                    # last grammar began).
+                    topNode = self.parserNodes[-1]
                     self.parserNodes.append((topNode[kGrammar], cursor,
                                              topNode[kPrior], visual))
+                finished = True
                 break
             index = -1
             foundGroups = found.groups()
@@ -732,7 +1356,10 @@ class Parser:
                 index += 1
                 if k is not None:
                     break
-            reg = found.regs[index + 1]
+            # Make |reg| relative to the |cursor|.
+            regBegin, regEnd = found.regs[index + 1]
+            regBase = cursor - window.base
+            reg = (regBegin - regBase, regEnd - regBase)
             if index == 0:
                 # Found escaped value.
                 cursor += reg[1]
@@ -745,6 +1372,7 @@ class Parser:
                 cursor += reg[1]
                 visual += reg[1]
                 self.rows.append(len(self.parserNodes))
+                startedRow = True
             elif index == len(foundGroups) - 2:
                 # Found double wide character.
                 topNode = self.parserNodes[-1]
@@ -795,7 +1423,7 @@ class Parser:
                     visual + reg[1])
                 cursor = child[kBegin]
                 visual += reg[1]
-                if subdata[reg[1] - 1] == '\n':
+                if self._store[cursor - 1] == '\n':
                     # This 'end' ends with a new line.
                     self.rows.append(len(self.parserNodes))
             else:
@@ -806,7 +1434,7 @@ class Parser:
                 ] = self.parserNodes[-1][kGrammar]['indexLimits']
                 if index < containsGrammarIndexLimit:
                     # A new grammar within this grammar (a 'contains').
-                    if subdata[reg[0]] == '\n':
+                    if self._store[cursor + reg[0]] == '\n':
                         # This 'begin' begins with a new line.
                         self.rows.append(len(self.parserNodes))
                     priorGrammar = self.parserNodes[-1][kGrammar].get(
@@ -824,33 +1452,35 @@ class Parser:
                     else:
                         if priorGrammar.get('end_key'):
                             # A dynamic end tag.
-                            hereKey = re.search(priorGrammar['end_key'],
-                                                subdata[reg[0]:]).groups()[0]
+                            hereKey = window.search(
+                                re.compile(priorGrammar['end_key']),
+                                cursor + reg[0]).groups()[0]
                             markers = priorGrammar['markers']
                             markers[1] = priorGrammar['end'].replace(
                                 r'\0', re.escape(hereKey))
                             priorGrammar['matchRe'] = re.compile(
-                                app.regex.joinReList(markers))
+                                app.regex.joinReList(markers), re.MULTILINE)
                         child = (priorGrammar, cursor + reg[0],
                                  len(self.parserNodes) - 1, visual + reg[0])
                     cursor += reg[1]
                     visual += reg[1]
                 elif index < nextGrammarIndexLimit:
                     # A new grammar follows this grammar (a 'next').
-                    if subdata[reg[0]] == '\n':
+                    if self._store[cursor + reg[0]] == '\n':
                         # This 'begin' begins with a new line.
                         self.rows.append(len(self.parserNodes))
                     priorGrammar = self.parserNodes[-1][kGrammar].get(
                         'matchGrammars', [])[index]
                     if priorGrammar.get('end_key'):
                         # A dynamic end tag.
-                        hereKey = re.search(priorGrammar['end_key'],
-                                            subdata[reg[0]:]).groups()[0]
+                        hereKey = window.search(
+                            re.compile(priorGrammar['end_key']),
+                            cursor + reg[0]).groups()[0]
                         markers = priorGrammar['markers']
                         markers[1] = priorGrammar['end'].replace(
                             r'\0', re.escape(hereKey))
                         priorGrammar['matchRe'] = re.compile(
-                            app.regex.joinReList(markers))
+                            app.regex.joinReList(markers), re.MULTILINE)
                     child = (priorGrammar, cursor + reg[0],
                              len(self.parserNodes) - 2, visual + reg[0])
                     cursor += reg[1]
@@ -910,7 +1540,207 @@ class Parser:
                 else:
                     app.log.error('invalid grammar index')
             self.parserNodes.append(child)
-        self.resumeAtRow = len(self.rows)
+        # Unless the parse reached the end of the data, the last row begun is
+        # not complete (e.g. it may hold only its first node).
+        if finished:
+            self.resumeAtRow = len(self.rows)
+            self._stoppedAt = None
+        else:
+            self.resumeAtRow = len(self.rows) - 1
+            self._stoppedAt = (self.resumeAtRow, len(self.rows),
+                               len(self.parserNodes))
+
+    def _reusePriorParse(self):
+        """Splice the prior parse onto the current parse, if they agree.
+
+        Called when the current parse has just begun a new row. If the same row
+        in the prior parse (i.e. the row with the same text, past the edit)
+        begins with the same grammar stack, the remainder of the prior parse
+        is still valid.
+
+        Returns:
+            True if the prior parse was reused.
+        """
+        prior = self._priorParse
+        nodes = self.parserNodes
+        newIndex = self.rows[-1]
+        node = nodes[newIndex]
+        begin = node[kBegin] - prior.delta
+        if begin < prior.damageEnd:
+            # Still within the edited text.
+            return False
+        priorNodes = prior.parserNodes
+        priorRows = prior.rows
+        row = prior.rowCursor
+        while row < prior.rowLimit and priorNodes.begin(priorRows[row]) < begin:
+            row += 1
+        prior.rowCursor = row
+        if row >= prior.rowLimit:
+            # Past the end of the prior parse, it's of no further use.
+            self._priorParse = None
+            return False
+        priorIndex = priorRows[row]
+        priorNode = priorNodes[priorIndex]
+        if (priorNode[kBegin] != begin or
+                priorNode[kGrammar] is not node[kGrammar]):
+            return False
+        # Compare the grammar stacks, noting where each prior stack entry is
+        # in the current parse.
+        stackMap = {}
+        priorStack = priorNode[kPrior]
+        stack = node[kPrior]
+        while priorStack is not None and stack is not None:
+            if priorNodes[priorStack][kGrammar] is not nodes[stack][kGrammar]:
+                return False
+            stackMap[priorStack] = stack
+            priorStack = priorNodes[priorStack][kPrior]
+            stack = nodes[stack][kPrior]
+        if priorStack is not stack:
+            # The stacks are different depths.
+            return False
+        # Shift the remainder of the prior parse into place. The nodes and rows
+        # are copied as arrays, the shift is applied as they're read.
+        beginDelta = prior.delta
+        visualDelta = node[kVisual] - priorNode[kVisual]
+        nodes.truncate(newIndex)
+        if not nodes.extendShifted(priorNodes, priorIndex, beginDelta,
+                                   visualDelta, stackMap):
+            # A node refers to a prior node that isn't on the stack. Don't
+            # attempt to make sense of it, reparse instead.
+            nodes.append(node)
+            self._priorParse = None
+            return False
+        newRow = len(self.rows) - 1
+        self.rows.extendShifted(priorRows, row + 1, newIndex - priorIndex)
+        self.resumeAtRow = newRow + prior.rowLimit - row
+        self._stoppedAt = None
+        self._priorParse = None
+        # The checkpoints within the reused rows are still valid.
+        self._checkpointFloor = nodes.begin(self.rows[-1])
+        return True
+
+    def _addCheckpoint(self, offset, nodeIndex):
+        """Record the grammar stack at the start of a row.
+
+        Prior checkpoints between the last one recorded by this parse and
+        |offset| are out of date, they are replaced.
+
+        Args:
+          offset (int): The data offset of the row.
+          nodeIndex (int): The parserNodes index of the node beginning the row.
+        """
+        stack = []
+        nodes = self.parserNodes
+        while nodeIndex is not None:
+            node = nodes[nodeIndex]
+            stack.append(node[kGrammar])
+            nodeIndex = node[kPrior]
+        stack.reverse()
+        offsets = self._checkpointOffsets
+        first = bisect.bisect_right(offsets, self._checkpointFloor)
+        last = bisect.bisect_right(offsets, offset)
+        offsets[first:last] = [offset]
+        self._checkpointStacks[first:last] = [tuple(stack)]
+        self._checkpointFloor = offset
+
+    def _rowAtOffset(self, offset):
+        """Get the last row that begins at or before |offset|."""
+        nodes = self.parserNodes
+        rows = self.rows
+        low = 0
+        high = len(rows) - 1
+        while low < high:
+            row = (low + high + 1) // 2
+            if nodes.begin(rows[row]) <= offset:
+                low = row
+            else:
+                high = row - 1
+        return low
+
+    def _parserForRow(self, row):
+        """Get the parser to read |row| from, and the row within that parser.
+
+        Rows far beyond the parse are read from a viewport parse (see
+        _parseViewport()). Otherwise the document is parsed through |row|.
+
+        Returns:
+            (parser, row) (tuple)
+        """
+        if row >= self.resumeAtRow + kViewportDistance:
+            viewport = self._viewport
+            if viewport is not None and viewport[0] <= row <= viewport[1]:
+                return viewport[2], row - viewport[0]
+            if row < self.rowCount():
+                viewport = self._parseViewport(row)
+                if viewport is not None:
+                    return viewport[2], row - viewport[0]
+        self._fullyParseTo(row)
+        return self, row
+
+    def _parseViewport(self, row):
+        """Parse the rows around |row| without parsing the rows prior to them.
+
+        This allows showing (and editing) a distant part of a large document
+        right away. The parse begins at the nearest checkpoint (see
+        _addCheckpoint()) or, lacking one, a few rows before |row| with a
+        guess that the root grammar is in effect. Either way, the result may
+        differ from a full parse. That's corrected when the full parse reaches
+        these rows (e.g. in Window.longTimeSlice()).
+
+        Returns:
+            The new |_viewport| (or None if |row| could not be parsed).
+        """
+        if app.config.strict_debug:
+            assert isinstance(row, int)
+            assert self.resumeAtRow <= row < len(self.rows)
+        beginRow = max(self.resumeAtRow, row - kViewportLeadRows)
+        stack = (self._defaultGrammar,)
+        nodes = self.parserNodes
+        rows = self.rows
+        index = bisect.bisect_right(self._checkpointOffsets,
+                                    nodes.begin(rows[row])) - 1
+        if index >= 0:
+            offset = self._checkpointOffsets[index]
+            checkpointRow = self._rowAtOffset(offset)
+            if (nodes.begin(rows[checkpointRow]) == offset and
+                    checkpointRow >= max(self.resumeAtRow,
+                                         row - kCheckpointRows) and
+                    self._checkpointStacks[index][0] is self._defaultGrammar):
+                beginRow = checkpointRow
+                stack = self._checkpointStacks[index]
+        # The viewport shares the data (and the data offsets and visual
+        # columns) with this parser; its row zero is |beginRow|.
+        parser = Parser(self.appPrefs)
+        parser._store = self._store
+        parser._defaultGrammar = self._defaultGrammar
+        parser.emptyNode = self.emptyNode
+        begin = nodes.begin(rows[beginRow])
+        visual = nodes[rows[beginRow]][kVisual]
+        parserNodes = parser._newParserNodes()
+        prior = None
+        for grammar in stack:
+            parserNodes.append((grammar, begin, prior, visual))
+            prior = len(parserNodes) - 1
+        # Repeat the top of the stack, so that _buildGrammarList() doesn't
+        # consider it the start of the grammar (which would skip its 'begin').
+        parserNodes.append((stack[-1], begin, parserNodes[-1][kPrior], visual))
+        parser.parserNodes = parserNodes
+        parser.rows = app.parser_nodes.newRows((len(parserNodes) - 1,))
+        parser.pauseAtRow = row + kViewportRows - beginRow
+        parser._buildGrammarList(None)
+        lastRow = beginRow + len(parser.rows) - 1
+        if lastRow + 1 == len(rows):
+            # Reached the end of the document.
+            parser._fastLineParse(self._defaultGrammar)
+        else:
+            # The last row is incomplete and the one before it is needed to
+            # find the end of the row prior to that.
+            lastRow -= 2
+        if lastRow < row:
+            return None
+        self._viewport = (beginRow, lastRow, parser)
+        self.generation += 1
+        return self._viewport
 
     def _printLastNode(self, msg):
         node = self.parserNodes[-1]
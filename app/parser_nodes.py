@@ -0,0 +1,400 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compact storage for the nodes generated by the parser.
+
+A list of (grammar, begin, prior, visual) tuples costs roughly a hundred bytes
+per node. Here each field is kept in its own array column (eight bytes per
+integer field and two bytes for the grammar), which is several times smaller
+and allows truncating or copying a range of nodes without touching each one.
+
+Reusing the remainder of a prior parse (after an edit) moves its nodes to
+another index and shifts their begin and visual values. The columns are copied
+as arrays and the shift is recorded rather than applied to each node, it's
+added as a node is read. A prior is stored as the distance back to the prior
+node, so moving a run of nodes doesn't change them. The rows are kept the same
+way, see Rows.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import array
+import bisect
+
+import app.config
+
+# The array typecode for offsets and node indexes.
+kIntType = 'q'
+# The array typecode for grammar ids.
+kGrammarIdType = 'H'
+# A |prior| is stored as the distance back to the prior node; a prior of None
+# is stored as kNoPrior.
+kNoPrior = 0
+
+
+def newRows(rows=(0,)):
+    """Create a row list (of parserNodes indexes)."""
+    return Rows(rows)
+
+
+def _addTo(values, begin, end, delta):
+    """Add |delta| to each of values[begin:end]."""
+    if delta and begin < end:
+        values[begin:end] = array.array(
+            kIntType, [i + delta for i in values[begin:end]])
+
+
+class ParserNodes:
+    """A sequence of (grammar, begin, prior, visual) tuples.
+
+    Reading a node builds a tuple, so the parser code that indexes into the
+    parserNodes list works as it did with a list of tuples. The grammar is
+    stored as an id, which indexes into |grammars|.
+    """
+
+    def __init__(self, grammars):
+        """
+        Args:
+          grammars (list of dict): The grammars by id (see
+              Prefs.grammarList). The list is shared, not copied.
+        """
+        self._grammars = grammars
+        # Grammars that are not in |grammars| (e.g. an empty grammar) are
+        # appended to a private copy of the list. Keys are id(grammar).
+        self._otherGrammars = None
+        self._grammar = array.array(kGrammarIdType)
+        self._begin = array.array(kIntType)
+        self._prior = array.array(kIntType)
+        self._visual = array.array(kIntType)
+        # The parser frequently reads the most recently appended node, so it's
+        # cached (or None).
+        self._last = None
+        # The begin and visual values of the nodes from index |_shiftAt| on
+        # are stored less |_beginShift| and |_visualShift|.
+        self._shiftAt = 0
+        self._beginShift = 0
+        self._visualShift = 0
+
+    def __len__(self):
+        return len(self._begin)
+
+    def __getitem__(self, index):
+        if index == -1 and self._last is not None:
+            return self._last
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._begin)))]
+        if index < 0:
+            index += len(self._begin)
+        begin = self._begin[index]
+        visual = self._visual[index]
+        if index >= self._shiftAt:
+            begin += self._beginShift
+            visual += self._visualShift
+        distance = self._prior[index]
+        return (self._grammars[self._grammar[index]], begin,
+                None if distance == kNoPrior else index - distance, visual)
+
+    def __iter__(self):
+        for i in range(len(self._begin)):
+            yield self[i]
+
+    def grammarId(self, grammar):
+        """Get the index of |grammar| within the grammars list."""
+        index = grammar.get('index')
+        grammars = self._grammars
+        if index is not None and index < len(grammars) and (
+                grammars[index] is grammar):
+            return index
+        if self._otherGrammars is None:
+            self._grammars = grammars = list(grammars)
+            self._otherGrammars = {}
+        index = self._otherGrammars.get(id(grammar))
+        if index is None:
+            index = len(grammars)
+            grammars.append(grammar)
+            self._otherGrammars[id(grammar)] = index
+        return index
+
+    def append(self, node):
+        grammar, begin, prior, visual = node
+        grammarId = grammar.get('index')
+        if (grammarId is None or grammarId >= len(self._grammars) or
+                self._grammars[grammarId] is not grammar):
+            grammarId = self.grammarId(grammar)
+        self._grammar.append(grammarId)
+        self._begin.append(begin - self._beginShift)
+        self._prior.append(
+            kNoPrior if prior is None else len(self._prior) - prior)
+        self._visual.append(visual - self._visualShift)
+        self._last = node
+
+    def extendRows(self, grammar, begins, visuals):
+        """Append a node (of |grammar|, without a prior) for each of the
+        |begins| and |visuals| values."""
+        if app.config.strict_debug:
+            assert len(begins) == len(visuals)
+        count = len(begins)
+        if self._beginShift or self._visualShift:
+            begins = [i - self._beginShift for i in begins]
+            visuals = [i - self._visualShift for i in visuals]
+        self._grammar.extend(
+            array.array(kGrammarIdType, [self.grammarId(grammar)]) * count)
+        self._begin.extend(begins)
+        self._prior.extend(array.array(kIntType, [kNoPrior]) * count)
+        self._visual.extend(visuals)
+        self._last = None
+
+    def begin(self, index):
+        """Get the kBegin value of a node (without building the tuple)."""
+        if index < 0:
+            index += len(self._begin)
+        if index >= self._shiftAt:
+            return self._begin[index] + self._beginShift
+        return self._begin[index]
+
+    def indexAtOffset(self, offset):
+        """Get the index of the last node beginning at or before |offset|."""
+        shiftAt = self._shiftAt
+        if shiftAt < len(self._begin) and (
+                offset >= self._begin[shiftAt] + self._beginShift):
+            return bisect.bisect_right(self._begin, offset - self._beginShift,
+                                       shiftAt) - 1
+        return bisect.bisect_right(self._begin, offset, 0, shiftAt) - 1
+
+    def grammar(self, index):
+        """Get the kGrammar value of a node (without building the tuple)."""
+        return self._grammars[self._grammar[index]]
+
+    def truncate(self, length):
+        """Remove the nodes from index |length| onward."""
+        del self._grammar[length:]
+        del self._begin[length:]
+        del self._prior[length:]
+        del self._visual[length:]
+        self._last = None
+        if self._shiftAt >= len(self._begin):
+            self._clearShift()
+
+    def _clearShift(self):
+        """Note that no node has a pending shift (i.e. no node from index
+        |_shiftAt| on)."""
+        self._shiftAt = len(self._begin)
+        self._beginShift = 0
+        self._visualShift = 0
+
+    def _moveShift(self, index):
+        """Change the first node with a pending shift to |index|, applying the
+        shift to (or removing it from) the nodes in between."""
+        shiftAt = self._shiftAt
+        if index > shiftAt:
+            _addTo(self._begin, shiftAt, index, self._beginShift)
+            _addTo(self._visual, shiftAt, index, self._visualShift)
+        else:
+            _addTo(self._begin, index, shiftAt, -self._beginShift)
+            _addTo(self._visual, index, shiftAt, -self._visualShift)
+        self._shiftAt = index
+        if index >= len(self._begin):
+            self._clearShift()
+
+    def columns(self):
+        """Get the node data as a tuple of arrays (e.g. for serialization).
+
+        Returns:
+            None if a grammar is not in the shared grammars list (so the
+            grammar ids would not be meaningful elsewhere).
+        """
+        if self._otherGrammars is not None:
+            return None
+        self._moveShift(len(self._begin))
+        return (self._grammar, self._begin, self._prior, self._visual)
+
+    def setColumns(self, columns):
+        """Replace the nodes with |columns| (see columns())."""
+        grammar, begin, prior, visual = columns
+        if app.config.strict_debug:
+            assert len(grammar) == len(begin) == len(prior) == len(visual)
+            assert max(grammar) < len(self._grammars)
+        self._grammar = array.array(kGrammarIdType, grammar)
+        self._begin = array.array(kIntType, begin)
+        self._prior = array.array(kIntType, prior)
+        self._visual = array.array(kIntType, visual)
+        self._last = None
+        self._clearShift()
+
+    def copy(self, length):
+        """Get a new ParserNodes with the first |length| nodes."""
+        result = ParserNodes(self._grammars)
+        result._otherGrammars = self._otherGrammars
+        result._grammar = self._grammar[:length]
+        result._begin = self._begin[:length]
+        result._prior = self._prior[:length]
+        result._visual = self._visual[:length]
+        if self._shiftAt < len(result._begin):
+            result._shiftAt = self._shiftAt
+            result._beginShift = self._beginShift
+            result._visualShift = self._visualShift
+        else:
+            result._clearShift()
+        return result
+
+    def extendShifted(self, other, index, beginDelta, visualDelta, priorMap):
+        """Append the nodes of |other| from |index| onward, moved into place.
+
+        Node begin and visual values are shifted by |beginDelta| and
+        |visualDelta| (lazily, see the module docstring). A prior before
+        |index| is translated by |priorMap|.
+
+        Returns:
+            False (and appends nothing) if a prior is not in |priorMap|.
+        """
+        if app.config.strict_debug:
+            assert isinstance(other, ParserNodes)
+            assert 0 <= index <= len(other)
+        newIndex = len(self._begin)
+        # Find the priors before |index|. Once two nodes in a row have no prior
+        # (i.e. are at the root of the grammar stack) the nodes after them
+        # only refer to them or to later nodes, so the search stops there.
+        otherPrior = other._prior
+        fixes = []
+        for i in range(index, len(otherPrior)):
+            distance = otherPrior[i]
+            if distance == kNoPrior:
+                if i > index and otherPrior[i - 1] == kNoPrior:
+                    break
+            elif distance > i - index:
+                prior = priorMap.get(i - distance)
+                if prior is None:
+                    return False
+                fixes.append((newIndex + i - index, prior))
+        # Copy the stored values and compose the shifts.
+        if other._shiftAt > index:
+            other._moveShift(index)
+        self._moveShift(newIndex)
+        if other._grammars is self._grammars:
+            self._grammar.extend(other._grammar[index:])
+        else:
+            for grammarId in other._grammar[index:]:
+                self._grammar.append(
+                    self.grammarId(other._grammars[grammarId]))
+        self._begin.extend(other._begin[index:])
+        self._prior.extend(otherPrior[index:])
+        self._visual.extend(other._visual[index:])
+        if newIndex < len(self._begin):
+            self._shiftAt = newIndex
+            self._beginShift = other._beginShift + beginDelta
+            self._visualShift = other._visualShift + visualDelta
+        for i, prior in fixes:
+            self._prior[i] = i - prior
+        self._last = None
+        return True
+
+
+class Rows:
+    """A sequence of parserNodes indexes, that of the node beginning each row.
+
+    As with ParserNodes, the rows moved into place by extendShifted() are
+    stored less a pending shift, which is added as a row is read.
+    """
+
+    def __init__(self, rows=()):
+        self._rows = array.array(kIntType, rows)
+        # The rows from |_shiftAt| on are stored less |_shift|.
+        self._shiftAt = len(self._rows)
+        self._shift = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._rows)))]
+        if index < 0:
+            index += len(self._rows)
+        if index >= self._shiftAt:
+            return self._rows[index] + self._shift
+        return self._rows[index]
+
+    def __iter__(self):
+        for i in range(len(self._rows)):
+            yield self[i]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Rows(%r)' % (list(self),)
+
+    def append(self, nodeIndex):
+        self._rows.append(nodeIndex - self._shift)
+
+    def extend(self, nodeIndexes):
+        if self._shift:
+            nodeIndexes = [i - self._shift for i in nodeIndexes]
+        self._rows.extend(nodeIndexes)
+
+    def truncate(self, length):
+        """Remove the rows from index |length| onward."""
+        del self._rows[length:]
+        if self._shiftAt >= len(self._rows):
+            self._clearShift()
+
+    def _clearShift(self):
+        self._shiftAt = len(self._rows)
+        self._shift = 0
+
+    def _moveShift(self, index):
+        """See ParserNodes._moveShift()."""
+        shiftAt = self._shiftAt
+        if index > shiftAt:
+            _addTo(self._rows, shiftAt, index, self._shift)
+        else:
+            _addTo(self._rows, index, shiftAt, -self._shift)
+        self._shiftAt = index
+        if index >= len(self._rows):
+            self._clearShift()
+
+    def values(self):
+        """Get the rows as an array (e.g. for serialization)."""
+        self._moveShift(len(self._rows))
+        return self._rows
+
+    def copy(self, length):
+        """Get a new Rows with the first |length| rows."""
+        result = Rows()
+        result._rows = self._rows[:length]
+        if self._shiftAt < len(result._rows):
+            result._shiftAt = self._shiftAt
+            result._shift = self._shift
+        else:
+            result._clearShift()
+        return result
+
+    def extendShifted(self, other, row, delta):
+        """Append the rows of |other| from |row| onward, shifted by |delta|
+        (lazily)."""
+        if app.config.strict_debug:
+            assert isinstance(other, Rows)
+            assert 0 <= row <= len(other)
+        newRow = len(self._rows)
+        if other._shiftAt > row:
+            other._moveShift(row)
+        self._moveShift(newRow)
+        self._rows.extend(other._rows[row:])
+        if newRow < len(self._rows):
+            self._shiftAt = newRow
+            self._shift = other._shift + delta
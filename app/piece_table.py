@@ -0,0 +1,344 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A piece table document store.
+
+The document is held as a list of pieces, each of which refers to a span of an
+immutable string (the originally loaded text or the text of an insert). An
+edit splits at most one piece and shifts the piece list, it does not copy the
+document text. The flat text is only joined together when it is requested
+(e.g. to save the document) and is then cached until the next edit. Regexes
+are run over a TextWindow, a slice of the text around the offsets searched.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+try:
+    unicode
+except NameError:
+    unicode = str
+    unichr = chr
+
+import bisect
+
+import app.config
+
+# When the piece list grows beyond this length it is joined back into a single
+# piece. This bounds the cost of an edit (which is proportional to the number
+# of pieces) independently of the size of the document.
+kMaxPieces = 512
+# A TextWindow holds at least this many characters after the offset searched
+# (and fetches a larger slice when a match may run past them).
+kWindowChars = 1 << 16
+# A TextWindow also holds this many characters before the offset searched, so
+# that e.g. ^, \b and short lookbehinds see the text before it.
+kWindowLeadChars = 256
+
+
+class PieceTable:
+    """A text store with cheap insert and delete at any offset.
+
+    The pieces are kept in parallel lists (rather than a list of piece
+    objects) for performance. |_ends| holds the running (exclusive) end offset
+    of each piece so that an offset can be found with a binary search.
+    """
+
+    def __init__(self, text=u""):
+        if app.config.strict_debug:
+            assert isinstance(text, unicode), type(text)
+        self._reset(text)
+
+    def _reset(self, text):
+        # The cached flat text; None if an edit has occurred since the last
+        # join.
+        self._text = text
+        if len(text):
+            self._buffers = [text]
+            self._starts = [0]
+            self._ends = [len(text)]
+        else:
+            self._buffers = []
+            self._starts = []
+            self._ends = []
+
+    def __len__(self):
+        return self._ends[-1] if self._ends else 0
+
+    def __getitem__(self, index):
+        """Get a character (for an int |index|) or a string (for a slice).
+
+        Slices with a step are not supported.
+        """
+        if self._text is not None:
+            return self._text[index]
+        length = len(self)
+        if isinstance(index, slice):
+            assert index.step is None
+            begin, end, _ = index.indices(length)
+            return self.slice(begin, end)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('PieceTable index out of range')
+        piece = bisect.bisect_right(self._ends, index)
+        pieceBegin = self._ends[piece - 1] if piece else 0
+        return self._buffers[piece][self._starts[piece] + index - pieceBegin]
+
+    def slice(self, begin, end):
+        """Get the text from offset |begin| to |end|, without joining the
+        pieces."""
+        if begin >= end:
+            return u""
+        ends = self._ends
+        piece = bisect.bisect_right(ends, begin)
+        out = []
+        pieceBegin = ends[piece - 1] if piece else 0
+        while pieceBegin < end:
+            start = self._starts[piece]
+            bufferBegin = start + max(begin - pieceBegin, 0)
+            bufferEnd = start + min(end, ends[piece]) - pieceBegin
+            out.append(self._buffers[piece][bufferBegin:bufferEnd])
+            pieceBegin = ends[piece]
+            piece += 1
+        return u"".join(out)
+
+    def find(self, sub, begin=0):
+        """Like unicode.find(), without joining the pieces.
+
+        Args:
+          sub (unicode): A non-empty string to find.
+          begin (int): The offset to begin looking from.
+
+        Returns:
+          The offset of the first |sub| at or after |begin|; or -1.
+        """
+        if self._text is not None:
+            return self._text.find(sub, begin)
+        ends = self._ends
+        piece = bisect.bisect_right(ends, begin)
+        pieceBegin = ends[piece - 1] if piece else 0
+        overlap = len(sub) - 1
+        while piece < len(ends):
+            start = self._starts[piece] - pieceBegin
+            found = self._buffers[piece].find(sub, start + max(
+                begin, pieceBegin), start + ends[piece])
+            if found != -1:
+                return found - start
+            if overlap and piece + 1 < len(ends):
+                # |sub| may span the end of this piece.
+                seamBegin = max(ends[piece] - overlap, begin)
+                seam = self.slice(seamBegin,
+                                   min(ends[piece] + overlap, ends[-1]))
+                found = seam.find(sub)
+                if found != -1:
+                    return seamBegin + found
+            pieceBegin = ends[piece]
+            piece += 1
+        return -1
+
+    def rfind(self, sub, begin=0, end=None):
+        """Like unicode.rfind(), without joining the pieces.
+
+        Args:
+          sub (unicode): A non-empty string to find.
+          begin (int): The offset the |sub| may begin at (or after).
+          end (int): The offset the |sub| must end at (or before); or None for
+              the end of the document.
+
+        Returns:
+          The offset of the last |sub| within [begin, end); or -1.
+        """
+        length = len(self)
+        end = length if end is None else min(end, length)
+        if self._text is not None:
+            return self._text.rfind(sub, begin, end)
+        ends = self._ends
+        piece = min(bisect.bisect_left(ends, end), len(ends) - 1)
+        overlap = len(sub) - 1
+        while piece >= 0:
+            pieceBegin = ends[piece - 1] if piece else 0
+            if overlap and ends[piece] < end:
+                # |sub| may span the end of this piece.
+                seamBegin = max(ends[piece] - overlap, begin)
+                seam = self.slice(seamBegin, min(ends[piece] + overlap, end))
+                found = seam.rfind(sub)
+                if found != -1:
+                    return seamBegin + found
+            start = self._starts[piece] - pieceBegin
+            found = self._buffers[piece].rfind(sub, start + max(
+                begin, pieceBegin), start + min(end, ends[piece]))
+            if found != -1:
+                return found - start
+            if pieceBegin <= begin:
+                break
+            piece -= 1
+        return -1
+
+    def joinedText(self):
+        """Get the whole document if the pieces are already joined (there have
+        been no edits since the last join), else None."""
+        return self._text
+
+    def isText(self, text):
+        """Whether |text| is the (joined) document itself, e.g. the string it
+        was created with, and there have been no edits since."""
+        return self._text is text
+
+    def _split(self, offset):
+        """Ensure a piece begins at |offset|.
+
+        Returns:
+            The index of the piece that begins at |offset| (which may be equal
+            to the number of pieces if |offset| is the end of the document).
+        """
+        ends = self._ends
+        piece = bisect.bisect_right(ends, offset)
+        pieceBegin = ends[piece - 1] if piece else 0
+        if pieceBegin == offset or piece == len(ends):
+            return piece
+        # Split the piece in two.
+        start = self._starts[piece]
+        self._buffers.insert(piece, self._buffers[piece])
+        self._starts.insert(piece + 1, start + offset - pieceBegin)
+        ends.insert(piece, offset)
+        return piece + 1
+
+    def _adjustEnds(self, piece, delta):
+        ends = self._ends
+        for i in range(piece, len(ends)):
+            ends[i] += delta
+
+    def delete(self, begin, end):
+        """Remove the text from |begin| up to (not including) |end|."""
+        if app.config.strict_debug:
+            assert isinstance(begin, int)
+            assert isinstance(end, int)
+            assert 0 <= begin <= end <= len(self), (begin, end, len(self))
+        if begin == end:
+            return
+        if begin == 0 and end == len(self):
+            self._reset(u"")
+            return
+        self._text = None
+        first = self._split(begin)
+        last = self._split(end)
+        del self._buffers[first:last]
+        del self._starts[first:last]
+        del self._ends[first:last]
+        self._adjustEnds(first, begin - end)
+        self._compactMaybe()
+
+    def insert(self, offset, text):
+        """Add |text| so that it begins at |offset|."""
+        if app.config.strict_debug:
+            assert isinstance(offset, int)
+            assert isinstance(text, unicode), type(text)
+            assert 0 <= offset <= len(self), (offset, len(self))
+        if not len(text):
+            return
+        self._text = None
+        piece = self._split(offset)
+        self._buffers.insert(piece, text)
+        self._starts.insert(piece, 0)
+        self._ends.insert(piece, offset)
+        self._adjustEnds(piece, len(text))
+        self._compactMaybe()
+
+    def pieceCount(self):
+        return len(self._ends)
+
+    def _compactMaybe(self):
+        if len(self._ends) > kMaxPieces:
+            self.text()
+
+    def text(self):
+        """Get the whole document as a single (unicode) string."""
+        if self._text is None:
+            self._reset(self.slice(0, len(self)))
+        return self._text
+
+
+class TextWindow:
+    """A slice of the text of a PieceTable, for running regexes from an offset
+    without joining the whole document.
+
+    The slice is fetched again when an offset beyond it is searched, or made
+    larger when a match may run past its end. If the pieces are already joined
+    the whole text is used. A TextWindow is for a series of searches with no
+    edits in between (e.g. a single pass of the parser).
+    """
+
+    def __init__(self, store):
+        if app.config.strict_debug:
+            assert isinstance(store, PieceTable)
+        self._store = store
+        # The document offset of text[0].
+        self.base = 0
+        self.text = u""
+
+    def _cover(self, begin, end):
+        """Ensure |text| holds the document from kWindowLeadChars before
+        |begin| to |end| (or to the end of the document)."""
+        store = self._store
+        end = min(end, len(store))
+        lead = max(0, begin - kWindowLeadChars)
+        if self.base <= lead and end <= self.base + len(self.text):
+            return
+        text = store.joinedText()
+        if text is not None:
+            self.base = 0
+            self.text = text
+            return
+        self.base = lead
+        self.text = store.slice(lead, min(end + kWindowChars, len(store)))
+
+    def match(self, regex, offset):
+        """Like regex.match() at document |offset|.
+
+        Returns:
+          The match (or None). Its positions are relative to |base|, i.e. the
+          match ends at base + found.end().
+        """
+        return self._run(regex.match, offset, True)
+
+    def search(self, regex, offset, endPos=None):
+        """Like regex.search() of the document from |offset| (and up to
+        |endPos|, if given).
+
+        Returns:
+          The match (or None). Its positions are relative to |base|, i.e. the
+          match begins at base + found.start().
+        """
+        if endPos is not None:
+            self._cover(offset, endPos)
+            return regex.search(self.text, offset - self.base,
+                                endPos - self.base)
+        return self._run(regex.search, offset, False)
+
+    def _run(self, method, offset, anchored):
+        length = len(self._store)
+        size = kWindowChars
+        while True:
+            self._cover(offset, offset + size)
+            found = method(self.text, offset - self.base)
+            textEnd = self.base + len(self.text)
+            if textEnd >= length:
+                return found
+            if found is None:
+                if anchored:
+                    return None
+            elif self.base + found.end() < textEnd:
+                return found
+            # The match may be beyond the slice, or run past it.
+            size *= 4
@@ -83,9 +83,7 @@ class PredictionListController(app.controller.Controller):
             # Add alternate files.
             dirPath, fileName = os.path.split(currentFile)
             fileName, ext = os.path.splitext(fileName)
-            # TODO(dschuyler): rework this ignore list.
-            ignoreExt = set(('.pyc', '.pyo', '.o', '.obj', '.tgz', '.zip',
-                             '.tar'))
+            ignoreExt = app.buffer_file.kIgnoreExt
             try:
                 contents = os.listdir(
                     os.path.expandvars(os.path.expanduser(dirPath)) or '.')
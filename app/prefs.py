@@ -17,6 +17,7 @@ from __future__ import division
 from __future__ import print_function
 
 import curses
+import hashlib
 import io
 import json
 import os
@@ -138,10 +139,16 @@ class Prefs():
 
     def __setUpGrammars(self, defaultGrammars):
         self.grammars = {}
+        # The grammars by id (the order is arbitrary, but stable). Parser nodes
+        # refer to a grammar by its 'index' into this list.
+        self.grammarList = []
         # Arrange all the grammars by name.
         for k, v in defaultGrammars.items():
             v['name'] = k
+            v['index'] = len(self.grammarList)
+            v.setdefault('brackets', 'comment' not in k and 'string' not in k)
             self.grammars[k] = v
+            self.grammarList.append(v)
 
         # Compile regexes for each grammar.
         for k, v in defaultGrammars.items():
@@ -204,7 +211,12 @@ class Prefs():
             # Carriage return characters are at index [-1] in markers.
             markers.append(r'\n')
             #app.log.startup('markers', v['name'], markers)
-            v['matchRe'] = re.compile(app.regex.joinReList(markers))
+            # The parser searches the whole document from an offset, so '^'
+            # must match at the start of any line (not just the document).
+            v['matchRe'] = re.compile(
+                app.regex.joinReList(markers), re.MULTILINE)
+            if v.get('begin'):
+                v['beginRe'] = re.compile(v['begin'], re.MULTILINE)
             v['markers'] = markers
             v['matchGrammars'] = matchGrammars
             containsGrammarIndexLimit = 2 + len(v.get('contains', []))
@@ -219,6 +231,16 @@ class Prefs():
                                 keywordIndexLimit, typeIndexLimit,
                                 specialIndexLimit)
 
+        # A fingerprint of the grammar definitions (e.g. so that stored parse
+        # results can be discarded if the grammars change). This is computed
+        # before parsing, which may alter the 'end' of some grammars.
+        hasher = hashlib.sha1()
+        for v in self.grammarList:
+            hasher.update(repr((v['name'], v['markers'], v['indexLimits'], [
+                g and g['name'] for g in v['matchGrammars']
+            ])).encode('utf-8'))
+        self.grammarsChecksum = hasher.hexdigest()
+
         # Reset the re.cache for user regexes.
         re.purge()
 
@@ -16,9 +16,15 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import io
+import os
+import sys
+import threading
 import time
 
 profiles = {}
+# Background task timing; {name: [calls, total seconds, longest seconds]}.
+tasks = {}
 
 
 def start():
@@ -30,7 +36,7 @@ def current(key, value):
 
 
 def highest(key, value):
-    if value > profiles.get(key):
+    if key not in profiles or value > profiles[key]:
         profiles[key] = value
 
 
@@ -40,9 +46,7 @@ def lowest(key, value):
 
 
 def highestDelta(key, startTime):
-    delta = time.time() - startTime
-    if delta > profiles.get(key):
-        profiles[key] = delta
+    highest(key, time.time() - startTime)
 
 
 def runningDelta(key, startTime):
@@ -51,8 +55,27 @@ def runningDelta(key, startTime):
     profiles[key] = delta * bleed + profiles.get(key, delta) * (1 - bleed)
 
 
+def taskDelta(key, startTime):
+    """Record a run of the background task |key|."""
+    delta = time.time() - startTime
+    entry = tasks.get(key)
+    if entry is None:
+        tasks[key] = [1, delta, delta]
+        return
+    entry[0] += 1
+    entry[1] += delta
+    if delta > entry[2]:
+        entry[2] = delta
+
+
 def results():
-    return "one\ntwo\nthree"
+    """The recorded values and background task times, one per line."""
+    lines = [u"%s: %s" % (key, profiles[key]) for key in sorted(profiles)]
+    for key in sorted(tasks):
+        calls, total, longest = tasks[key]
+        lines.append(u"task %s: calls %d total %.3fs longest %.3fs" %
+                     (key, calls, total, longest))
+    return u"\n".join(lines)
 
 
 #----------------------------
@@ -60,7 +83,11 @@ def results():
 import app.log
 import cProfile
 import pstats
-import io
+try:
+    # Python 2, pstats writes byte strings.
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 
 def beginPythonProfile():
@@ -71,7 +98,78 @@ def beginPythonProfile():
 
 def endPythonProfile(profile):
     profile.disable()
-    output = io.StringIO.StringIO()
+    app.log.info(pythonProfileText(profile))
+
+
+def pythonProfileText(profile):
+    """Get the stats of a (disabled) cProfile.Profile, by cumulative time."""
+    output = StringIO()
     stats = pstats.Stats(profile, stream=output).sort_stats('cumulative')
     stats.print_stats()
-    app.log.info(output.getvalue())
+    return output.getvalue()
+
+
+# The time between samples, in seconds.
+kSampleSeconds = 0.01
+
+
+class SamplingProfiler(threading.Thread):
+    """Periodically record the stacks of the main and background threads.
+
+    Unlike cProfile, the threads being sampled are not slowed down (other
+    than sharing the interpreter). The stacks are counted, to be written in
+    the collapsed stack format read by flame graph tools, i.e. a line of
+    "thread;outer function;...;inner function count" per stack.
+    """
+
+    def __init__(self,
+                 threadNames=(u'MainThread', u'ci_edit_bg'),
+                 sampleSeconds=kSampleSeconds):
+        threading.Thread.__init__(self, name=u'ci_edit_profiler')
+        self.daemon = True
+        self.threadNames = threadNames
+        self.sampleSeconds = sampleSeconds
+        # {collapsed stack: sample count}.
+        self.stacks = {}
+        self.sampleCount = 0
+        self._stopEvent = threading.Event()
+
+    def run(self):
+        while not self._stopEvent.wait(self.sampleSeconds):
+            self.sample()
+
+    def stop(self):
+        """Stop sampling (and wait for the thread to finish)."""
+        self._stopEvent.set()
+        self.join()
+
+    def sample(self):
+        """Record the current stack of each of the threads."""
+        names = {}
+        for thread in threading.enumerate():
+            if thread.name in self.threadNames:
+                names[thread.ident] = thread.name
+        for ident, frame in sys._current_frames().items():
+            name = names.get(ident)
+            if name is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(u"%s (%s:%d)" %
+                             (code.co_name, os.path.basename(
+                                 code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            stack.append(name)
+            key = u";".join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.sampleCount += 1
+
+    def collapsed(self):
+        """The stacks in collapsed stack format (see the class docstring)."""
+        return u"".join(u"%s %d\n" % (stack, self.stacks[stack])
+                        for stack in sorted(self.stacks))
+
+    def write(self, path):
+        with io.open(path, 'w', encoding=u"utf-8") as output:
+            output.write(self.collapsed())
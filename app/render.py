@@ -16,6 +16,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import app.curses_util
+
+# Unchanged cells between two changed runs (of the same style) are redrawn if
+# there are at most this many, so that one addStr covers both runs.
+kMaxBridgedCells = 4
+
 
 class Frame:
 
@@ -41,3 +47,117 @@ class Frame:
         self.cursor = None
         self.cmdCount = None
         return r
+
+
+class DamageTracker:
+    """Reduce each drawList to the parts of the screen that changed.
+
+    The characters and styles of the screen cells are kept from the prior
+    frames. A drawList is applied to a copy of the rows it touches; only the
+    runs of cells that differ are returned, with adjacent runs of the same
+    style joined into one addStr.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget the screen contents (e.g. after a resize), so that the next
+        frame is drawn in full."""
+        # The drawList entries of each row in the prior frame.
+        self._rowEntries = {}
+        # The character (None if unknown, u"" for the second half of a double
+        # wide character) and style of each cell, by row.
+        self._chars = {}
+        self._styles = {}
+
+    def diff(self, drawList):
+        """Get the drawList entries that update the screen from the prior
+        frames to |drawList|."""
+        entriesByRow = {}
+        for entry in drawList:
+            entriesByRow.setdefault(entry[0], []).append(entry)
+        out = []
+        for row in sorted(entriesByRow):
+            entries = entriesByRow[row]
+            if self._rowEntries.get(row) == entries:
+                continue
+            self._rowEntries[row] = entries
+            priorChars = self._chars.get(row, [])
+            priorStyles = self._styles.get(row, [])
+            chars = list(priorChars)
+            styles = list(priorStyles)
+            for _, col, text, style in entries:
+                self._applyText(chars, styles, col, text, style)
+            self._chars[row] = chars
+            self._styles[row] = styles
+            out += self._changedRuns(row, chars, styles, priorChars,
+                                     priorStyles)
+        return out
+
+    def _applyText(self, chars, styles, col, text, style):
+        if isinstance(text, bytes):
+            text = text.decode(u"utf-8")
+        if len(chars) < col:
+            chars += [None] * (col - len(chars))
+            styles += [None] * (col - len(styles))
+        if 0 < col < len(chars) and chars[col] == u"":
+            # Half of a double wide character is overwritten.
+            chars[col - 1] = None
+        if text and u" " <= min(text) and max(text) < u"ᄀ":
+            # Optimization: one cell per character.
+            end = col + len(text)
+            chars[col:end] = list(text)
+            styles[col:end] = [style] * len(text)
+        else:
+            end = col
+            for ch in text:
+                if app.curses_util.isZeroWidth(ch):
+                    if end > col:
+                        # Combine with the prior character.
+                        prior = end - (2 if chars[end - 1] == u"" else 1)
+                        chars[prior] += ch
+                    continue
+                cells = [ch, u""] if app.curses_util.isDoubleWidth(ch) else [ch]
+                chars[end:end + len(cells)] = cells
+                styles[end:end + len(cells)] = [style] * len(cells)
+                end += len(cells)
+        if end < len(chars) and chars[end] == u"":
+            chars[end] = None
+
+    def _changedRuns(self, row, chars, styles, priorChars, priorStyles):
+        runs = []
+        runStart = runEnd = runStyle = None
+        priorLen = len(priorChars)
+        for i, ch in enumerate(chars):
+            if ch is None:
+                continue
+            style = styles[i]
+            if (i < priorLen and ch == priorChars[i] and
+                    style == priorStyles[i]):
+                continue
+            if (runStyle == style and i - runEnd <= kMaxBridgedCells and
+                    self._isSameStyle(chars, styles, runEnd, i, style)):
+                runEnd = i + 1
+                continue
+            if runStart is not None:
+                runs.append((row, runStart,
+                             u"".join(chars[runStart:runEnd]).encode(u"utf-8"),
+                             runStyle))
+            runStart = i
+            if ch == u"" and i > 0 and chars[i - 1] is not None:
+                # Start with the first half of a double wide character.
+                runStart = i - 1
+            runEnd = i + 1
+            runStyle = style
+        if runStart is not None:
+            runs.append((row, runStart,
+                         u"".join(chars[runStart:runEnd]).encode(u"utf-8"),
+                         runStyle))
+        return runs
+
+    def _isSameStyle(self, chars, styles, begin, end, style):
+        for i in range(begin, end):
+            if chars[i] is None or styles[i] != style:
+                return False
+        return True
@@ -0,0 +1,110 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  Replace every match of a pattern within a document, a time slice at a time.
+
+  The substitutions are collected (see ReplaceAll.step()) and then made as a
+  single 'sr' change (see Actions.findReplace() and Parser.substitute()),
+  which records only the text that was replaced.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import array
+
+
+class ReplaceAll:
+    """Find the substitutions of |regex| with |replace| in |data|.
+
+    Substitutions that don't change the text are left out.
+    """
+
+    def __init__(self, regex, replace, data, begin=0, end=None):
+        """
+        Args:
+          regex (compiled regex): The pattern to replace.
+          replace (unicode): The replacement, which may refer to groups of the
+              match (as with re.sub()).
+          data (unicode): The document.
+          begin (int): The data offset to search from.
+          end (int): The data offset to search to (or None for the end of the
+              data). Matches end by here, as if the data ended here.
+        """
+        self.regex = regex
+        self.replace = replace
+        self.data = data
+        self.begin = begin
+        self.end = len(data) if end is None else end
+        # The next search begins here.
+        self.offset = begin
+        # The data offset, the replaced text, and the new text of each
+        # substitution, in document order.
+        self.offsets = array.array('q')
+        self.olds = []
+        self.news = []
+
+    def progress(self):
+        """The fraction of the data searched, from 0.0 to 1.0."""
+        if self.end <= self.begin:
+            return 1.0
+        return min(1.0, (self.offset - self.begin) / (self.end - self.begin))
+
+    def step(self, bgThread=None):
+        """Find more of the substitutions.
+
+        Args:
+          bgThread (BackgroundThread): Stop early when it should yield (see
+              BackgroundThread.shouldYield()). If None, find all of them.
+
+        Returns:
+          Whether all the substitutions have been found.
+        """
+        data = self.data
+        limit = self.end
+        regex = self.regex
+        offsets = self.offsets
+        olds = self.olds
+        news = self.news
+        offset = self.offset
+        # An empty match may be at the end of the range.
+        while offset <= limit:
+            if bgThread is not None and bgThread.shouldYield():
+                break
+            match = regex.search(data, offset, limit)
+            if match is None:
+                offset = limit + 1
+                break
+            begin, end = match.span()
+            old = match.group()
+            new = match.expand(self.replace)
+            if new != old:
+                # Share equal strings (e.g. a replacement without groups) to
+                # keep the change small.
+                if olds and old == olds[-1]:
+                    old = olds[-1]
+                if news and new == news[-1]:
+                    new = news[-1]
+                offsets.append(begin)
+                olds.append(old)
+                news.append(new)
+            offset = end if end > begin else end + 1
+        self.offset = offset
+        return offset > limit
+
+    def change(self):
+        """The 'sr' change for the substitutions found (see
+        Mutator.redoAddChange())."""
+        return (u'sr', (self.offsets, tuple(self.olds), tuple(self.news)))
@@ -93,6 +93,8 @@ class Dictionary:
     def __init__(self, dictionaryList, pathPrefs):
         self.osDictionary = OsDictionary()
         self.pathPrefs = pathPrefs
+        # Incremented when the words change. See Parser.generation.
+        self.generation = 0
 
         self.grammarWords = {}
         self.loadWords(os.path.dirname(__file__))
@@ -129,6 +131,7 @@ class Dictionary:
                         p for l in lines for w in l.split()
                         for p in w.split("'")
                     ])
+                    self.generation += 1
 
     def isCorrect(self, word, grammarName):
         if len(word) <= 1:
@@ -17,6 +17,7 @@ from __future__ import division
 from __future__ import print_function
 
 import curses
+import itertools
 import re
 import sys
 
@@ -27,6 +28,32 @@ import app.log
 import app.parser
 import app.selectable
 
+# The number of rows to keep in the row render cache.
+kRowRenderCacheSize = 1000
+
+
+def mergeOverlayRuns(runs, startCol, endCol):
+    """Merge overlapping (beginCol, endCol, color) runs, where later runs cover
+    earlier ones, into runs that don't overlap.
+
+    Only the columns from |startCol| to |endCol| are included. Adjacent runs
+    of the same color are joined.
+    """
+    cells = [None] * (endCol - startCol)
+    for begin, end, color in runs:
+        begin = max(begin, startCol) - startCol
+        end = min(end, endCol) - startCol
+        if begin < end:
+            cells[begin:end] = [color] * (end - begin)
+    merged = []
+    col = startCol
+    for color, group in itertools.groupby(cells):
+        width = len(list(group))
+        if color is not None:
+            merged.append((col, col + width, color))
+        col += width
+    return merged
+
 
 class TextBuffer(app.actions.Actions):
     """The TextBuffer adds the drawing/rendering to the BackingTextBuffer."""
@@ -37,6 +64,10 @@ class TextBuffer(app.actions.Actions):
         self.highlightRe = None
         self.highlightCursorLine = False
         self.highlightTrailingWhitespace = True
+        # The spans drawn for each row, see drawTextArea(). The cache is
+        # cleared when the |_rowRenderState| changes.
+        self._rowRenderCache = {}
+        self._rowRenderState = None
 
     def checkScrollToCursor(self, window):
         """Move the selected view rectangle so that the cursor is visible."""
@@ -125,68 +156,29 @@ class TextBuffer(app.actions.Actions):
         startCol = self.view.scrollCol + left
         endCol = startCol + cols
         appPrefs = self.view.program.prefs
-        defaultColor = appPrefs.color['default']
         spellChecking = appPrefs.editor.get('spellChecking', True)
         colorPref = self.view.colorPref
-        spelling = self.program.dictionary
-        spelling.setUpWordsForPath(self.fullPath)
+        self.program.dictionary.setUpWordsForPath(self.fullPath)
         if self.parser:
             # Highlight grammar.
             rowLimit = min(max(self.parser.rowCount() - startRow, 0), rows)
+            renderState = (self.parser, self.parser.generation, self.view,
+                           self.fullPath, spellChecking,
+                           self.program.color.generation,
+                           self.program.dictionary.generation)
+            if self._rowRenderState != renderState or (
+                    len(self._rowRenderCache) > kRowRenderCacheSize):
+                self._rowRenderState = renderState
+                self._rowRenderCache = {}
             for i in range(rowLimit):
-                line, renderedWidth = self.parser.rowTextAndWidth(startRow + i)
-                k = startCol
-                if k == 0:
-                    # When rendering from column 0 the grammar index is always
-                    # zero.
-                    grammarIndex = 0
-                else:
-                    # When starting mid-line, find starting grammar index.
-                    grammarIndex = self.parser.grammarIndexFromRowCol(
-                        startRow + i, k)
-                while k < endCol:
-                    (node, preceding, remaining, eol) = self.parser.grammarAtIndex(
-                        startRow + i, k, grammarIndex)
-                    grammarIndex += 1
-                    if remaining == 0 and not eol:
-                        continue
-                    remaining = min(renderedWidth - k, remaining)
-                    length = min(endCol - k, remaining)
-                    color = colorPref(
-                        node.grammar.get(u'colorIndex', defaultColor),
-                        colorDelta)
-                    if eol or length <= 0:
-                        window.addStr(top + i, left + k - startCol,
-                                      u' ' * (endCol - k), color)
-                        break
-                    window.addStr(
-                        top + i, left + k - startCol,
-                        app.curses_util.renderedSubStr(line, k, k + length),
-                        color)
-                    subStart = k - preceding
-                    subEnd = k + remaining
-                    subLine = line[subStart:subEnd]
-                    if spellChecking and node.grammar.get(u'spelling', True):
-                        # Highlight spelling errors
-                        grammarName = node.grammar.get(u'name', 'unknown')
-                        misspellingColor = colorPref(
-                            u'misspelling', colorDelta)
-                        for found in re.finditer(app.regex.kReSubwords,
-                                                 subLine):
-                            reg = found.regs[0]  # Mispelllled word
-                            offsetStart = subStart + reg[0]
-                            offsetEnd = subStart + reg[1]
-                            if startCol < offsetEnd and offsetStart < endCol:
-                                word = line[offsetStart:offsetEnd]
-                                if not spelling.isCorrect(word, grammarName):
-                                    if startCol > offsetStart:
-                                        offsetStart += startCol - offsetStart
-                                    wordFragment = line[offsetStart:min(
-                                        endCol, offsetEnd)]
-                                    window.addStr(
-                                        top + i, left + offsetStart - startCol,
-                                        wordFragment, misspellingColor)
-                    k += length
+                key = (startRow + i, startCol, cols, colorDelta)
+                spans = self._rowRenderCache.get(key)
+                if spans is None:
+                    spans = self._renderRow(startRow + i, startCol, endCol,
+                                            colorDelta, spellChecking)
+                    self._rowRenderCache[key] = spans
+                for col, text, color in spans:
+                    window.addStr(top + i, left + col, text, color)
         else:
             # For testing, draw without parser.
             rowLimit = min(max(self.parser.rowCount() - startRow, 0), rows)
@@ -201,130 +193,176 @@ class TextBuffer(app.actions.Actions):
                 window.addStr(self.penRow - startRow, self.penCol - startCol,
                               u'X', 200)
 
+    def _renderRow(self, row, startCol, endCol, colorDelta, spellChecking):
+        """Get the (col, text, color) spans that draw |row| from |startCol|
+        to |endCol|. The |col| is relative to |startCol|."""
+        spans = []
+        defaultColor = self.view.program.prefs.color['default']
+        colorPref = self.view.colorPref
+        spelling = self.program.dictionary
+        line, renderedWidth = self.parser.rowTextAndWidth(row)
+        k = startCol
+        if k == 0:
+            # When rendering from column 0 the grammar index is always zero.
+            grammarIndex = 0
+        else:
+            # When starting mid-line, find starting grammar index.
+            grammarIndex = self.parser.grammarIndexFromRowCol(row, k)
+        while k < endCol:
+            (node, preceding, remaining, eol) = self.parser.grammarAtIndex(
+                row, k, grammarIndex)
+            grammarIndex += 1
+            if remaining == 0 and not eol:
+                continue
+            remaining = min(renderedWidth - k, remaining)
+            length = min(endCol - k, remaining)
+            color = colorPref(
+                node.grammar.get(u'colorIndex', defaultColor), colorDelta)
+            if eol or length <= 0:
+                spans.append((k - startCol, u' ' * (endCol - k), color))
+                break
+            spans.append((k - startCol,
+                          app.curses_util.renderedSubStr(line, k, k + length),
+                          color))
+            subStart = k - preceding
+            subEnd = k + remaining
+            subLine = line[subStart:subEnd]
+            if spellChecking and node.grammar.get(u'spelling', True):
+                # Highlight spelling errors
+                grammarName = node.grammar.get(u'name', 'unknown')
+                misspellingColor = colorPref(u'misspelling', colorDelta)
+                for found in re.finditer(app.regex.kReSubwords, subLine):
+                    reg = found.regs[0]  # Mispelllled word
+                    offsetStart = subStart + reg[0]
+                    offsetEnd = subStart + reg[1]
+                    if startCol < offsetEnd and offsetStart < endCol:
+                        word = line[offsetStart:offsetEnd]
+                        if not spelling.isCorrect(word, grammarName):
+                            if startCol > offsetStart:
+                                offsetStart += startCol - offsetStart
+                            wordFragment = line[offsetStart:min(
+                                endCol, offsetEnd)]
+                            spans.append((offsetStart - startCol, wordFragment,
+                                          misspellingColor))
+            k += length
+        return spans
+
     def drawOverlays(self, window, top, left, maxRow, maxCol, colorDelta):
+        """Draw the highlights (brackets, find matches, the selection, etc.)
+        over the text.
+
+        The highlights of each row are merged so that each cell is drawn once,
+        in the color of the last layer that covers it (see overlayRuns()).
+        """
         startRow = self.view.scrollRow + top
-        endRow = self.view.scrollRow + top + maxRow
         startCol = self.view.scrollCol + left
-        endCol = self.view.scrollCol + left + maxCol
+        endCol = startCol + maxCol
         rowLimit = min(max(self.parser.rowCount() - startRow, 0), maxRow)
+        overlays = self.overlayRuns(startRow, startRow + rowLimit, startCol,
+                                    endCol, colorDelta)
+        for row, runs in overlays.items():
+            line = self.parser.rowText(row)
+            for begin, end, color in mergeOverlayRuns(runs, startCol, endCol):
+                text = app.curses_util.renderedSubStr(line, begin, end)
+                # Runs may extend past the end of the line (e.g. a selected
+                # line end).
+                text += u" " * (end - begin - app.curses_util.columnWidth(text))
+                window.addStr(top + row - startRow, left + begin - startCol,
+                              text, color)
+
+    def overlayRuns(self, startRow, endRow, startCol, endCol, colorDelta):
+        """Get the highlights of the rows from |startRow| to |endRow|.
+
+        Returns:
+          A dict of {row: [(beginCol, endCol, color), ...]}. The runs of a row
+          are in layer order, later runs are drawn over earlier ones.
+        """
         colorPref = self.view.colorPref
-        if 1:
-            # Highlight brackets.
-            # Highlight numbers.
-            # Highlight space ending lines.
-            colors = (colorPref(u'bracket', colorDelta),
-                      colorPref(u'number', colorDelta),
-                      colorPref(u'trailing_space', colorDelta))
-            for i in range(rowLimit):
-                line = self.parser.rowText(startRow + i)
-                highlightTrailingWhitespace = (
-                    self.highlightTrailingWhitespace and
-                    not (startRow + i == self.penRow and
-                         self.penCol == len(line)))
-                for s, column, _, index in app.curses_util.renderedFindIter(
-                        line, startCol, endCol, (u'[]{}()',), True,
-                        highlightTrailingWhitespace):
-                    window.addStr(top + i, column - self.view.scrollCol, s,
-                                  colors[index])
-        if 1:
-            # Match brackets.
-            if (self.parser.rowCount() > self.penRow and
-                    len(self.parser.rowText(self.penRow)) > self.penCol):
-                ch = app.curses_util.charAtColumn(
-                    self.penCol, self.parser.rowText(self.penRow))
-                matchingBracketRowCol = self.getMatchingBracketRowCol()
-                if matchingBracketRowCol is not None:
-                    matchingBracketRow = matchingBracketRowCol[0]
-                    matchingBracketCol = matchingBracketRowCol[1]
-                    window.addStr(
-                        top + self.penRow - startRow,
-                        self.penCol - self.view.scrollCol,
-                        ch,
-                        colorPref(u'matching_bracket', colorDelta))
-                    characterFinder = {
-                        u'(': u')',
-                        u'[': u']',
-                        u'{': u'}',
-                        u')': u'(',
-                        u']': u'[',
-                        u'}': u'{',
-                    }
-                    oppCharacter = characterFinder[ch]
-                    window.addStr(
-                        top + matchingBracketRow - startRow,
-                        matchingBracketCol - self.view.scrollCol, oppCharacter,
-                        colorPref(u'matching_bracket', colorDelta))
-        if self.highlightCursorLine:
+        overlays = {}
+
+        def addRun(row, begin, end, color):
+            if begin < end:
+                overlays.setdefault(row, []).append((begin, end, color))
+
+        # Highlight brackets, numbers, and space ending lines.
+        colors = (colorPref(u'bracket', colorDelta),
+                  colorPref(u'number', colorDelta),
+                  colorPref(u'trailing_space', colorDelta))
+        for row in range(startRow, endRow):
+            line = self.parser.rowText(row)
+            highlightTrailingWhitespace = (self.highlightTrailingWhitespace and
+                                           not (row == self.penRow and
+                                                self.penCol == len(line)))
+            for s, column, _, index in app.curses_util.renderedFindIter(
+                    line, startCol, endCol, (u'[]{}()',), True,
+                    highlightTrailingWhitespace):
+                addRun(row, column, column + len(s), colors[index])
+        # Match brackets.
+        matchingBracketRowCol = self.getMatchingBracketRowCol()
+        if matchingBracketRowCol is not None:
+            color = colorPref(u'matching_bracket', colorDelta)
+            addRun(self.penRow, self.penCol, self.penCol + 1, color)
+            matchingBracketRow, matchingBracketCol = matchingBracketRowCol
+            if startRow <= matchingBracketRow < endRow:
+                addRun(matchingBracketRow, matchingBracketCol,
+                       matchingBracketCol + 1, color)
+        if (self.highlightCursorLine and self.view.hasFocus and
+                startRow <= self.penRow < endRow):
             # Highlight the whole line at the cursor location.
-            if self.view.hasFocus and startRow <= self.penRow < startRow + rowLimit:
-                line = self.parser.rowText(self.penRow)[startCol:endCol]
-                window.addStr(top + self.penRow - startRow, left, line,
-                              colorPref(u'current_line', colorDelta))
-        if self.findRe is not None:
+            addRun(self.penRow, startCol, self.parser.rowWidth(self.penRow),
+                   colorPref(u'current_line', colorDelta))
+        index = self.findMatchIndex()
+        if index is not None:
+            parser = self.parser
+            index.refresh(parser.store())
+            begin = parser.rowColOffset(startRow, 0)
+            end = parser.rowColOffset(endRow, 0)
+            if index.scannedTo < end and not index.isComplete(
+                    parser.dataLength()):
+                # Leave the rows not yet indexed to the search below.
+                index = None
+        if index is not None:
+            # Highlight find, from the match index.
+            color = colorPref('found_find', colorDelta)
+            for matchBegin, matchEnd in index.spans(begin, end):
+                row, col = parser.offsetRowCol(matchBegin)
+                lastRow, lastCol = parser.offsetRowCol(matchEnd)
+                while row < lastRow:
+                    # The match continues on the next row.
+                    addRun(row, col, parser.rowWidth(row), color)
+                    row += 1
+                    col = 0
+                addRun(row, col, lastCol, color)
+        elif self.findRe is not None:
             # Highlight find.
-            for i in range(rowLimit):
-                line = self.parser.rowText(startRow + i)[startCol:endCol]
-                for k in self.findRe.finditer(line):
-                    reg = k.regs[0]
-                    #for ref in k.regs[1:]:
-                    window.addStr(top + i, left + reg[0], line[reg[0]:reg[1]],
-                                  colorPref('found_find', colorDelta))
-        if rowLimit and self.selectionMode != app.selectable.kSelectionNone:
+            color = colorPref('found_find', colorDelta)
+            for row in range(startRow, endRow):
+                line, width = self.parser.rowTextAndWidth(row)
+                for found in self.findRe.finditer(line):
+                    begin, end = found.span()
+                    if width != len(line):
+                        # Convert the indexes to columns.
+                        end = app.curses_util.columnWidth(line[:end])
+                        begin = app.curses_util.columnWidth(line[:begin])
+                    addRun(row, begin, end, color)
+        if self.selectionMode != app.selectable.kSelectionNone:
             # Highlight selected text.
-            colorSelected = colorPref('selected')
+            color = colorPref('selected')
             upperRow, upperCol, lowerRow, lowerCol = self.startAndEnd()
-            if 1:
-                selStartCol = max(upperCol, startCol)
-                selEndCol = min(lowerCol, endCol)
-                start = max(0, min(upperRow - startRow, maxRow))
-                end = max(0, min(lowerRow - startRow, maxRow))
+            for row in range(max(upperRow, startRow), min(lowerRow + 1,
+                                                          endRow)):
+                width = self.parser.rowWidth(row)
                 if self.selectionMode == app.selectable.kSelectionBlock:
-                    if not (lowerRow < startRow or upperRow >= endRow or
-                            lowerCol < startCol or upperCol >= endCol):
-                        # There is an overlap.
-                        for i in range(start, end + 1):
-                            line = self.parser.rowText(startRow +
-                                                       i)[selStartCol:selEndCol]
-                            window.addStr(top + i, selStartCol, line,
-                                          colorSelected)
-                elif (self.selectionMode == app.selectable.kSelectionAll or
-                      self.selectionMode == app.selectable.kSelectionCharacter
-                      or self.selectionMode == app.selectable.kSelectionLine or
-                      self.selectionMode == app.selectable.kSelectionWord):
-                    if not (lowerRow < startRow or upperRow >= endRow):
-                        # There is an overlap.
-                        # Go one row past the selection or to the last line.
-                        for i in range(
-                                start,
-                                min(end + 1,
-                                    self.parser.rowCount() - startRow)):
-                            line = self.parser.rowText(startRow + i)
-                            # TODO(dschuyler): This is essentially
-                            # left + (upperCol or (scrollCol + left)) -
-                            #    scrollCol - left
-                            # which seems like it could be simplified.
-                            paneCol = left + selStartCol - startCol
-                            if len(line) == len(
-                                    self.parser.rowText(startRow + i)):
-                                line += " "  # Maybe do: "\\n".
-                            if (i == lowerRow - startRow and
-                                    i == upperRow - startRow):
-                                # Selection entirely on one line.
-                                window.addStr(top + i, paneCol,
-                                              line[selStartCol:selEndCol],
-                                              colorSelected)
-                            elif i == lowerRow - startRow:
-                                # End of multi-line selection.
-                                window.addStr(top + i, left,
-                                              line[startCol:selEndCol],
-                                              colorSelected)
-                            elif i == upperRow - startRow:
-                                # Start of multi-line selection.
-                                window.addStr(top + i, paneCol,
-                                              line[selStartCol:endCol],
-                                              colorSelected)
-                            else:
-                                # Middle of multi-line selection.
-                                window.addStr(top + i, left,
-                                              line[startCol:endCol],
-                                              colorSelected)
+                    addRun(row, upperCol, min(lowerCol, width), color)
+                    continue
+                # The end of a selected line is shown as a selected space.
+                begin = upperCol if row == upperRow else 0
+                end = lowerCol if row == lowerRow else endCol
+                addRun(row, begin, min(end, width + 1), color)
+        # Leave out rows that are not in view (e.g. the pen row).
+        overlays = {
+            row: runs
+            for row, runs in overlays.items()
+            if startRow <= row < endRow
+        }
+        return overlays
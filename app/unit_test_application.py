@@ -245,6 +245,16 @@ class ApplicationTestCases(app.fake_curses_testing.FakeCursesTestCase):
             self.selectionCheck(1, 19, 1, 18, 0), CTRL_Q, u'n'
         ])
 
+    def test_latency(self):
+        self.runWithTestFile(kTestFile, [
+            self.writeText(u"abc"),
+            self.displayCheck(2, 7, [u"abc "]), CTRL_Q, u"n"
+        ])
+        histograms = self.prg.latency.histograms
+        self.assertGreater(histograms[u"total"].count, 0)
+        self.assertEqual(histograms[u"queue"].count,
+                         histograms[u"total"].count)
+
     def test_select_line(self):
         #self.setMovieMode(True)
         self.runWithTestFile(kTestFile, [
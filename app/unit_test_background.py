@@ -0,0 +1,243 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+import select
+import time
+import unittest
+
+import app.background
+import app.latency
+import app.profile
+import app.render
+
+
+class BackgroundThreadTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.bg = app.background.BackgroundThread()
+        self.bg.toBackground = queue.Queue()
+        self.bg.openWakePipe()
+
+    def tearDown(self):
+        self.bg.close()
+
+    def isAwake(self):
+        return self.bg.wakeFd in select.select([self.bg.wakeFd], [], [], 0)[0]
+
+    def test_wake(self):
+        self.assertFalse(self.isAwake())
+        self.assertFalse(self.bg.hasMessage())
+        self.bg.send((u"frame 1",))
+        self.assertTrue(self.isAwake())
+        self.bg.drainWakes()
+        self.assertFalse(self.isAwake())
+        self.assertTrue(self.bg.hasMessage())
+        self.assertEqual(self.bg.get(), (u"frame 1",))
+        self.assertFalse(self.bg.hasMessage())
+        self.assertIsNone(self.bg.get())
+        # Draining an empty pipe doesn't block.
+        self.bg.drainWakes()
+
+    def test_latest_frame(self):
+        # Only the latest frame is kept.
+        self.bg.send((u"frame 1",))
+        self.bg.send((u"frame 2",))
+        self.assertEqual(self.bg.generation, 2)
+        self.assertEqual(self.bg.droppedFrames, 1)
+        self.assertEqual(self.bg.get(), (u"frame 2",))
+        self.assertIsNone(self.bg.get())
+        # An exception is not replaced by a frame.
+        self.bg.send((u"exception", [u"trace"]))
+        self.bg.send((u"frame 3",))
+        self.assertEqual(self.bg.get(), (u"exception", [u"trace"]))
+
+    def test_full_wake_pipe(self):
+        # A wake that doesn't fit in the pipe is dropped, without blocking.
+        for i in range(100000):
+            self.bg.send((i,))
+        self.assertTrue(self.isAwake())
+        self.bg.drainWakes()
+        self.assertFalse(self.isAwake())
+        self.assertEqual(self.bg.get(), (99999,))
+
+    def test_user_event(self):
+        self.assertFalse(self.bg.hasUserEvent())
+        self.bg.put(u"a")
+        self.bg.put(u"b")
+        self.assertTrue(self.bg.hasUserEvent())
+        self.assertEqual(self.bg.take(False), u"a")
+        self.assertTrue(self.bg.hasUserEvent())
+        self.assertEqual(self.bg.take(False), u"b")
+        self.assertFalse(self.bg.hasUserEvent())
+        self.assertRaises(queue.Empty, self.bg.take, False)
+
+
+class FakeProgramWindow:
+    """Record the calls made by app.background.background()."""
+
+    def __init__(self, bg):
+        self.bg = bg
+        self.program = self
+        self.scheduler = app.background.Scheduler()
+        self.backgroundFrame = app.render.Frame()
+        self.latency = app.latency.LatencyTracker()
+        self.executed = []
+        self.renders = 0
+
+    def executeCommandList(self, cmdList):
+        self.executed.append(cmdList)
+
+    def longTimeSlice(self):
+        return True
+
+    def shortTimeSlice(self):
+        return True
+
+    def render(self):
+        self.renders += 1
+        # End the test once a frame has been drawn.
+        self.bg.put((self, 'quit'))
+
+
+class BackgroundLoopTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.bg = app.background.BackgroundThread()
+        self.bg.toBackground = queue.Queue()
+        self.bg.openWakePipe()
+        self.program = FakeProgramWindow(self.bg)
+
+    def tearDown(self):
+        self.bg.close()
+
+    def test_skip_stale_frames(self):
+        for i in range(3):
+            self.bg.put((self.program, [(i, None)]))
+        # Run the loop on this thread, it ends with the 'quit' from render().
+        app.background.background(self.bg)
+        self.assertEqual(self.program.executed,
+                         [[(0, None)], [(1, None)], [(2, None)]])
+        # Only the frame for the latest input was drawn.
+        self.assertEqual(self.program.renders, 1)
+        self.assertEqual(self.bg.generation, 1)
+        frame = self.bg.get()
+        self.assertEqual(frame[2], 3)
+
+
+class SchedulerTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.bg = app.background.BackgroundThread()
+        self.bg.toBackground = queue.Queue()
+        self.scheduler = app.background.Scheduler()
+        self.calls = []
+
+    def countdown(self, name, count):
+        """Make a task that is finished after |count| calls."""
+        remaining = [count]
+
+        def task():
+            self.calls.append(name)
+            remaining[0] -= 1
+            return remaining[0] <= 0
+
+        return task
+
+    def test_priority(self):
+        scheduler = self.scheduler
+        scheduler.add(u"b", self.countdown(u"b", 2))
+        scheduler.add(u"a", self.countdown(u"a", 1), priority=1)
+        scheduler.add(u"c", self.countdown(u"c", 1))
+        self.assertTrue(scheduler.hasTasks())
+        self.assertTrue(scheduler.runSlice(self.bg, 10))
+        self.assertEqual(self.calls, [u"a", u"b", u"b", u"c"])
+        self.assertFalse(scheduler.hasTasks())
+        self.assertTrue(scheduler.runSlice(self.bg, 10))
+        self.assertEqual(app.profile.tasks[u"b"][0], 2)
+
+    def test_replace(self):
+        scheduler = self.scheduler
+        scheduler.add(u"a", self.countdown(u"first", 1))
+        scheduler.add(u"a", self.countdown(u"second", 1))
+        self.assertTrue(scheduler.hasTask(u"a"))
+        self.assertTrue(scheduler.runSlice(self.bg, 10))
+        self.assertEqual(self.calls, [u"second"])
+        scheduler.add(u"a", self.countdown(u"third", 1))
+        scheduler.remove(u"a")
+        self.assertFalse(scheduler.hasTask(u"a"))
+
+    def test_waiting(self):
+        scheduler = self.scheduler
+        results = [app.background.kTaskWaiting, True]
+
+        def task():
+            self.calls.append(u"a")
+            return results.pop(0)
+
+        scheduler.add(u"a", task)
+        # A waiting task doesn't keep the slice running.
+        self.assertTrue(scheduler.runSlice(self.bg, 10))
+        self.assertTrue(scheduler.runSlice(self.bg, 10))
+        self.assertEqual(self.calls, [u"a"])
+        self.assertTrue(scheduler.hasTask(u"a"))
+        self.assertFalse(scheduler.hasReadyTasks())
+        # A wake is not a user event.
+        self.bg.wake()
+        self.assertFalse(self.bg.hasUserEvent())
+        self.assertEqual(self.bg.take(False), (None, 'wake'))
+        self.assertFalse(self.bg.hasUserEvent())
+        scheduler.wakeTasks()
+        self.assertTrue(scheduler.runSlice(self.bg, 10))
+        self.assertEqual(self.calls, [u"a", u"a"])
+        self.assertFalse(scheduler.hasTasks())
+
+    def test_preempt(self):
+        scheduler = self.scheduler
+        scheduler.add(u"a", self.countdown(u"a", 1))
+        self.bg.put(u"input")
+        self.assertFalse(scheduler.runSlice(self.bg, 10))
+        self.assertEqual(self.calls, [])
+        self.bg.take(False)
+        self.assertTrue(scheduler.runSlice(self.bg, 10))
+        self.assertEqual(self.calls, [u"a"])
+
+    def test_time_slice(self):
+        bg = self.bg
+
+        def task():
+            # Work until asked to yield (e.g. as the parser does).
+            self.calls.append(u"a")
+            while not bg.shouldYield():
+                time.sleep(0.001)
+            return False
+
+        self.scheduler.add(u"a", task)
+        start = time.time()
+        self.assertFalse(self.scheduler.runSlice(bg, 0.02))
+        self.assertGreaterEqual(time.time() - start, 0.02)
+        self.assertEqual(self.calls, [u"a"])
+        # The deadline only applies within the slice.
+        self.assertIsNone(bg.deadline)
+        self.assertFalse(bg.shouldYield())
+        # The unfinished task is resumed in the next slice.
+        self.assertFalse(self.scheduler.runSlice(bg, 0.02))
+        self.assertEqual(self.calls, [u"a", u"a"])
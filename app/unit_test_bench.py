@@ -0,0 +1,110 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import app.bench
+import app.curses_util
+import app.input_log
+import app.latency
+
+
+class BenchTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse_size(self):
+        self.assertEqual(app.bench.parseSize(u"12"), 12)
+        self.assertEqual(app.bench.parseSize(u"1KB"), 1024)
+        self.assertEqual(app.bench.parseSize(u"1.5kb"), 1536)
+        self.assertEqual(app.bench.parseSize(u"500MB"), 500 * 1024 * 1024)
+
+    def test_make_corpus(self):
+        path = app.bench.makeCorpus(self.directory, u"3KB")
+        self.assertEqual(os.path.getsize(path), 3 * 1024)
+        modified = os.path.getmtime(path)
+        # The existing document is reused.
+        self.assertEqual(app.bench.makeCorpus(self.directory, u"3KB"), path)
+        self.assertEqual(os.path.getmtime(path), modified)
+
+    def test_run_benchmark(self):
+        report = app.bench.runBenchmark([u"1KB"], [u"typing", u"find"],
+                                        6,
+                                        self.directory,
+                                        isolate=False)
+        # The report is JSON serializable.
+        json.dumps(report)
+        results = report[u"results"]
+        self.assertEqual([i[u"scenario"] for i in results],
+                         [u"typing", u"find"])
+        for result in results:
+            self.assertIsNone(result[u"error"])
+            self.assertEqual(result[u"corpus"], u"1KB")
+            self.assertEqual(result[u"bytes"], 1024)
+            self.assertGreater(result[u"startupSeconds"], 0.0)
+            self.assertGreater(result[u"scenarioSeconds"], 0.0)
+            self.assertGreater(result[u"peakRssBytes"], 0)
+            latency = result[u"latencyMs"]
+            self.assertEqual(sorted(latency), sorted(app.latency.kStages))
+            self.assertGreaterEqual(latency[u"total"][u"count"],
+                                    result[u"keys"])
+
+    def test_replay(self):
+        document = os.path.join(self.directory, u"doc.txt")
+        with io.open(document, u"w") as f:
+            f.write(u"text\n")
+        logPath = os.path.join(self.directory, u"input.log")
+        recorder = app.input_log.InputRecorder(logPath, self.directory,
+                                               [u"doc.txt"], (20, 50))
+        start = recorder._priorTime
+        recorder.record(start + 0.1, [(ord(u"a"), None)])
+        recorder.record(start + 0.2, [(ord(u"b"), None), (ord(u"c"), None)])
+        recorder.record(start + 0.3, [(app.curses_util.CTRL_S, None)])
+        recorder.close()
+        workDir = os.path.join(self.directory, u"work")
+        os.makedirs(workDir)
+        report = app.bench.replayLog(logPath, workDir)
+        json.dumps(report)
+        self.assertIsNone(report[u"error"])
+        batches = report[u"batches"]
+        self.assertEqual([i[u"commands"] for i in batches], [1, 2, 1])
+        self.assertAlmostEqual(batches[1][u"at"], 0.2, places=5)
+        for batch in batches:
+            self.assertGreater(batch[u"totalMs"], 0.0)
+        self.assertEqual(report[u"totalMs"][u"count"], 3)
+        self.assertEqual(sorted(report[u"slowest"]), [0, 1, 2])
+        # The save went to a copy of the document.
+        with io.open(document) as f:
+            self.assertEqual(f.read(), u"text\n")
+        copies = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(workDir)
+            for name in names
+        ]
+        self.assertEqual(len(copies), 1)
+        with io.open(copies[0]) as f:
+            self.assertEqual(f.read(), u"abctext\n")
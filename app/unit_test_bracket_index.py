@@ -0,0 +1,128 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+import sys
+import unittest
+
+import app.bracket_index
+import app.parser
+import app.prefs
+
+
+def stackMatches(data):
+    """Match the brackets of |data| with a stack (for each kind)."""
+    matches = {}
+    stacks = [[] for _ in range(app.bracket_index.kKinds)]
+    for offset, ch in enumerate(data):
+        bracket = app.bracket_index.kBrackets.get(ch)
+        if bracket is None:
+            continue
+        kind, isOpen = bracket
+        if isOpen:
+            stacks[kind].append(offset)
+        elif stacks[kind]:
+            other = stacks[kind].pop()
+            matches[offset] = other
+            matches[other] = offset
+    return matches
+
+
+class BracketIndexTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.prefs = app.prefs.Prefs()
+        self.parser = app.parser.Parser(self.prefs)
+
+    def test_comments_and_strings(self):
+        data = u"f(a, ')', [1, 2]) # (\nx = {'k': (1)}\n"
+        self.parser.parse(None, data, self.prefs.grammars[u'py'], 0,
+                          sys.maxsize)
+        index = self.parser.bracketIndex
+
+        def match(ch, nth=0):
+            offset = data.index(ch)
+            for _ in range(nth):
+                offset = data.index(ch, offset + 1)
+            return index.matchingBracket(offset, len(data))
+
+        self.assertEqual(match(u"("), data.index(u")", 8))
+        self.assertEqual(match(u")", 1), 1)
+        self.assertEqual(match(u"["), data.index(u"]"))
+        self.assertEqual(match(u"{"), data.index(u"}"))
+        # In a string or a comment.
+        self.assertEqual(match(u")"), None)
+        self.assertEqual(match(u"(", 1), None)
+        self.assertEqual(index.depthAt(data.index(u"1")), 2)
+        self.assertEqual(index.depthAt(data.index(u"x")), 0)
+
+    def test_unmatched(self):
+        data = u"(\n)]\n["
+        self.parser.parse(None, data, self.prefs.grammars[u'text'], 0, 1)
+        index = self.parser.bracketIndex
+        self.assertEqual(index.matchingBracket(0, len(data)), 2)
+        self.assertEqual(index.matchingBracket(3, len(data)),
+                         app.bracket_index.kNoMatch)
+        # Not parsed yet.
+        self.assertEqual(index.matchingBracket(5, len(data)), None)
+        self.parser.parse(None, data, self.prefs.grammars[u'text'], 2,
+                          sys.maxsize)
+        self.assertEqual(index.matchingBracket(5, len(data)),
+                         app.bracket_index.kNoMatch)
+
+    def test_trimmed_rows(self):
+        data = u"(a)\n\"\"\"\n(\n\"\"\"\n(x)\n"
+        grammar = self.prefs.grammars[u'py']
+        self.parser.parse(None, data, grammar, 0, sys.maxsize)
+        index = self.parser.bracketIndex
+        self.assertEqual(list(index.offsets[0]), [0, 2, 14, 16])
+        # Reparse from row 1, though only row 0 is needed. The rows after row
+        # 0 are dropped, so the bracket in the string (row 2) is not indexed.
+        self.parser.parse(None, data, grammar, 1, 0)
+        self.assertEqual(list(index.offsets[0]), [0, 2])
+        self.assertEqual(index.matchingBracket(14, len(data)), None)
+        self.parser.parse(None, data, grammar, 1, sys.maxsize)
+        self.assertEqual(list(index.offsets[0]), [0, 2, 14, 16])
+
+    def test_edits_match_stack(self):
+        rand = random.Random(2)
+        parser = self.parser
+        grammar = self.prefs.grammars[u'text']
+        data = u"".join(rand.choice(u"()[]{}ab\n") for _ in range(2000))
+        parser.parse(None, data, grammar, 0, sys.maxsize)
+        for i in range(200):
+            row = rand.randrange(parser.rowCount())
+            if rand.randrange(2):
+                parser.insert(row, 0, rand.choice([u"(", u")", u"[\n", u"}x"]))
+            elif parser.rowText(row):
+                parser.deleteChar(row, 0)
+            # Parse part of the document.
+            parser.parse(None, parser.data, grammar, row,
+                         rand.randrange(parser.rowCount() + 1))
+            if i % 20:
+                continue
+            parser.parse(None, parser.data, grammar, parser.resumeAtRow,
+                         sys.maxsize)
+            data = parser.data
+            expected = stackMatches(data)
+            for offset, ch in enumerate(data):
+                if ch in app.bracket_index.kBrackets:
+                    self.assertEqual(
+                        parser.bracketIndex.matchingBracket(offset, len(data)),
+                        expected.get(offset, app.bracket_index.kNoMatch))
+
@@ -115,7 +115,7 @@ class FileManagerTestCases(app.fake_curses_testing.FakeCursesTestCase):
             self.displayCheck(2, 7, [u"     "]), CTRL_O,
             self.displayCheck(0, 0, [u" ci    Open File  "]), CTRL_A,
             self.writeText(self.pathToSample(u"binary_test_file")), CTRL_J,
-            self.displayCheck(2, 7, [u"006401006c1a005a0800640000640100"]),
+            self.displayCheck(2, 7, [u"00000000  00 64 01 00 6c 1a 00"]),
             CTRL_Q
         ])
 
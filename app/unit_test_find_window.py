@@ -70,6 +70,41 @@ class FindWindowTestCases(app.fake_curses_testing.FakeCursesTestCase):
             self.selectionDocumentCheck(1, 5, 1, 8, 3), CTRL_Q, u"n"
         ])
 
+    def test_find_across_rows(self):
+        self.runWithFakeInputs([
+            self.writeText(u"one two\nthree two\nfour\n"),
+            self.displayCheck(2, 7, [u"one two  "]), CTRL_F,
+            self.writeText(u'o\\sf'),
+            self.displayCheck(-3, 0, [u"Find: o\\sf  "]),
+            self.selectionDocumentCheck(1, 8, 2, 1, 3), CTRL_F,
+            self.selectionDocumentCheck(1, 8, 2, 1, 3), CTRL_Q, u"n"
+        ])
+
+    def test_find_row_start(self):
+        self.runWithFakeInputs([
+            self.writeText(u"one two\ntwo one\none\n"),
+            self.displayCheck(2, 7, [u"one two  "]), CTRL_F,
+            self.writeText(u'^one'),
+            self.selectionDocumentCheck(0, 0, 0, 3, 3), CTRL_F,
+            self.selectionDocumentCheck(2, 0, 2, 3, 3), CTRL_R,
+            self.selectionDocumentCheck(0, 0, 0, 3, 3), CTRL_Q, u"n"
+        ])
+
+    def test_find_count(self):
+        self.runWithFakeInputs([
+            self.writeText(u"one two one\nthree one\n"),
+            self.displayCheck(2, 7, [u"one two one  "]), CTRL_F,
+            self.writeText(u'one'),
+            self.selectionDocumentCheck(0, 0, 0, 3, 3),
+            self.displayFindCheck(u" 1 of ", u"3 "), CTRL_F,
+            self.selectionDocumentCheck(0, 8, 0, 11, 3),
+            self.displayFindCheck(u" 2 of ", u"3 "), CTRL_R, CTRL_R,
+            self.selectionDocumentCheck(1, 6, 1, 9, 3),
+            self.displayFindCheck(u" 3 of ", u"3 "),
+            self.writeText(u'x'),
+            self.displayFindCheck(u" 0 ", u"found "), CTRL_Q, u"n"
+        ])
+
     def test_replace(self):
         #self.setMovieMode(True)
         self.runWithFakeInputs([
@@ -0,0 +1,163 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+try:
+    import concurrent.futures
+except ImportError:
+    concurrent = None
+import io
+import os
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+
+import app.background
+import app.grep
+import app.parser
+import app.prefs
+from app.curses_util import *
+import app.fake_curses_testing
+
+
+class FakeBuffer:
+    """Just the parser of a TextBuffer, to receive the results."""
+
+    def __init__(self):
+        prefs = app.prefs.Prefs()
+        self.parser = app.parser.Parser(prefs)
+        self.parser.parse(None, u"", prefs.grammars[u'none'], 0, sys.maxsize)
+
+
+class GrepTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write(u".gitignore", u"*.log\nbuild/\n/top.txt\n!keep.log\n")
+        self.write(u"a.txt", u"one\ntwo one\n\nthree two")
+        self.write(u"b.pyc", u"two")
+        self.write(u"binary", u"two\0")
+        self.write(u"build/c.txt", u"two")
+        self.write(u"keep.log", u"two")
+        self.write(u"skip.log", u"two")
+        self.write(u"top.txt", u"two")
+        self.write(u"sub/.gitignore", u"d*\n")
+        self.write(u"sub/d.txt", u"two")
+        self.write(u"sub/e.txt", u"x\r\ntwo\r\n")
+        self.write(u"sub/top.txt", u"two")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, relPath, text):
+        path = os.path.join(self.directory, relPath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with io.open(path, u"w", newline=u"") as f:
+            f.write(text)
+
+    def relPaths(self, paths):
+        return [os.path.relpath(i, self.directory) for i in paths]
+
+    def test_project_files(self):
+        self.assertEqual(
+            self.relPaths(app.grep.projectFiles(self.directory)), [
+                u".gitignore", u"a.txt", u"binary", u"keep.log",
+                os.path.join(u"sub", u".gitignore"),
+                os.path.join(u"sub", u"e.txt"),
+                os.path.join(u"sub", u"top.txt")
+            ])
+
+    def test_grep_files(self):
+        paths = list(app.grep.projectFiles(self.directory))
+        results = app.grep.grepFiles(paths, u"t(wo|hree)", 0)
+        self.assertEqual([(os.path.basename(i[0]),) + i[1:] for i in results],
+                         [(u"a.txt", 1, 0, u"two one"),
+                          (u"a.txt", 3, 0, u"three two"),
+                          (u"keep.log", 0, 0, u"two"),
+                          (u"e.txt", 1, 0, u"two"),
+                          (u"top.txt", 0, 0, u"two")])
+        results = app.grep.grepFiles(paths[1:2], u"o$|^$", re.MULTILINE)
+        self.assertEqual([i[1:3] for i in results], [(2, 0), (3, 8)])
+
+    def test_project_grep(self):
+        executors = [None]
+        if concurrent is not None:
+            executors.append(concurrent.futures.ThreadPoolExecutor(2))
+        for executor in executors:
+            textBuffer = FakeBuffer()
+            job = app.grep.ProjectGrep(re.compile(u"two"), self.directory,
+                                       textBuffer, executor, 2)
+            self.assertTrue(job.step())
+            self.assertEqual(job.matchCount, 5)
+            self.assertEqual(job.fileCount, 7)
+            data = textBuffer.parser.data
+            self.assertEqual(data.count(u"\n"), 5)
+            self.assertEqual(
+                data.splitlines()[0],
+                os.path.join(self.directory, u"a.txt") + u":2:1: two one")
+            if executor is not None:
+                executor.shutdown()
+
+    @unittest.skipIf(concurrent is None, u"needs concurrent.futures")
+    def test_project_grep_waits(self):
+        bg = app.background.BackgroundThread()
+        bg.toBackground = queue.Queue()
+        executor = concurrent.futures.ThreadPoolExecutor(2)
+        textBuffer = FakeBuffer()
+        job = app.grep.ProjectGrep(re.compile(u"two"), self.directory,
+                                   textBuffer, executor, 1)
+        while True:
+            finished = job.step(bg)
+            if finished is True:
+                break
+            if finished == app.background.kTaskWaiting:
+                # Rather than being called again right away, the task waits
+                # to be woken.
+                self.assertEqual(bg.take(True), (None, 'wake'))
+        self.assertEqual(job.matchCount, 5)
+        self.assertEqual(textBuffer.parser.data.count(u"\n"), 5)
+        executor.shutdown()
+
+
+class GrepPromptTestCases(app.fake_curses_testing.FakeCursesTestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        app.fake_curses_testing.FakeCursesTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, u"a.txt")
+        with io.open(self.path, u"w") as f:
+            f.write(u"one\ntwo one\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        app.fake_curses_testing.FakeCursesTestCase.tearDown(self)
+
+    def test_open_result(self):
+        self.runWithFakeInputs([
+            self.writeText(self.path + u":2:5: two one"), CTRL_E,
+            self.writeText(u"open"), CTRL_J,
+            self.displayCheck(2, 7, [u"one  ", u"two one  "]),
+            self.selectionCheck(1, 4, 0, 0, 0), CTRL_Q, CTRL_Q, u"n"
+        ])
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import app.ci_program
+import app.hex_view
+import app.log
+import app.prefs
+import app.text_buffer
+
+
+class HexViewTestCases(unittest.TestCase):
+
+    def setUp(self):
+        app.log.shouldWritePrintLog = False
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, u"binary")
+        # Not valid utf-8, so it's opened as a binary file.
+        self.data = bytes(bytearray(range(256))) * 40 + b"\xffend"
+        with io.open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rows(self):
+        parser = app.hex_view.HexParser(app.prefs.Prefs(), self.path)
+        self.assertEqual(parser.rowCount(), 641)
+        self.assertEqual(
+            parser.rowText(4), u"00000040  40 41 42 43 44 45 46 47  "
+            u"48 49 4a 4b 4c 4d 4e 4f  |@ABCDEFGHIJKLMNO|")
+        self.assertEqual(parser.rowText(640, 0, 21), u"00002800  ff 65 6e 64")
+        self.assertEqual(parser.rowText(640, 60), u"|.end|")
+        self.assertEqual(parser.byteAtRowCol(1, 10), (16, 0))
+        self.assertEqual(parser.byteAtRowCol(1, 11), (16, 1))
+        self.assertEqual(parser.byteAtRowCol(1, 12), None)
+        self.assertEqual(parser.byteAtRowCol(1, 34), None)
+        self.assertEqual(parser.byteAtRowCol(1, 35), (24, 0))
+        self.assertEqual(parser.byteAtRowCol(1, 61), (16, None))
+        self.assertEqual(parser.byteAtRowCol(640, 22), None)
+        for offset in (0, 7, 8, 15, 16, 10243):
+            for nibble in (0, 1, None):
+                self.assertEqual(
+                    parser.byteAtRowCol(*parser.byteRowCol(offset, nibble)),
+                    (offset, nibble))
+        parser.close()
+
+    def test_modified_pages(self):
+        parser = app.hex_view.HexParser(app.prefs.Prefs(), self.path)
+        parser.setBytes(5000, b"ab")
+        parser.setBytes(4095, b"xy")
+        self.assertEqual(parser.byteRange(4094, 4098), b"\xfexy\x01")
+        self.assertEqual(parser.byteRange(4999, 5003), b"\x87ab\x8a")
+        self.assertEqual(parser.rowText(255, 76, 77), u"x")
+        pages = parser.modifiedPages()
+        self.assertEqual([offset for offset, _ in pages], [0, 4096])
+        self.assertEqual(len(pages[1][1]), 4096)
+        parser.close()
+
+    def test_edit_and_save(self):
+        prg = app.ci_program.CiProgram()
+        textBuffer = app.text_buffer.TextBuffer(prg)
+        textBuffer.setFilePath(self.path)
+        textBuffer.fileLoad()
+        self.assertTrue(textBuffer.isBinary)
+        textBuffer.cursorMove(1, 35)
+        textBuffer.insert(u"c3")
+        textBuffer.compoundChangePush()
+        self.assertEqual(textBuffer.parser.byteRange(24, 25), b"\xc3")
+        self.assertEqual((textBuffer.penRow, textBuffer.penCol), (1, 38))
+        textBuffer.insert(u"g")
+        self.assertEqual(textBuffer.parser.byteRange(25, 26), b"\x19")
+        # Other edits are refused.
+        textBuffer.backspace()
+        self.assertEqual(textBuffer.parser.byteRange(24, 25), b"\xc3")
+        textBuffer.editUndo()
+        self.assertEqual(textBuffer.parser.byteRange(24, 25), b"\x18")
+        self.assertEqual((textBuffer.penRow, textBuffer.penCol), (1, 35))
+        textBuffer.editRedo()
+        textBuffer.cursorMove(0, 61 - 38)
+        textBuffer.insert(u"Z")
+        textBuffer.compoundChangePush()
+        self.assertEqual(textBuffer.parser.byteRange(16, 17), b"Z")
+        self.assertTrue(textBuffer.isDirty())
+        textBuffer.fileWrite()
+        self.assertFalse(textBuffer.isDirty())
+        with io.open(self.path, 'rb') as f:
+            written = f.read()
+        expected = bytearray(self.data)
+        expected[16] = ord(b"Z")
+        expected[24] = 0xc3
+        self.assertEqual(written, bytes(expected))
+        self.assertEqual(textBuffer.parser.rowText(1, 10, 12), u"5a")
@@ -0,0 +1,88 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import app.curses_util
+import app.input_log
+
+
+class InputLogTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, u"input.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_values(self):
+        values = [
+            None, 0, 1, -1, 63, -64, 300, 2**40, -2**40, 0.25, b"", b"^F",
+            u"", u"text \u00e9\u23f0", (), (1, (2, u"three"), b"kDN5"),
+            app.curses_util.BRACKETED_PASTE,
+            ((0, 12, 3, 0, 4), 1234567.125)
+        ]
+        for value in values:
+            out = bytearray()
+            app.input_log.encodeValue(value, out)
+            decoder = app.input_log.Decoder(bytes(out))
+            self.assertEqual(decoder.value(), value)
+            self.assertTrue(decoder.atEnd())
+        # A typical batch.
+        out = bytearray()
+        app.input_log.encodeValue([(97, None)], out)
+        self.assertEqual(len(out), 8)
+        with self.assertRaises(TypeError):
+            app.input_log.encodeValue(set(), bytearray())
+
+    def test_record_and_read(self):
+        recorder = app.input_log.InputRecorder(self.path, u"/home", [u"a.py"],
+                                               (24, 80))
+        start = recorder._priorTime
+        batches = [
+            [(97, None)],
+            [(app.curses_util.CTRL_S, None), (b"kDN5", None)],
+            [(app.curses_util.BRACKETED_PASTE, u"pasted\ntext")],
+        ]
+        for i, cmdList in enumerate(batches):
+            recorder.record(start + 0.5 * (i + 1), cmdList)
+        recorder.close()
+        self.assertEqual(recorder.batchCount, 3)
+        header, result = app.input_log.readLog(self.path)
+        self.assertEqual(header, (u"/home", (u"a.py",), 24, 80))
+        self.assertEqual([i[1] for i in result], batches)
+        for i, (seconds, _) in enumerate(result):
+            self.assertAlmostEqual(seconds, 0.5 * (i + 1), places=5)
+        # A log that was cut short drops the partial batch.
+        with io.open(self.path, u"rb") as f:
+            data = f.read()
+        with io.open(self.path, u"wb") as f:
+            f.write(data[:-3])
+        header, result = app.input_log.readLog(self.path)
+        self.assertEqual([i[1] for i in result], batches[:2])
+
+    def test_not_a_log(self):
+        with io.open(self.path, u"wb") as f:
+            f.write(b"some text\n")
+        with self.assertRaises(ValueError):
+            app.input_log.readLog(self.path)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import app.large_file
+import app.prefs
+
+
+class LargeFileTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, u"large.txt")
+        self.prefs = app.prefs.Prefs()
+        with io.open(self.path, 'wb') as f:
+            f.write(u"one\r\ntwo ち\n\tthree\n".encode(u"utf-8") * 100)
+        self.savedBatchBytes = app.large_file.kIndexBatchBytes
+        app.large_file.kIndexBatchBytes = 64
+
+    def tearDown(self):
+        app.large_file.kIndexBatchBytes = self.savedBatchBytes
+        shutil.rmtree(self.directory)
+
+    def test_index_rows(self):
+        parser = app.large_file.LargeFileParser(self.prefs, self.path)
+        self.assertEqual(parser.rowCount(), 1)
+        self.assertEqual(parser.resumeAtRow, 0)
+        # Each parse() indexes a limited number of batches.
+        grammar = self.prefs.grammars['text']
+        parser.parse(None, None, grammar, 0, 10000)
+        indexed = parser.rowCount()
+        self.assertGreater(indexed, 1)
+        self.assertLess(indexed, 301)
+        self.assertEqual(parser.resumeAtRow, indexed - 1)
+        while parser.resumeAtRow < parser.rowCount():
+            parser.parse(None, None, grammar, 0, 10000)
+        # The trailing new line ends with an empty row.
+        self.assertEqual(parser.rowCount(), 301)
+        self.assertEqual(parser.rowText(300), u"")
+        parser.close()
+
+    def test_row_text(self):
+        parser = app.large_file.LargeFileParser(self.prefs, self.path)
+        # Reading a row indexes through that row.
+        self.assertEqual(parser.rowText(250), u"two ち")
+        self.assertGreaterEqual(parser.rowCount(), 251)
+        self.assertEqual(parser.rowTextAndWidth(249), (u"one", 3))
+        self.assertEqual(parser.rowTextAndWidth(250), (u"two ち", 6))
+        self.assertEqual(parser.rowText(251), u"\tthree")
+        self.assertEqual(parser.rowText(250, 4, 6), u"ち")
+        self.assertEqual(parser.charAt(250, 4), u"ち")
+        self.assertEqual(parser.charAt(250, 7), None)
+        self.assertEqual(parser.nextCharRowCol(250, 4), (0, 2))
+        self.assertEqual(parser.nextCharRowCol(250, 6), (1, -6))
+        self.assertEqual(parser.priorCharRowCol(250, 6), (0, -2))
+        self.assertEqual(parser.priorCharRowCol(250, 0), (-1, 3))
+        node, col, remaining, eol = parser.grammarAtIndex(250, 2, 0)
+        self.assertEqual((col, remaining, eol), (2, 4, False))
+        self.assertTrue(parser.grammarAtIndex(250, 2, 1)[3])
+        self.assertFalse(parser.inDocument(301, 0))
+        parser.close()
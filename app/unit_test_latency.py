@@ -0,0 +1,64 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import app.latency
+
+
+class LatencyTestCases(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = app.latency.Histogram()
+        self.assertIsNone(histogram.percentile(0.5))
+        for i in range(1, 101):
+            histogram.add(i / 1000.0)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.peak, 0.1)
+        # The buckets are within 5%.
+        self.assertAlmostEqual(histogram.percentile(0.5), 0.050, delta=0.0025)
+        self.assertAlmostEqual(histogram.percentile(0.95), 0.095, delta=0.005)
+        self.assertAlmostEqual(histogram.percentile(0.99), 0.099, delta=0.005)
+        self.assertEqual(histogram.percentile(1.0), 0.1)
+        histogram.add(0.0)
+        self.assertEqual(histogram.percentile(0.0), app.latency.kSmallestBucket)
+
+    def test_stages(self):
+        tracker = app.latency.LatencyTracker()
+        # Two batches shown by one frame, the frame of the first was skipped.
+        tracker.inputRead(2, 10.0)
+        tracker.executed(2, 10.5, 11.0)
+        tracker.inputRead(3, 10.75)
+        tracker.executed(3, 11.0, 11.25)
+        tracker.rendered(3, 12.0)
+        tracker.handedOff(3, 12.5)
+        tracker.painted(3, 13.0)
+        histograms = tracker.histograms
+        self.assertEqual(histograms[u"total"].count, 2)
+        self.assertEqual(histograms[u"total"].peak, 3.0)
+        self.assertEqual(histograms[u"queue"].peak, 0.5)
+        self.assertEqual(histograms[u"render"].peak, 1.0)
+        self.assertEqual(histograms[u"refresh"].peak, 0.5)
+        # A frame without input (e.g. when parsing is done) adds nothing.
+        tracker.handedOff(3, 14.0)
+        tracker.painted(3, 14.5)
+        self.assertEqual(histograms[u"total"].count, 2)
+        self.assertIn(u"total n 2 p50", tracker.summary())
+        report = tracker.report().splitlines()
+        self.assertEqual(len(report), len(app.latency.kStages) + 1)
+        self.assertTrue(report[-1].startswith(u"total          2"))
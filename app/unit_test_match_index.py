@@ -0,0 +1,141 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+import re
+import sys
+import unittest
+
+import app.match_index
+import app.parser
+import app.piece_table
+import app.prefs
+
+
+class PausingThread:
+    """Ask the build to yield every |period| checks."""
+
+    def __init__(self, period):
+        self.period = period
+        self.checks = 0
+
+    def shouldYield(self):
+        self.checks += 1
+        return self.checks % self.period == 0
+
+
+class MatchIndexTestCases(unittest.TestCase):
+
+    def matches(self, index):
+        # From -1, to include an empty match at the start.
+        return index.spans(-1, sys.maxsize)
+
+    def test_build(self):
+        store = app.piece_table.PieceTable(u"one two\none\n\nthree one")
+        index = app.match_index.MatchIndex(re.compile(u"one"))
+        self.assertFalse(index.isComplete(len(store)))
+        self.assertFalse(index.build(store, PausingThread(2)))
+        self.assertEqual(index.count(), 1)
+        while not index.build(store, PausingThread(2)):
+            pass
+        self.assertTrue(index.isComplete(len(store)))
+        self.assertEqual(self.matches(index), [(0, 3), (8, 11), (19, 22)])
+        self.assertEqual(index.spans(3, 9), [(8, 11)])
+        self.assertEqual(index.spans(11, 19), [])
+        self.assertEqual(index.matchNumber(8, 11), 2)
+        self.assertEqual(index.matchNumber(8, 10), None)
+        self.assertEqual(index.nextMatch(0), (0, 3, False))
+        self.assertEqual(index.nextMatch(1), (8, 11, False))
+        self.assertEqual(index.nextMatch(20), (0, 3, True))
+        self.assertEqual(index.priorMatch(11), (8, 11, False))
+        self.assertEqual(index.priorMatch(10), (0, 3, False))
+        self.assertEqual(index.priorMatch(2), (19, 22, True))
+
+    def test_edits(self):
+        store = app.piece_table.PieceTable(u"one two\none\n\nthree one")
+        index = app.match_index.MatchIndex(re.compile(u"one"))
+        index.build(store)
+        # Insert a match.
+        store.insert(0, u"one")
+        index.noteEdit(0, 0, 3)
+        self.assertFalse(index.isComplete(len(store)))
+        index.refresh(store)
+        self.assertTrue(index.isComplete(len(store)))
+        self.assertEqual(self.matches(index), [(0, 3), (3, 6), (11, 14),
+                                               (22, 25)])
+        # Break a match.
+        store.delete(12, 13)
+        index.noteEdit(12, 1, 0)
+        index.refresh(store)
+        self.assertEqual(self.matches(index), [(0, 3), (3, 6), (21, 24)])
+        # Append a match.
+        store.insert(len(store), u"\none")
+        index.noteEdit(len(store) - 4, 0, 4)
+        index.refresh(store)
+        self.assertEqual(self.matches(index), [(0, 3), (3, 6), (21, 24),
+                                               (25, 28)])
+
+    def test_edits_match_find(self):
+        regexes = [
+            re.compile(u"ab"),
+            re.compile(u"^b", re.MULTILINE),
+            re.compile(u"b$", re.MULTILINE),
+            re.compile(u"a\\s*b"),
+            re.compile(u"x*"),
+        ]
+        rand = random.Random(1)
+        for regex in regexes:
+            data = u"".join(rand.choice(u"ab \n") for _ in range(60))
+            store = app.piece_table.PieceTable(data)
+            index = app.match_index.MatchIndex(regex)
+            index.build(store)
+            for i in range(100):
+                begin = rand.randrange(len(data) + 1)
+                removed = rand.randrange(min(5, len(data) - begin) + 1)
+                text = u"".join(
+                    rand.choice(u"ab \n") for _ in range(rand.randrange(4)))
+                data = data[:begin] + text + data[begin + removed:]
+                store.delete(begin, begin + removed)
+                store.insert(begin, text)
+                index.noteEdit(begin, removed, len(text))
+                if i % 3 == 0:
+                    index.refresh(store)
+                    expected = [j.span() for j in regex.finditer(data)]
+                    self.assertEqual(self.matches(index), expected)
+                    offset = rand.randrange(len(data) + 1)
+                    found = index.nextMatch(offset)
+                    after = [j for j in expected if j[0] >= offset]
+                    if after:
+                        self.assertEqual(found, after[0] + (False,))
+            index.refresh(store)
+            expected = [i.span() for i in regex.finditer(data)]
+            self.assertEqual(self.matches(index), expected, regex.pattern)
+
+    def test_parser_edits(self):
+        prefs = app.prefs.Prefs()
+        parser = app.parser.Parser(prefs)
+        parser.parse(None, u"one\ntwo\none\n", prefs.grammars[u'none'], 0,
+                     sys.maxsize)
+        index = app.match_index.MatchIndex(re.compile(u"one"))
+        parser.matchIndex = index
+        index.build(parser.store())
+        parser.insert(1, 0, u"one ")
+        index.refresh(parser.store())
+        self.assertEqual(self.matches(index), [(0, 3), (4, 7), (12, 15)])
+        parser.data = u"two"
+        self.assertIsNone(parser.matchIndex)
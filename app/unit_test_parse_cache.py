@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import app.history
+import app.parse_cache
+import app.parser
+import app.prefs
+
+
+class ParseCacheTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.cacheDirectory = tempfile.mkdtemp()
+        self.prefs = app.prefs.Prefs()
+        self.cache = app.parse_cache.ParseCache(self.cacheDirectory, 1000000)
+        self.data = u"""/* A comment
+  that spans lines. */
+int main() {
+\tconst char* s = "a string ち";
+}
+""" * 100
+        self.checksum = app.history.calculateChecksum(None, self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.cacheDirectory)
+
+    def parsed(self, grammar):
+        parser = app.parser.Parser(self.prefs)
+        parser.parse(None, self.data, grammar, 0, sys.maxsize)
+        return parser
+
+    def test_save_and_load(self):
+        grammar = self.prefs.grammars['cpp']
+        expected = self.parsed(grammar)
+        self.assertTrue(self.cache.save(expected, self.checksum, grammar))
+        parser = app.parser.Parser(self.prefs)
+        parser.data = self.data
+        # A different grammar is not a match.
+        self.assertFalse(
+            self.cache.load(parser, self.checksum, self.prefs.grammars['text']))
+        self.assertTrue(self.cache.load(parser, self.checksum, grammar))
+        self.assertEqual(parser.resumeAtRow, parser.rowCount())
+        self.assertEqual(expected.rows, parser.rows)
+        self.assertEqual(list(expected.parserNodes), list(parser.parserNodes))
+        # The restored parse works as usual.
+        parser.insert(1, 0, u"*/")
+        parser.parse(None, parser.data, grammar, parser.resumeAtRow,
+                     sys.maxsize)
+        self.assertIs(parser.grammarAt(1, 4), self.prefs.grammars['cpp'])
+
+    def test_incomplete_parse(self):
+        grammar = self.prefs.grammars['cpp']
+        parser = app.parser.Parser(self.prefs)
+        parser.parse(None, self.data, grammar, 0, 10)
+        self.assertFalse(self.cache.save(parser, self.checksum, grammar))
+        self.assertEqual(os.listdir(self.cacheDirectory), [])
+
+    def test_eviction(self):
+        grammar = self.prefs.grammars['cpp']
+        parser = self.parsed(grammar)
+        self.assertTrue(self.cache.save(parser, u"first", grammar))
+        entrySize = os.path.getsize(
+            os.path.join(self.cacheDirectory,
+                         os.listdir(self.cacheDirectory)[0]))
+        self.cache.maxBytes = entrySize * 2
+        os.utime(
+            os.path.join(self.cacheDirectory,
+                         os.listdir(self.cacheDirectory)[0]), (1, 1))
+        self.assertTrue(self.cache.save(parser, u"second", grammar))
+        self.assertTrue(self.cache.save(parser, u"third", grammar))
+        self.assertEqual(len(os.listdir(self.cacheDirectory)), 2)
+        # The least recently used entry was removed.
+        self.assertFalse(self.cache.load(parser, u"first", grammar))
+        self.assertTrue(self.cache.load(parser, u"third", grammar))
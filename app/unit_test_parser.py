@@ -20,14 +20,30 @@ from __future__ import print_function
 import cProfile
 import io
 import pstats
+import random
+import re
 import sys
 from timeit import timeit
 import unittest
 
+import app.background
 import app.parser
 import app.prefs
 
 
+class PausingThread(app.background.BackgroundThread):
+    """Ask the parser to yield every |period| checks."""
+
+    def __init__(self, period):
+        app.background.BackgroundThread.__init__(self)
+        self.period = period
+        self.checks = 0
+
+    def shouldYield(self):
+        self.checks += 1
+        return self.checks % self.period == 0
+
+
 class ParserTestCases(unittest.TestCase):
 
     def setUp(self):
@@ -72,6 +88,20 @@ class ParserTestCases(unittest.TestCase):
             # print("Node:", startIndex + index, expectedNode, actualRow)
             self.assertEqual(expectedRow, actualRow)
 
+    def recordReuse(self, parser):
+        """Get a list that each result of |parser|._reusePriorParse() is
+        appended to."""
+        results = []
+        reusePriorParse = parser._reusePriorParse
+
+        def recordResult():
+            result = reusePriorParse()
+            results.append(result)
+            return result
+
+        parser._reusePriorParse = recordResult
+        return results
+
     def printParserNodes(self, nodes):
         for n in nodes:
             print("({}, {}, {}, {}),".format(n[0]["name"], n[1], n[2], n[3]))
@@ -906,6 +936,379 @@ e
         self.assertEqual(p.data[p.dataOffset(0, 3)], u"ち")
         self.assertEqual(p.data[p.dataOffset(0, 4)], u"ち")
 
+    def test_incremental_reparse(self):
+        test = u"""/* A comment
+  that spans lines. */
+#include "test.h"
+
+int main(int argc, char** argv) {
+\tconst char* s = "a string ち";  // Trailing.
+  if (argc > 1) {
+    return 1;
+  }
+  /* Another */ return 0;
+}
+"""
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'cpp']
+        p = self.parser
+        p.parse(None, test * 20, grammar, 0, sys.maxsize)
+        reused = self.recordReuse(p)
+        rand = random.Random(11)
+        reuseCount = 0
+        for _ in range(150):
+            row = rand.randrange(p.rowCount())
+            col = rand.randrange(p.rowWidth(row) + 1)
+            if rand.random() < 0.6:
+                p.insert(row, col, rand.choice(
+                    [u"x", u"\n", u'"', u"/*", u"*/", u"//", u"\t"]))
+            elif p.dataOffset(row, col) is not None:
+                p.deleteChar(row, col)
+            reused[:] = []
+            p.parse(None, p.data, grammar, p.resumeAtRow, sys.maxsize)
+            expected = app.parser.Parser(self.prefs)
+            expected.parse(None, p.data, grammar, 0, sys.maxsize)
+            self.assertEqual(expected.rows, p.rows)
+            self.assertEqual(len(expected.parserNodes), len(p.parserNodes))
+            for a, b in zip(expected.parserNodes, p.parserNodes):
+                self.assertIs(a[0], b[0])
+                self.assertEqual(a[1:], b[1:])
+            self.assertEqual(expected.resumeAtRow, p.resumeAtRow)
+            reuseCount += any(reused)
+        # Most edits should only reparse a few rows.
+        self.assertGreater(reuseCount, 100)
+
+    def test_incremental_reparse_rows(self):
+        test = u"one\n\"two\nthree\n" * 1000
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'py']
+        p = self.parser
+        p.parse(None, test, grammar, 0, sys.maxsize)
+        calls = self.recordReuse(p)
+        p.insert(10, 2, u"x")
+        p.parse(None, p.data, grammar, p.resumeAtRow, sys.maxsize)
+        # The parse converges within a couple rows of the edit.
+        self.assertEqual(calls, [False, True])
+        self.assertEqual(p.resumeAtRow, 3001)
+        self.assertEqual(p.rowText(10), u'"txwo')
+        self.assertEqual(p.rowText(2999), u"three")
+
+    def test_incremental_reparse_edges(self):
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'py']
+        p = self.parser
+        # The row holding the quote isn't complete until the next row begins.
+        p.parse(None, u"'", grammar, 0, sys.maxsize)
+        p.insert(0, 0, u"\n")
+        p.parse(None, p.data, grammar, 0, 0)
+        p.insert(1, 0, u"\n")
+        p.parse(None, p.data, grammar, 1, 1)
+        p.backspace(1, 0)
+        p.parse(None, p.data, grammar, 0, 0)
+        p.parse(None, p.data, grammar, p.resumeAtRow, sys.maxsize)
+        self.assertEqual(p.grammarAt(1, 0)[u'name'], u'c_string1')
+        # An edit made before a later edit is parsed is not lost.
+        grammar = self.prefs.grammars[u'text']
+        p = app.parser.Parser(self.prefs)
+        p.parse(None, u"\n(", grammar, 0, sys.maxsize)
+        p.backspace(1, 1)
+        p.insert(0, 0, u"x")
+        p.parse(None, p.data, grammar, 0, sys.maxsize)
+        self.assertEqual(p.data, u"x\n")
+        self.assertEqual(p.rowWidth(0), 1)
+        self.assertEqual(p.rowWidth(1), 0)
+
+    def test_incremental_reparse_random(self):
+        """Edits and partial parses in any order give the same result as a
+        fresh parse."""
+        self.prefs = app.prefs.Prefs()
+
+        def rowKeys(parser):
+            return [(parser.dataOffset(row, 0), [
+                parser.grammarAt(row, col)[u'name']
+                for col in range(parser.rowWidth(row))
+            ]) for row in range(parser.rowCount())]
+
+        rand = random.Random(3)
+        for _ in range(300):
+            grammar = self.prefs.grammars[rand.choice([u'py', u'c', u'text'])]
+            p = app.parser.Parser(self.prefs)
+            test = u"".join(
+                rand.choice([u"'", u'"', u"\n", u"(", u"x", u"#", u"/*", u"*/"])
+                for _ in range(rand.randrange(12)))
+            p.parse(None, test, grammar, 0, rand.choice([0, 1, 3, sys.maxsize]))
+            for _ in range(rand.randrange(1, 6)):
+                row = rand.randrange(p.rowCount())
+                col = rand.randrange(p.rowWidth(row) + 1)
+                choice = rand.random()
+                if choice < 0.5:
+                    p.insert(row, col, rand.choice(
+                        [u"'", u"\n", u"(", u"x", u'"', u"#"]))
+                elif choice < 0.8:
+                    if row or col:
+                        p.backspace(row, col)
+                elif p.dataOffset(row, col) is not None:
+                    p.deleteChar(row, col)
+                if rand.random() < 0.6:
+                    p.parse(None, p.data, grammar, min(row, p.resumeAtRow),
+                            rand.randrange(5))
+            p.parse(None, p.data, grammar, p.resumeAtRow, sys.maxsize)
+            expected = app.parser.Parser(self.prefs)
+            expected.parse(None, p.data, grammar, 0, sys.maxsize)
+            self.assertEqual(rowKeys(expected), rowKeys(p), repr(p.data))
+
+    def test_parallel_parse(self):
+
+        class ImmediateFuture:
+
+            def __init__(self, result):
+                self._result = result
+
+            def done(self):
+                return True
+
+            def result(self):
+                return self._result
+
+        class ImmediateExecutor:
+            """Runs each task when it's submitted."""
+
+            def __init__(self):
+                self.submitted = []
+
+            def submit(self, fn, *args):
+                self.submitted.append(args)
+                return ImmediateFuture(fn(*args))
+
+        # The block comment is split across chunks, so the guessed grammar at
+        # the start of some chunks is wrong.
+        test = (u"int a;\n/* one\ntwo */\n\"ち\";\n" * 200 + u"/*\n" +
+                u"if (x) {\n\tint y = 3;\n}\n" * 300 + u"*/\n\"str\"\n") * 3
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'cpp']
+        expected = app.parser.Parser(self.prefs)
+        expected.parse(None, test, grammar, 0, sys.maxsize)
+        p = self.parser
+        p.data = test
+        executor = ImmediateExecutor()
+        p.startParallelParse(executor, grammar, 8)
+        self.assertEqual(len(executor.submitted), 7)
+        self.assertEqual(u"".join([i[0] for i in executor.submitted]),
+                         test[len(test) - sum([len(i[0]) for i in
+                                               executor.submitted]):])
+        reused = self.recordReuse(p)
+        p.parse(None, p.data, grammar, 0, sys.maxsize)
+        # Most chunks are reused (not those entirely within the comment).
+        self.assertGreaterEqual(reused.count(True), 5)
+        self.assertEqual(expected.rows, p.rows)
+        self.assertEqual(list(expected.parserNodes), list(p.parserNodes))
+        self.assertEqual(expected.resumeAtRow, p.resumeAtRow)
+
+    def test_parallel_parse_after_edit(self):
+
+        cancelled = []
+
+        class NeverDoneFuture:
+
+            def done(self):
+                return False
+
+            def cancel(self):
+                cancelled.append(self)
+                return True
+
+        class Executor:
+
+            def submit(self, fn, *args):
+                return NeverDoneFuture()
+
+        test = u"one\ntwo\n" * 1000
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'text']
+        p = self.parser
+        p.parse(None, test, grammar, 0, 10)
+        p.startParallelParse(Executor(), grammar, 4)
+        self.assertEqual(len(p._parallelChunks), 3)
+        # The chunks are not of the edited data.
+        p.insert(1, 0, u"x")
+        self.assertEqual(p._parallelChunks, [])
+        self.assertEqual(len(cancelled), 3)
+
+    def test_fast_line_parse(self):
+        test = u"".join(
+            random.Random(5).choice([u"ab", u"\t", u"ち", u"\n", u" c "])
+            for _ in range(3000))
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'text']
+        expected = app.parser.Parser(self.prefs)
+        expected.parse(None, test, grammar, 0, sys.maxsize)
+        p = self.parser
+        p.parse(None, test, grammar, 0, 0)
+        self.assertEqual(p.resumeAtRow, 1)
+        self.assertEqual(len(p.rows), len(expected.rows))
+        nodes = p.parserNodes
+        kBegin = app.parser.kBegin
+        kVisual = app.parser.kVisual
+        for row in range(1, len(p.rows) - 1):
+            node = nodes[p.rows[row]]
+            nextNode = nodes[p.rows[row + 1]]
+            self.assertEqual(node[kBegin], expected.dataOffset(row, 0))
+            # The widths match those of the full parse (the newline is one
+            # column).
+            self.assertEqual(nextNode[kVisual] - node[kVisual],
+                             expected.rowWidth(row) + 1)
+
+    def test_paused_parse(self):
+        rand = random.Random(7)
+        test = u"".join(
+            rand.choice([u"ab", u"\t", u"ち", u"\n", u" c ", u"'d'", u"#e\n"])
+            for _ in range(3000))
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'py']
+        expected = app.parser.Parser(self.prefs)
+        expected.parse(None, test, grammar, 0, sys.maxsize)
+        p = self.parser
+        bgThread = PausingThread(50)
+        p.parse(bgThread, test, grammar, 0, sys.maxsize)
+        pauses = 0
+        while p.resumeAtRow < len(p.rows):
+            pauses += 1
+            # The rows not yet parsed are present (from the fast line parse).
+            # Note that rowText() would parse ahead, so the nodes are read.
+            self.assertEqual(len(p.rows), len(expected.rows))
+            for row in range(p.resumeAtRow, len(p.rows) - 1):
+                node = p.parserNodes[p.rows[row]]
+                nextNode = p.parserNodes[p.rows[row + 1]]
+                self.assertEqual(node[app.parser.kBegin],
+                                 expected.dataOffset(row, 0))
+                self.assertEqual(
+                    nextNode[app.parser.kVisual] - node[app.parser.kVisual],
+                    expected.rowWidth(row) + 1)
+            p.parse(bgThread, test, grammar, p.resumeAtRow, sys.maxsize)
+        self.assertGreater(pauses, 5)
+        # The nodes may differ (e.g. by an empty node where the parse paused),
+        # but not the grammars.
+        self.assertEqual(len(p.rows), len(expected.rows))
+        for row in range(len(p.rows)):
+            self.assertEqual(p.dataOffset(row, 0), expected.dataOffset(row, 0))
+            for col in range(p.rowWidth(row)):
+                self.assertIs(p.grammarAt(row, col),
+                              expected.grammarAt(row, col))
+
+    def test_viewport_parse(self):
+        test = u"".join(u"x%d = 'two'  # three\n\tif y:\n" % i
+                        for i in range(10000))
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'py']
+        expected = app.parser.Parser(self.prefs)
+        expected.parse(None, test, grammar, 0, sys.maxsize)
+        p = self.parser
+        p.parse(None, test, grammar, 0, 10)
+        # Reading a distant row doesn't parse the rows prior to it.
+        self.assertEqual(p.rowTextAndWidth(15001), (u"\tif y:", 13))
+        self.assertLess(p.resumeAtRow, 100)
+        for row in range(14900, 15100):
+            self.assertEqual(p.rowText(row), expected.rowText(row))
+            self.assertEqual(p.rowText(row, 2), expected.rowText(row, 2))
+            for col in range(0, 20, 3):
+                self.assertIs(p.grammarAt(row, col),
+                              expected.grammarAt(row, col))
+                self.assertEqual(p.dataOffset(row, col),
+                                 expected.dataOffset(row, col))
+        # Edits may be made there too.
+        p.insert(15001, 0, u"#")
+        self.assertEqual(p.rowText(15001), u"#\tif y:")
+        self.assertEqual(p.rowText(15002), u"x7501 = 'two'  # three")
+        self.assertLess(p.resumeAtRow, 100)
+
+    def test_viewport_parse_checkpoint(self):
+        test = u'"""\n' + u"one\ntwo\n" * 5000
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'py']
+        p = self.parser
+        p.parse(None, test, grammar, 0, sys.maxsize)
+        self.assertEqual(len(p._checkpointOffsets),
+                         10001 // app.parser.kCheckpointRows)
+        # The insert moves the checkpoints down a row.
+        p.insert(0, 0, u"zero\n")
+        self.assertLess(p.resumeAtRow, 100)
+        # Without the checkpoint, the rows would be guessed to be code rather
+        # than within the string.
+        self.assertEqual(p.grammarAt(9000, 1)[u'name'], u"py_string2")
+        self.assertEqual(p._viewport[0] % app.parser.kCheckpointRows, 1)
+        self.assertLess(p.resumeAtRow, 100)
+
+    def test_offset_row_col(self):
+        test = u"ab\tc\n\u4e00x foo\n\nbar"
+        self.prefs = app.prefs.Prefs()
+        p = self.parser
+        p.parse(None, test, self.prefs.grammars[u'none'], 0, sys.maxsize)
+        self.assertEqual(p.offsetRowCol(0), (0, 0))
+        self.assertEqual(p.offsetRowCol(3), (0, 8))
+        self.assertEqual(p.offsetRowCol(6), (1, 2))
+        self.assertEqual(p.offsetRowCol(12), (2, 0))
+        self.assertEqual(p.offsetRowCol(len(test)), (3, 3))
+        self.assertEqual(p.dataOffsetRowCol(len(test)), None)
+        # A col within a tab or wide char is the offset of that char.
+        self.assertEqual(p.rowColOffset(0, 4), 2)
+        self.assertEqual(p.rowColOffset(1, 1), 5)
+        # Past the end of the row (or document).
+        self.assertEqual(p.rowColOffset(0, 99), 4)
+        self.assertEqual(p.rowColOffset(3, 99), len(test))
+        self.assertEqual(p.rowColOffset(99, 0), len(test))
+        for offset in range(len(test) + 1):
+            self.assertEqual(p.rowColOffset(*p.offsetRowCol(offset)), offset)
+
+    def test_find(self):
+        test = u"one foo\ntwo\nfoo\nthree\n"
+        self.prefs = app.prefs.Prefs()
+        p = self.parser
+        p.parse(None, test, self.prefs.grammars[u'none'], 0, sys.maxsize)
+        foo = re.compile(u"foo")
+        self.assertEqual(p.find(foo, 0, 1), (4, 7, False))
+        self.assertEqual(p.find(foo, 5, 1), (12, 15, False))
+        self.assertEqual(p.find(foo, 13, 1), (4, 7, True))
+        # Backward finds a match that ends at or before the offset.
+        self.assertEqual(p.find(foo, 15, -1), (12, 15, False))
+        self.assertEqual(p.find(foo, 14, -1), (4, 7, False))
+        self.assertEqual(p.find(foo, 6, -1), (12, 15, True))
+        self.assertEqual(p.find(re.compile(u"zzz"), 6, 1), None)
+        self.assertEqual(p.find(re.compile(u"zzz"), 6, -1), None)
+        # A match may span rows.
+        self.assertEqual(
+            p.find(re.compile(u"foo\\s+two"), 0, 1), (4, 11, False))
+        self.assertEqual(p.find(re.compile(u"^t", re.MULTILINE), 9, 1),
+                         (16, 17, False))
+
+    def test_find_back_large(self):
+        test = u"foo\n" + u"x" * (app.parser.kFindBackChars * 5) + u"\nfoo"
+        self.prefs = app.prefs.Prefs()
+        p = self.parser
+        p.parse(None, test, self.prefs.grammars[u'none'], 0, sys.maxsize)
+        foo = re.compile(u"foo")
+        self.assertEqual(p.find(foo, len(test) - 1, -1), (0, 3, False))
+        self.assertEqual(p.find(foo, 2, -1), (len(test) - 3, len(test), True))
+
+    def test_find_back_edges(self):
+        test = u"foo foox\nfoo\n"
+        self.prefs = app.prefs.Prefs()
+        p = self.parser
+        p.parse(None, test, self.prefs.grammars[u'none'], 0, sys.maxsize)
+        # Patterns are compiled with MULTILINE, as by Actions.find().
+        flags = re.MULTILINE
+        # The search doesn't end at the offset, so $, \b and lookaheads don't
+        # match there.
+        self.assertEqual(p.find(re.compile(u"foo$", flags), 7, -1),
+                         (9, 12, True))
+        self.assertEqual(p.find(re.compile(u"foo\\b", flags), 7, -1),
+                         (0, 3, False))
+        self.assertEqual(p.find(re.compile(u"foo(?!x)", flags), 7, -1),
+                         (0, 3, False))
+        # ^ is the start of each row.
+        self.assertEqual(p.find(re.compile(u"^foo", flags), 13, -1),
+                         (9, 12, False))
+        self.assertEqual(p.find(re.compile(u"^foo", flags), 9, -1),
+                         (0, 3, False))
 
     if 0:
 
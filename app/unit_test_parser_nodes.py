@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import app.parser_nodes
+import app.prefs
+
+
+class ParserNodesTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.prefs = app.prefs.Prefs()
+        self.nodes = app.parser_nodes.ParserNodes(self.prefs.grammarList)
+
+    def test_append_and_read(self):
+        cpp = self.prefs.grammars['cpp']
+        comment = self.prefs.grammars['cpp_block_comment']
+        nodes = self.nodes
+        nodes.append((cpp, 0, None, 0))
+        nodes.append((comment, 4, 0, 5))
+        self.assertEqual(len(nodes), 2)
+        self.assertEqual(nodes[0], (cpp, 0, None, 0))
+        self.assertIs(nodes[1][0], comment)
+        self.assertEqual(nodes[-1], (comment, 4, 0, 5))
+        self.assertEqual(nodes[1:], [(comment, 4, 0, 5)])
+        self.assertEqual(list(nodes), [(cpp, 0, None, 0), (comment, 4, 0, 5)])
+        self.assertEqual(nodes.begin(1), 4)
+        self.assertIs(nodes.grammar(1), comment)
+
+    def test_other_grammars(self):
+        empty = {}
+        nodes = self.nodes
+        nodes.append((empty, 0, None, 0))
+        nodes.append((self.prefs.grammars['text'], 1, None, 1))
+        self.assertIs(nodes[0][0], empty)
+        self.assertIs(nodes[1][0], self.prefs.grammars['text'])
+        # The prefs grammar list is not modified.
+        self.assertNotIn(empty, self.prefs.grammarList)
+
+    def test_truncate_and_copy(self):
+        text = self.prefs.grammars['text']
+        nodes = self.nodes
+        for i in range(10):
+            nodes.append((text, i, i - 1 if i else None, i * 2))
+        copy = nodes.copy(4)
+        nodes.truncate(6)
+        self.assertEqual(len(nodes), 6)
+        self.assertEqual(nodes[-1], (text, 5, 4, 10))
+        self.assertEqual(len(copy), 4)
+        self.assertEqual(copy[-1], (text, 3, 2, 6))
+
+    def test_extend_shifted(self):
+        text = self.prefs.grammars['text']
+        other = app.parser_nodes.ParserNodes(self.prefs.grammarList)
+        for node in [(text, 0, None, 0), (text, 5, 0, 5), (text, 9, 1, 9)]:
+            other.append(node)
+        nodes = self.nodes
+        nodes.append((text, 0, None, 0))
+        nodes.append((text, 1, None, 1))
+        nodes.append((text, 2, 1, 2))
+        # The prior node 0 (in |other|) is node 1 here.
+        self.assertTrue(nodes.extendShifted(other, 1, 3, 4, {0: 1}))
+        self.assertEqual(nodes[3:], [(text, 8, 1, 9), (text, 12, 3, 13)])
+        # An unknown prior fails without changing the nodes.
+        self.assertFalse(nodes.extendShifted(other, 1, 3, 4, {}))
+        self.assertEqual(len(nodes), 5)
+
+    def test_shifted_reads(self):
+        text = self.prefs.grammars['text']
+        other = app.parser_nodes.ParserNodes(self.prefs.grammarList)
+        for i in range(10):
+            other.append((text, i * 10, i - 1 if i % 3 else None, i * 20))
+        expected = list(other)
+        nodes = other
+        # Repeatedly splice the nodes after an "edit" (moving them by one
+        # node and one character), before and after the prior splice.
+        for i in (5, 2, 7, 1, 4, 4):
+            prior = nodes
+            nodes = prior.copy(i)
+            nodes.append((text, prior.begin(i), None, prior[i][3]))
+            self.assertTrue(nodes.extendShifted(
+                prior, i, 1, 2, dict((k, k) for k in range(i))))
+            expected = expected[:i] + [(text, expected[i][1], None,
+                                        expected[i][3])] + [
+                (node[0], node[1] + 1, node[2] + 1 if node[2] is not None and
+                 node[2] >= i else node[2], node[3] + 2)
+                for node in expected[i:]]
+            self.assertEqual(list(nodes), expected)
+            for k, node in enumerate(expected):
+                self.assertEqual(nodes.begin(k), node[1])
+                self.assertEqual(nodes.indexAtOffset(node[1]), k)
+                self.assertEqual(nodes.indexAtOffset(node[1] - 1), k - 1)
+        self.assertEqual(nodes.begin(-1), expected[-1][1])
+        # Appended nodes are not shifted.
+        nodes.append((text, 200, 3, 300))
+        self.assertEqual(nodes[len(nodes) - 1], (text, 200, 3, 300))
+        copy = nodes.copy(9)
+        self.assertEqual(list(copy), expected[:9])
+        nodes.truncate(12)
+        self.assertEqual(list(nodes), expected[:12])
+        restored = app.parser_nodes.ParserNodes(self.prefs.grammarList)
+        restored.setColumns(nodes.columns())
+        self.assertEqual(list(restored), expected[:12])
+        self.assertEqual(list(nodes), expected[:12])
+
+    def test_rows(self):
+        rows = app.parser_nodes.newRows()
+        rows.extend(range(1, 6))
+        self.assertEqual(rows, [0, 1, 2, 3, 4, 5])
+        other = rows.copy(2)
+        other.append(7)
+        other.extendShifted(rows, 3, 5)
+        self.assertEqual(other, [0, 1, 7, 8, 9, 10])
+        other.append(20)
+        # The rows moved by an earlier splice may move again.
+        copy = other.copy(1)
+        copy.extendShifted(other, 2, -1)
+        self.assertEqual(copy, [0, 6, 7, 8, 9, 19])
+        self.assertEqual(copy[-1], 19)
+        self.assertEqual(other, [0, 1, 7, 8, 9, 10, 20])
+        copy.truncate(4)
+        self.assertEqual(list(copy.values()), [0, 6, 7, 8])
+
+    def test_extend_rows(self):
+        text = self.prefs.grammars['text']
+        nodes = self.nodes
+        nodes.append((text, 0, None, 0))
+        nodes.extendRows(text, [4, 9], [4, 12])
+        self.assertEqual(nodes[1:], [(text, 4, None, 4), (text, 9, None, 12)])
+        self.assertEqual(nodes[-1], (text, 9, None, 12))
@@ -16,10 +16,13 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import io
+import os
 from timeit import timeit
 import unittest
 
 import app.parser
+import app.prefs
 
 
 class PerformanceTestCases(unittest.TestCase):
@@ -78,6 +81,36 @@ class PerformanceTestCases(unittest.TestCase):
         self.assertGreater(a, b * 0.6)
         self.assertGreater(b, a * 0.6)
 
+    def test_search_slice_vs_pos(self):
+        # This tests a performance assumption. If this test fails, the
+        # program should still work fine, but it may not run as fast as it
+        # could by using different assumptions.
+        #
+        # The parser used to search a copy of the remainder of the document
+        # (i.e. data[cursor:]) for each grammar match. Searching the document
+        # from |cursor| avoids the copy, which is significant for a large file.
+        path = os.path.join(os.path.dirname(__file__), 'actions.py')
+        with io.open(path, encoding=u"utf-8") as f:
+            data = f.read() * 64
+        matchRe = app.prefs.Prefs().grammars['py']['matchRe']
+
+        def searchSlices():
+            cursor = 0
+            for _ in range(500):
+                found = matchRe.search(data[cursor:])
+                cursor += max(1, found.end())
+
+        def searchFromPos():
+            cursor = 0
+            for _ in range(500):
+                found = matchRe.search(data, cursor)
+                cursor = max(cursor + 1, found.end())
+
+        a = timeit(searchSlices, number=1)
+        b = timeit(searchFromPos, number=1)
+        #print("\nslices %s, pos %s, %s" % (a, b, a / b))
+        self.assertGreater(a, b * 3)
+
     def test_char_vs_ord(self):
         setup = '''a="apple"\n'''
         a = timeit('''a[0] > "z";''' * 100,  setup=setup, number=10000)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+import re
+import unittest
+
+import app.parser
+import app.piece_table
+import app.prefs
+
+
+class PieceTableTestCases(unittest.TestCase):
+
+    def test_empty(self):
+        store = app.piece_table.PieceTable()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.text(), u"")
+        self.assertEqual(store[0:10], u"")
+        store.insert(0, u"abc")
+        self.assertEqual(store.text(), u"abc")
+        store.delete(0, 3)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.text(), u"")
+
+    def test_insert_and_delete(self):
+        store = app.piece_table.PieceTable(u"one\ntwo\nthree")
+        store.insert(4, u"1.5\n")
+        self.assertEqual(store.pieceCount(), 3)
+        self.assertEqual(len(store), 17)
+        self.assertEqual(store[4], u"1")
+        self.assertEqual(store[-1], u"e")
+        self.assertEqual(store[2:6], u"e\n1.")
+        self.assertEqual(store[8:], u"two\nthree")
+        self.assertEqual(store.slice(2, 6), u"e\n1.")
+        store.insert(len(store), u"\n")
+        store.delete(0, 4)
+        self.assertIsNone(store.joinedText())
+        self.assertEqual(store.text(), u"1.5\ntwo\nthree\n")
+        # Reading the text joins the pieces.
+        self.assertEqual(store.pieceCount(), 1)
+        self.assertEqual(store.joinedText(), u"1.5\ntwo\nthree\n")
+        store.delete(3, 7)
+        self.assertEqual(store.text(), u"1.5\nthree\n")
+        with self.assertRaises(IndexError):
+            store[len(store)]
+
+    def test_wide_characters(self):
+        store = app.piece_table.PieceTable(u"xちb")
+        store.insert(2, u"ちa")
+        self.assertEqual(store[1], u"ち")
+        self.assertEqual(store[3], u"a")
+        self.assertEqual(store.text(), u"xちちab")
+
+    def test_random_edits(self):
+        rand = random.Random(7)
+        expected = u"The quick brown fox\njumps over\nthe lazy dog.\n"
+        store = app.piece_table.PieceTable(expected)
+        for _ in range(2000):
+            if rand.random() < 0.5 and len(expected):
+                begin = rand.randrange(len(expected))
+                end = min(len(expected), begin + rand.randrange(4))
+                store.delete(begin, end)
+                expected = expected[:begin] + expected[end:]
+            else:
+                offset = rand.randrange(len(expected) + 1)
+                text = rand.choice([u"a", u"\n", u"ch", u"ち", u"\t"])
+                store.insert(offset, text)
+                expected = expected[:offset] + text + expected[offset:]
+            self.assertEqual(len(store), len(expected))
+            if rand.random() < 0.1:
+                begin = rand.randrange(len(expected) + 1)
+                self.assertEqual(store[begin:begin + 9],
+                                 expected[begin:begin + 9])
+                for sub in (u"\n", u"ch", u"ox\nj"):
+                    self.assertEqual(store.find(sub, begin),
+                                     expected.find(sub, begin))
+                    self.assertEqual(store.rfind(sub, begin),
+                                     expected.rfind(sub, begin))
+                    self.assertEqual(store.rfind(sub, 0, begin),
+                                     expected.rfind(sub, 0, begin))
+            self.assertLessEqual(store.pieceCount(),
+                                 app.piece_table.kMaxPieces + 1)
+        self.assertEqual(store.text(), expected)
+
+    def test_parser_edits_do_not_join(self):
+        parser = app.parser.Parser(app.prefs.Prefs())
+        parser.data = u"one\ntwo\nthree\nfour"
+        parser.parse(None, parser.data, parser.appPrefs.grammars['text'], 0,
+                     99)
+        # A block insert is several edits; none of them needs the flat text.
+        parser.insertBlock(0, 1, [u"-", u"-", u"-"])
+        self.assertGreater(parser.store().pieceCount(), 1)
+        # Nor do the parse or a find.
+        parser.parse(None, None, parser.appPrefs.grammars['text'], 0, 99)
+        self.assertEqual(parser.rowText(2), u"t-hree")
+        self.assertEqual(parser.find(re.compile(u"-w"), 0, 1), (6, 8, False))
+        self.assertEqual(parser.find(re.compile(u"^f", re.MULTILINE), 20, -1),
+                         (17, 18, False))
+        self.assertGreater(parser.store().pieceCount(), 1)
+        self.assertEqual(parser.data, u"o-ne\nt-wo\nt-hree\nfour")
+        self.assertEqual(parser.store().pieceCount(), 1)
+
+    def test_text_window(self):
+        lines = [u"%d ab\n" % i for i in range(20000)]
+        expected = u"".join(lines)
+        store = app.piece_table.PieceTable(expected)
+        store.insert(len(store) // 2, u"x")
+        store.insert(0, u"y")
+        expected = u"y" + expected[:len(expected) // 2] + u"x" + expected[
+            len(expected) // 2:]
+        window = app.piece_table.TextWindow(store)
+        regex = re.compile(u"^1\\d* ab$", re.MULTILINE)
+        offset = 0
+        found = []
+        while True:
+            match = window.search(regex, offset)
+            if match is None:
+                break
+            found.append(window.base + match.start())
+            offset = window.base + match.end()
+        self.assertEqual(found,
+                         [i.start() for i in regex.finditer(expected)])
+        # The document is not joined to search it.
+        self.assertGreater(store.pieceCount(), 1)
+        # A match that runs past the slice first fetched.
+        regex = re.compile(u"y.*x", re.DOTALL)
+        window = app.piece_table.TextWindow(store)
+        match = window.search(regex, 0)
+        self.assertEqual(window.base + match.end(), expected.index(u"x") + 1)
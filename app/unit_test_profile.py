@@ -0,0 +1,89 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import app.profile
+
+
+class ProfileTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.savedProfiles = app.profile.profiles
+        self.savedTasks = app.profile.tasks
+        app.profile.profiles = {}
+        app.profile.tasks = {}
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        app.profile.profiles = self.savedProfiles
+        app.profile.tasks = self.savedTasks
+        shutil.rmtree(self.directory)
+
+    def test_results(self):
+        self.assertEqual(app.profile.results(), u"")
+        app.profile.highest(u"b", 2)
+        app.profile.highest(u"b", 1)
+        app.profile.lowest(u"a", 3)
+        app.profile.current(u"a", 1)
+        app.profile.tasks[u"parse"] = [3, 0.5, 0.25]
+        self.assertEqual(
+            app.profile.results(), u"a: 1\nb: 2\n"
+            u"task parse: calls 3 total 0.500s longest 0.250s")
+
+    def test_python_profile(self):
+        profile = app.profile.beginPythonProfile()
+        sorted(range(100))
+        profile.disable()
+        self.assertIn(u"cumulative", app.profile.pythonProfileText(profile))
+
+    def test_sampling(self):
+        sampler = app.profile.SamplingProfiler(
+            threadNames=(threading.current_thread().name,))
+        sampler.sample()
+        sampler.sample()
+        self.assertEqual(sampler.sampleCount, 2)
+        self.assertEqual(sum(sampler.stacks.values()), 2)
+        line = sampler.collapsed().splitlines()[0]
+        stack, count = line.rsplit(u" ", 1)
+        frames = stack.split(u";")
+        self.assertEqual(frames[0], threading.current_thread().name)
+        self.assertTrue(
+            frames[-1].startswith(u"sample (profile.py:"), frames[-1])
+        self.assertIn(u"test_sampling (unit_test_profile.py:", stack)
+        path = os.path.join(self.directory, u"out.collapsed")
+        sampler.write(path)
+        with io.open(path, encoding=u"utf-8") as f:
+            self.assertEqual(f.read(), sampler.collapsed())
+
+    def test_sampling_thread(self):
+        sampler = app.profile.SamplingProfiler(
+            threadNames=(threading.current_thread().name,),
+            sampleSeconds=0.001)
+        sampler.start()
+        event = threading.Event()
+        while sampler.sampleCount < 3:
+            event.wait(0.001)
+        sampler.stop()
+        self.assertFalse(sampler.is_alive())
+        self.assertTrue(sampler.stacks)
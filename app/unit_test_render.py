@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import app.render
+
+
+def encoded(drawList):
+    return [(row, col, text.encode(u"utf-8"), style)
+            for row, col, text, style in drawList]
+
+
+class DamageTrackerTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = app.render.DamageTracker()
+
+    def diff(self, drawList):
+        return self.tracker.diff(encoded(drawList))
+
+    def test_unchanged(self):
+        frame = [(0, 0, u"status line", 1), (1, 0, u"abc def", 2)]
+        self.assertEqual(self.diff(frame), encoded(frame))
+        self.assertEqual(self.diff(frame), [])
+        # A row that isn't drawn keeps its contents.
+        self.assertEqual(self.diff(frame[1:]), [])
+        self.tracker.reset()
+        self.assertEqual(self.diff(frame), encoded(frame))
+
+    def test_changed_runs(self):
+        self.diff([(0, 0, u"abcdefghijklmnopqrst", 1)])
+        self.assertEqual(
+            self.diff([(0, 0, u"abXdefghijklmnopqrsY", 1)]),
+            encoded([(0, 2, u"X", 1), (0, 19, u"Y", 1)]))
+        # Nearby changes of the same style are joined.
+        self.assertEqual(
+            self.diff([(0, 0, u"abcdeXghijklmnopqrsY", 1)]),
+            encoded([(0, 2, u"cdeX", 1)]))
+        # A style change is a change.
+        self.assertEqual(
+            self.diff([(0, 0, u"abcde", 1), (0, 5, u"Xghij", 3),
+                       (0, 10, u"klmnopqrsY", 1)]),
+            encoded([(0, 5, u"Xghij", 3)]))
+        # Overdraw within a frame only emits the final result.
+        self.assertEqual(
+            self.diff([(0, 0, u"abcdeXghijklmnopqrsY", 1),
+                       (0, 5, u"Z", 1)]),
+            encoded([(0, 5, u"Zghij", 1)]))
+
+    def test_wide_characters(self):
+        self.diff([(0, 0, u"aちbc", 1)])
+        self.assertEqual(
+            self.diff([(0, 0, u"aちbX", 1)]), encoded([(0, 4, u"X", 1)]))
+        # Overwriting half of a wide character damages the other half.
+        self.assertEqual(
+            self.diff([(0, 0, u"aちbX", 1), (0, 2, u"Y", 1)]),
+            encoded([(0, 2, u"Y", 1)]))
+        self.assertEqual(
+            self.diff([(0, 0, u"aちbX", 1)]), encoded([(0, 1, u"ち", 1)]))
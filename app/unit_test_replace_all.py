@@ -0,0 +1,135 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import re
+import sys
+import unittest
+
+import app.mutator
+import app.parser
+import app.prefs
+import app.replace_all
+from app.curses_util import *
+import app.fake_curses_testing
+
+
+class PausingThread:
+    """Ask the search to yield every |period| checks."""
+
+    def __init__(self, period):
+        self.period = period
+        self.checks = 0
+
+    def shouldYield(self):
+        self.checks += 1
+        return self.checks % self.period == 0
+
+
+class ReplaceAllTestCases(unittest.TestCase):
+
+    def test_step(self):
+        data = u"one two\none\n\nthree one"
+        job = app.replace_all.ReplaceAll(re.compile(u"(o)ne"), u"\\1NE", data)
+        self.assertEqual(job.progress(), 0.0)
+        self.assertFalse(job.step(PausingThread(2)))
+        self.assertEqual(list(job.offsets), [0])
+        self.assertGreater(job.progress(), 0.0)
+        while not job.step(PausingThread(2)):
+            pass
+        self.assertEqual(job.progress(), 1.0)
+        self.assertEqual(list(job.offsets), [0, 8, 19])
+        self.assertEqual(job.olds, [u"one"] * 3)
+        self.assertEqual(job.news, [u"oNE"] * 3)
+        # Equal strings are shared.
+        self.assertIs(job.news[0], job.news[2])
+        kind, (offsets, olds, news) = job.change()
+        self.assertEqual(kind, u"sr")
+        self.assertEqual(olds, (u"one",) * 3)
+
+    def test_unchanged_and_empty(self):
+        data = u"aXbX"
+        job = app.replace_all.ReplaceAll(re.compile(u"X|b"), u"X", data)
+        job.step()
+        self.assertEqual(list(job.offsets), [2])
+        job = app.replace_all.ReplaceAll(re.compile(u"x*"), u"-", data)
+        job.step()
+        self.assertEqual(list(job.offsets), [0, 1, 2, 3, 4])
+
+    def test_range(self):
+        data = u"one one one one"
+        job = app.replace_all.ReplaceAll(re.compile(u"one$"), u"1", data, 4, 11)
+        self.assertEqual(job.progress(), 0.0)
+        self.assertTrue(job.step())
+        self.assertEqual(job.progress(), 1.0)
+        # The end of the range is treated as the end of the data.
+        self.assertEqual(list(job.offsets), [8])
+        job = app.replace_all.ReplaceAll(re.compile(u"one"), u"1", data, 5, 10)
+        job.step()
+        self.assertEqual(list(job.offsets), [])
+
+    def test_substitute(self):
+        prefs = app.prefs.Prefs()
+        parser = app.parser.Parser(prefs)
+        data = u"one two\none\n\nthree one"
+        parser.parse(None, data, prefs.grammars[u'none'], 0, sys.maxsize)
+        regex = re.compile(u"one")
+        job = app.replace_all.ReplaceAll(regex, u"1", data)
+        job.step()
+        _, (offsets, olds, news) = job.change()
+        parser.substitute(offsets, olds, news)
+        self.assertEqual(parser.data, regex.sub(u"1", data))
+        self.assertEqual(parser.rowCount(), 4)
+        self.assertEqual(parser.rowText(3), u"three 1")
+        parser.substitute(
+            app.mutator.substitutedOffsets(offsets, olds, news), news, olds)
+        self.assertEqual(parser.data, data)
+        self.assertEqual(parser.rowText(1), u"one")
+
+
+class ReplaceAllPromptTestCases(app.fake_curses_testing.FakeCursesTestCase):
+
+    def setUp(self):
+        self.longMessage = True
+        app.fake_curses_testing.FakeCursesTestCase.setUp(self)
+
+    def test_substitute_document(self):
+        self.runWithFakeInputs([
+            self.writeText(u"one two\nthree one\n"),
+            self.displayCheck(2, 7, [u"one two  ", u"three one  "]), CTRL_E,
+            self.writeText(u's/one/four/'),
+            self.displayCheck(-1, 0, [u"e: s/one/four/  "]), CTRL_J,
+            self.displayCheck(2, 7, [u"four two  ", u"three four  "]),
+            self.displayCheck(-2, 0, [u"Replaced 2 matches "]), CTRL_Z,
+            self.displayCheck(2, 7, [u"one two  ", u"three one  "]), CTRL_Y,
+            self.displayCheck(2, 7, [u"four two  ", u"three four  "]),
+            CTRL_Q, u"n"
+        ])
+
+    def test_substitute_selection(self):
+        self.runWithFakeInputs([
+            self.writeText(u"one two\nthree one\none\n"),
+            self.displayCheck(2, 7, [u"one two  ", u"three one  ", u"one  "]),
+            KEY_SHIFT_UP, KEY_SHIFT_UP, CTRL_E,
+            self.writeText(u'sub:(o)ne:\\1NE:'), CTRL_J,
+            # Only the selected text (from the start of the second row) is
+            # changed.
+            self.displayCheck(2, 7, [u"one two  ", u"three oNE  ", u"oNE  "]),
+            self.displayCheck(-2, 0, [u"Replaced 2 matches "]), CTRL_Z,
+            self.displayCheck(2, 7, [u"one two  ", u"three one  ", u"one  "]),
+            CTRL_Q, u"n"
+        ])
@@ -16,10 +16,13 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
 import unittest
 
 from app.curses_util import *
 import app.fake_curses_testing
+import app.spelling
+import app.text_buffer
 
 
 class DrawTestCases(app.fake_curses_testing.FakeCursesTestCase):
@@ -70,6 +73,73 @@ ends with tab>\t
             self.displayCheck(2, 7, [u"text "]), CTRL_Q, u"n"
         ])
 
+    def test_merge_overlay_runs(self):
+        merge = app.text_buffer.mergeOverlayRuns
+        self.assertEqual(merge([], 0, 10), [])
+        self.assertEqual(
+            merge([(0, 4, 1), (2, 3, 2), (3, 8, 1)], 0, 10),
+            [(0, 2, 1), (2, 3, 2), (3, 8, 1)])
+        # Later runs cover earlier ones; runs are clipped to the columns.
+        self.assertEqual(
+            merge([(2, 3, 2), (0, 20, 3), (14, 16, 4)], 5, 15),
+            [(5, 14, 3), (14, 15, 4)])
+
+    def test_draw_overlays(self):
+        #self.setMovieMode(True)
+        defaultColor = self.prg.color.get(u'default', 0)
+        bracketColor = self.prg.color.get(u'bracket', 0)
+        selectedColor = self.prg.color.get(u'selected', 0)
+        self.runWithFakeInputs([
+            self.writeText(u"a (b) c"),
+            self.displayCheckStyle(2, 7, 1, 2, defaultColor),
+            self.displayCheckStyle(2, 9, 1, 1, bracketColor),
+            KEY_HOME, KEY_SHIFT_RIGHT, KEY_SHIFT_RIGHT, KEY_SHIFT_RIGHT,
+            # The selection is drawn over the bracket.
+            self.displayCheckStyle(2, 7, 1, 3, selectedColor),
+            self.displayCheckStyle(2, 10, 1, 1, defaultColor),
+            self.displayCheckStyle(2, 11, 1, 1, bracketColor), CTRL_Q, u"n"
+        ])
+
+    def test_draw_row_cache(self):
+        rendered = []
+
+        def countRenders():
+            textBuffer = self.prg.programWindow.focusedWindow.textBuffer
+            renderRow = textBuffer._renderRow
+
+            def countedRenderRow(row, *args):
+                rendered.append(row)
+                return renderRow(row, *args)
+
+            textBuffer._renderRow = countedRenderRow
+
+        def clearRenders():
+            rendered[:] = []
+
+        def reloadWords():
+            dictionary = self.prg.dictionary
+            dictionary.loadWords(os.path.dirname(app.spelling.__file__))
+
+        self.runWithFakeInputs([
+            self.writeText(u"one\ntwo three"),
+            self.displayCheck(3, 7, [u"two three "]),
+            self.call(countRenders), KEY_LEFT, KEY_UP,
+            self.displayCheck(2, 7, [u"one "]),
+            # Moving the cursor draws the rows from the cache.
+            self.call(self.assertEqual, rendered, []),
+            self.writeText(u"X"),
+            self.displayCheck(2, 7, [u"oneX "]),
+            self.call(self.assertIn, 0, rendered),
+            self.call(clearRenders), KEY_LEFT,
+            self.call(self.assertEqual, rendered, []),
+            # A change to the colors or the dictionary draws the rows again.
+            self.call(self.prg.color.setColors, self.prg.color.colors),
+            KEY_LEFT,
+            self.call(self.assertIn, 0, rendered),
+            self.call(clearRenders), self.call(reloadWords), KEY_LEFT,
+            self.call(self.assertIn, 0, rendered), CTRL_Q, u"n"
+        ])
+
     def test_draw_long_line(self):
         #self.setMovieMode(True)
         lineLimitIndicator = self.prg.prefs.editor['lineLimitIndicator']
@@ -457,6 +457,10 @@ class Window(ActiveWindow):
             # If a user event came in while parsing, the parsing will be paused
             # (to be resumed after handling the event).
             finished = tb.parser.resumeAtRow >= tb.parser.rowCount()
+        if finished and tb is not None:
+            index = tb.findMatchIndex()
+            if index is not None:
+                finished = index.build(tb.parser.store(), self.program.bg)
         for child in self.zOrder:
             finished = finished and child.longTimeSlice()
         return finished
@@ -466,6 +470,14 @@ class Window(ActiveWindow):
         tb = self.textBuffer
         if tb is not None:
             tb.parseScreenMaybe()
+            index = tb.findMatchIndex()
+            if index is not None:
+                store = tb.parser.store()
+                if not self.program.prefs.editor['useBgThread']:
+                    # There are no long time slices, index all the matches.
+                    index.build(store)
+                elif not index.isComplete(len(store)):
+                    return False
             return tb.parser.resumeAtRow >= tb.parser.rowCount()
         return True
 
@@ -531,7 +543,9 @@ class LabeledLine(Window):
         self.setTextBuffer(tb)
         self.label = label
         self.leftColumn = ViewWindow(self.program, self)
-        # TODO(dschuyler) Add self.rightColumn.
+        # Text shown at the right end of the line, see setRightLabel().
+        self.rightLabel = u''
+        self.rightColumn = ViewWindow(self.program, self)
 
     def focus(self):
         self.bringToFront()
@@ -548,18 +562,32 @@ class LabeledLine(Window):
             return
         self.leftColumn.addStr(0, 0, self.label,
                                self.program.color.get(u'keyword'))
+        if self.rightColumn.cols > 0:
+            self.rightColumn.addStr(0, 0, self.rightLabel,
+                                    self.program.color.get(u'keyword'))
         Window.render(self)
 
     def reshape(self, top, left, rows, cols):
         labelWidth = len(self.label)
+        rightWidth = min(len(self.rightLabel), max(0, cols - labelWidth))
         Window.reshape(self, top, left + labelWidth, rows,
-                       max(0, cols - labelWidth))
+                       max(0, cols - labelWidth - rightWidth))
         self.leftColumn.reshape(top, left, rows, labelWidth)
+        self.rightColumn.reshape(top, left + cols - rightWidth, rows,
+                                 rightWidth)
 
     def setLabel(self, label):
         self.label = label
         self.reshape(self.top, self.left, self.rows, self.cols)
 
+    def setRightLabel(self, label):
+        """Show |label| at the right end of the line."""
+        if label == self.rightLabel:
+            return
+        cols = self.leftColumn.cols + self.cols + self.rightColumn.cols
+        self.rightLabel = label
+        self.reshape(self.top, self.leftColumn.left, self.rows, cols)
+
 
 class Menu(ViewWindow):
     """Work in progress on a context menu."""
@@ -832,6 +860,12 @@ class InteractiveFind(Window):
             self.pathsLine.setController(app.cu_editor.InteractiveFindInput)
             self.pathsLine.setParent(self)
 
+    def render(self):
+        # Show the count of matches, e.g. "3 of 12".
+        countText = self.host.textBuffer.findMatchCountText()
+        self.findLine.setRightLabel(countText and u" %s " % (countText,))
+        Window.render(self)
+
     def reattach(self):
         Window.reattach(self)
         # TODO(dschuyler): consider removing expanded control.
@@ -1296,6 +1330,10 @@ class InputWindow(Window):
         self.textBuffer.parseDocument()
         openToLine = self.program.prefs.startup.get('openToLine')
         if openToLine is not None:
+            if self.textBuffer.isLargeFile:
+                # The rows of a large file are found gradually, the rows through
+                # |openToLine| are needed now.
+                self.textBuffer.parser.indexRows(None, openToLine)
             self.textBuffer.selectText(openToLine - 1, 0, 0,
                                        app.selectable.kSelectionNone)
 
@@ -42,22 +42,37 @@ app.config.strict_debug = True
 import app.unit_test_actions
 import app.unit_test_application
 import app.unit_test_automatic_column_adjustment
+import app.unit_test_background
+import app.unit_test_bench
 import app.unit_test_bookmarks
 import app.unit_test_brace_matching
+import app.unit_test_bracket_index
 import app.unit_test_buffer_file
 import app.unit_test_copy_paste
 import app.unit_test_curses_util
 import app.unit_test_execute_prompt
 import app.unit_test_file_manager
 import app.unit_test_find_window
+import app.unit_test_grep
+import app.unit_test_hex_view
+import app.unit_test_input_log
 import app.unit_test_intention
+import app.unit_test_large_file
+import app.unit_test_latency
 import app.unit_test_line_buffer
+import app.unit_test_match_index
 import app.unit_test_misspellings
+import app.unit_test_parse_cache
 import app.unit_test_parser
+import app.unit_test_parser_nodes
 import app.unit_test_performance
+import app.unit_test_piece_table
 import app.unit_test_prediction_window
 import app.unit_test_prefs
+import app.unit_test_profile
 import app.unit_test_regex
+import app.unit_test_render
+import app.unit_test_replace_all
 import app.unit_test_selectable
 import app.unit_test_startup
 import app.unit_test_string
@@ -81,10 +96,20 @@ TESTS = {
     app.unit_test_application.ApplicationTestCases,
     'automatic_column_adjustment':
     app.unit_test_automatic_column_adjustment.AutomaticColumnAdjustmentCases,
+    'background':
+    app.unit_test_background.BackgroundThreadTestCases,
+    'background_loop':
+    app.unit_test_background.BackgroundLoopTestCases,
+    'background_scheduler':
+    app.unit_test_background.SchedulerTestCases,
+    'bench':
+    app.unit_test_bench.BenchTestCases,
     'bookmarks':
     app.unit_test_bookmarks.BookmarkTestCases,
     'brace_matching':
     app.unit_test_brace_matching.BraceMatchingTestCases,
+    'bracket_index':
+    app.unit_test_bracket_index.BracketIndexTestCases,
     'buffer_file':
     app.unit_test_buffer_file.pathRowColumnTestCases,
     'copy_paste':
@@ -95,24 +120,52 @@ TESTS = {
     app.unit_test_file_manager.FileManagerTestCases,
     'find':
     app.unit_test_find_window.FindWindowTestCases,
+    'grep':
+    app.unit_test_grep.GrepTestCases,
+    'grep_prompt':
+    app.unit_test_grep.GrepPromptTestCases,
     'execute':
     app.unit_test_execute_prompt.ExecutePromptTestCases,
+    'hex_view':
+    app.unit_test_hex_view.HexViewTestCases,
+    'input_log':
+    app.unit_test_input_log.InputLogTestCases,
     'intention':
     app.unit_test_intention.IntentionTestCases,
+    'large_file':
+    app.unit_test_large_file.LargeFileTestCases,
+    'latency':
+    app.unit_test_latency.LatencyTestCases,
     'line_buffer':
     app.unit_test_line_buffer.LineBufferTestCases,
+    'match_index':
+    app.unit_test_match_index.MatchIndexTestCases,
     'misspellings':
     app.unit_test_misspellings.MisspellingsTestCases,
+    'parse_cache':
+    app.unit_test_parse_cache.ParseCacheTestCases,
     'parser':
     app.unit_test_parser.ParserTestCases,
+    'parser_nodes':
+    app.unit_test_parser_nodes.ParserNodesTestCases,
     'performance':
     app.unit_test_performance.PerformanceTestCases,
+    'piece_table':
+    app.unit_test_piece_table.PieceTableTestCases,
     'prediction':
     app.unit_test_prediction_window.PredictionWindowTestCases,
     'prefs':
     app.unit_test_prefs.PrefsTestCases,
+    'profile':
+    app.unit_test_profile.ProfileTestCases,
     'regex':
     app.unit_test_regex.RegexTestCases,
+    'render':
+    app.unit_test_render.DamageTrackerTestCases,
+    'replace_all':
+    app.unit_test_replace_all.ReplaceAllTestCases,
+    'replace_all_prompt':
+    app.unit_test_replace_all.ReplaceAllPromptTestCases,
     'selectable':
     app.unit_test_selectable.SelectableTestCases,
     'startup':